@@ -15,135 +15,279 @@ from maxWBiMatch import maxProfitMatching, \
         minCostMatching, evalMatch
         
 # data processor
+import preprocess
 from preprocess import process_data
 
+# solver registry, dispatches to the fastest available backend
+from backends import autoMatching
+from result import MatchResult
+from matching import Matching, asMatching
+
+# vectorized weight engine (features are extracted once per name)
+from weights import Vowels, countChar, proteinFeatures, drugFeatures, \
+        weightMatrix
+
+import functools
+
+import numpy as np
+
 ### global variables
 # [note] 1. If global variables are not preferable, they  
 #        can be easily translated into static class 
 #        variables by turning affinity module into a class
 #        definition. But logically speaking, static class 
 #        variables are still "global" within the class definition.  
-Vowels = set(['a', 'e', 'i', 'o', 'u'])
 DrugSet, ProteinSet = ([], []) # [1] 
-         
-def countChar(name):
-    """
-    Given a string (e.g. drug name), count the number of vowels,  
-    consonants and other characters (numbers, hyphens, etc). 
-    
-    Return a summary in 3-tuple: (nVowel, nConsonant, nOther)
-    
-    [note] 1. not necessary if drug name is guaranteed to have 
-              no special chars 
-    """
-    import re
-    # filter non-alphabet characters [1] 
-    _name = re.sub('[^a-zA-Z]', '', name)
-    nAlphabets, nTotal = (len(_name), len(name))
-    
-    nVowels = 0
-    for ch in _name: 
-        if ch.lower() in Vowels: 
-            nVowels += 1 
-            
-    return (nVowels, nAlphabets-nVowels, nTotal-nAlphabets)    
-        
      
 # compute weight matrix according to the binding rules
-def evalWeights(_pdata=True):
+def evalWeights(_pdata=True, dtype=np.float64, pad=True, cache=None, budget=None, 
+                rules=None):
     """
     Evaluate weight matrix as an input for a given 
     max weight bipartite matching algorithm such as 
     Hungarian algorithm. 
     
+    Returns a C-contiguous N x N ndarray of the given 
+    *dtype; see weights.weightBlock for the binding rules. 
+    With an integer *dtype (exact mode, see weights.weightMatrix) 
+    the weights are scaled by weights.WeightScale (by the scale 
+    of *rules if given), i.e. W / WeightScale are the affinities. 
+    
+    *pad: if False, return the rectangular (# proteins) x (# drugs) 
+          matrix, which maxProfitMatching solves without padding [1]
+    *cache: a cache.Cache; if given, parsed inputs, features and 
+            the (memory-mapped, read-only) weight matrix are reused 
+            across runs on unchanged input files 
+    *budget: if given, return a tiled.TiledWeights instead, i.e. 
+             an N x N matrix whose rows are evaluated on demand 
+             with at most *budget bytes of them kept in memory; 
+             maxProfitMatching accepts it as is 
+    *rules: a rules.RuleSet to evaluate instead of the default 
+            binding rules (rules.DefaultRules) 
+    
     [note] 1. unnecessary if # of drugs == # of proteins
-           2. even length rule: 
-                BA = # of vowels * 2
-           3. odd length rule: 
-                BA = # of consonants * 2.5
-           4. increase BA by 25% if any common 
-              factors found
-           5. or use gcd from fractions module
     """
     global ProteinSet, DrugSet
     
-    def gcd(a, b): # [5] 
-        # Calculate the Greatest Common Divisor of a and b.
-        while b:
-            a, b = b, a%b
-        return a
+    if cache is not None: 
+        from cache import cachedWeights
+        ProteinSet, DrugSet, W = cachedWeights(preprocess.PROTEIN_FILE, 
+                    preprocess.DRUG_FILE, cache, dtype=dtype, pad=pad, rules=rules)
+        return W
     
     # process input data and cache them for later use
     ProteinSet, DrugSet = process_data()
     
     N = max(len(ProteinSet), len(DrugSet))  # [1] 
-    w = [[0 for _ in range(N)] for _ in range(N)] 
-
-    for i, protein in enumerate(ProteinSet): 
-        for j, drug in enumerate(DrugSet):
-            np, nd = (len(protein), len(drug))
-            if np % 2 == 0:   # even 
-                w[i][j] = countChar(drug)[0] * 2  # [2]
-            else:  # odd 
-                w[i][j] = countChar(drug)[1] * 2.5  # [3]
-            
-            if gcd(np, nd) > 1: # [4]
-                w[i][j] *= 1.25
-    return w
+    if rules is None: 
+        pfeat, dfeat = (proteinFeatures(ProteinSet), drugFeatures(DrugSet))
+    else: 
+        pfeat, dfeat = (rules.features(ProteinSet, 'p'), rules.features(DrugSet, 'd'))
+    if budget is not None: 
+        from tiled import TiledWeights
+        return TiledWeights(pfeat, dfeat, N=N, dtype=dtype, budget=budget, rules=rules)
+    return weightMatrix(pfeat, dfeat, N=N, dtype=dtype, pad=pad, rules=rules)
 
 # [test]
 def evalRandomAssignment(W=None, _debug=0):
     """
     Evaluate sum of affinity values with 
     random assignment strategy. 
+    
+    (see evalSignificance() for many random assignments at once)
     """
-    import random
+    from montecarlo import randomPermutations, scoreAssignments
     
     if W is None: W = evalWeights()
+    W = np.asarray(W)
     N = len(W)
     
-    random.seed()
-    candidates = range(0, N)
-    Mu, Mv = ({}, {})
-    for i in range(N):
-        m = random.choice(candidates)
-        Mu[i] = m
-        Mv[m] = i
-        candidates.remove(m)
-    assert len(Mu) == len(Mv), "[Match] Not a perfect match."
+    perm = randomPermutations(np.random.RandomState(), 1, N)
+    Mu = Matching(perm[0], nCols=N)
     if _debug: 
         for i, j in Mu.items():
-            print "protein %d: %s -> drug %d: %s | ba=%f" % \
-               (i, ProteinSet[i], j, DrugSet[j], W[i][j])
+            print("protein %d: %s -> drug %d: %s | ba=%f" % \
+               (i, ProteinSet[i], j, DrugSet[j], W[i][j]))
     
-    return (_format(Mu), evalMatch(Mu, W))
+    return (Mu, scoreAssignments(W, perm)[0])
 
-def evalOptAssignment(W=None, match_func=maxProfitMatching, _flip=False):
+def evalSignificance(W=None, trials=100000, workers=1, seed=0): 
+    """
+    Compare the optimal assignment with *trials random ones. 
+    
+    Returns the montecarlo.RunningStats of the random values, 
+    whose pValue() is the empirical significance of the optimum. 
+    """
+    from montecarlo import monteCarlo
+    
+    if W is None: W = evalWeights()
+    _, val = evalOptAssignment(W)
+    return monteCarlo(W, trials, optimum=val, seed=seed, workers=workers)
+
+def evalOptAssignment(W=None, match_func=autoMatching, _flip=False, deadline=None, gap=None, 
+                      verify=False, presolve=True, backend=None, sparse=None):
     """
     Evaluate optimal bipartite matching given the weight matrix W. 
     
     *match_func: a bipartite matching function that returns 
                  matching result in 3-tuple: 
                  (Mu, Mv, value)
-        where Mu is a dictionary mapping from any two 
+        where Mu is a Matching (or a dictionary) from any two 
                  indep sets of objects e.g. proteins to drugs 
               Mv is a inverse mapping e.g. drugs to proteins 
               value is the sum of all matched weights 
                    e.g. sum of affinity values
+                 By default, the fastest available backend is 
+                 chosen (see module backends). 
+    *backend: name of the backend autoMatching runs (see module 
+                 backends), instead of the fastest one 
+    *deadline, *gap: if either is given, solve with 
+                 anytime.anytimeMatching instead: the best 
+                 assignment found within *deadline seconds, or 
+                 once provably within *gap (relative) of the 
+                 optimum; .meta['bound'] and .meta['gap'] then 
+                 certify how far from the optimum it may be 
+    *sparse: if given, solve with sparse.topKMatching instead: 
+                 optimal among the *sparse best columns of every 
+                 row (rows of every column if there are more 
+                 rows), for far fewer rows than columns 
+    *verify: if True, check the result against dual labels in 
+                 O(n^2) (see module verify) and record the 
+                 verify.Certificate in .meta['certificate'] 
+    *presolve: if True, shrink the problem first (see module 
+                 presolve) and pass only what is left of it to 
+                 *match_func; without a *backend, duplicate rows 
+                 and columns (as in affinity weights) are solved on 
+                 their classes instead. Applied to autoMatching, 
+                 maxProfitMatching and minCostMatching, whose 
+                 objectives are known, but not to other functions, 
+                 to tiled weights nor with *deadline, *gap or 
+                 *sparse; 
+                 .meta['presolve'] records what it did 
+    
+    Returns a MatchResult (assignment, value), the assignment as a
+    Matching (str() of which lists the pairs), whose .meta records
+    the backend that ran. 
     """
     if W is None: W=evalWeights()
     if not hasattr(match_func, '__call__'): 
-        raise ValueError, "[evalOptAssignment] Invalid match function: %s" % \
-                   str(match_func) 
-    Mu, Mv, val = match_func(W, _flip=_flip)
-    return (_format(Mu), val)
+        raise ValueError("[evalOptAssignment] Invalid match function: %s" % \
+                   str(match_func))
+    # whether the solver maximizes, if known (presolve needs the objective)
+    maximize = {autoMatching: True, maxProfitMatching: True, 
+                minCostMatching: False}.get(match_func)
+    if deadline is not None or gap is not None: 
+        from anytime import anytimeMatching as match_func
+        match_func = functools.partial(match_func, deadline=deadline, gap=gap or 0.0)
+        match_func.__name__ = 'anytimeMatching'
+        maximize = None
+    elif sparse is not None: 
+        from sparse import topKMatching as match_func
+        match_func = functools.partial(match_func, k=sparse)
+        match_func.__name__ = 'topKMatching'
+        maximize = None
+    elif backend is not None: 
+        if match_func is not autoMatching: 
+            raise ValueError("[evalOptAssignment] A backend is chosen by autoMatching only")
+        match_func = functools.partial(autoMatching, backend=backend)
+        match_func.__name__ = 'autoMatching'
+    if presolve and maximize is not None and isinstance(W, (np.ndarray, list)): 
+        from presolve import presolvedMatching, ClassRatio
+        # the classes are solved by module transport, not by a chosen solver
+        ratio = ClassRatio if match_func is autoMatching else 0
+        result = presolvedMatching(W, _flip=_flip, match_func=match_func, ratio=ratio, 
+                                   maximize=maximize)
+    else: 
+        result = match_func(W, _flip=_flip)
+    Mu, Mv, val = result
+    meta = dict(getattr(result, 'meta', {}))
+    meta.setdefault('backend', match_func.__name__)
+    if verify: 
+        from verify import certify
+        meta['certificate'] = certify(W, result, _flip)
+    return MatchResult((asMatching(Mu, getattr(W, 'shape', None)), val), **meta)
+    
+def evalCapacitatedAssignment(proteinCap, drugCap, W=None, _flip=False): 
+    """
+    Evaluate the optimal capacitated assignment, in which protein i 
+    is matched to up to *proteinCap[i] drugs and drug j to up to 
+    *drugCap[j] proteins, each pair at most once (see 
+    transport.capacitatedMatching); an integer applies to all. 
+    
+    W defaults to the unpadded weights; rows and columns of W past 
+    the capacities given, i.e. padding, get none. 
+    
+    Returns a MatchResult (assignment, value), the assignment as a 
+    matching.MultiMatching (protein -> drugs). 
+    """
+    from transport import capacitatedMatching
+    
+    if W is None: W = evalWeights(pad=False)
+    W = np.asarray(W)
+    caps = []
+    for cap, names, size in ((proteinCap, ProteinSet, W.shape[0]), 
+                             (drugCap, DrugSet, W.shape[1])): 
+        cap = np.asarray(cap, dtype=np.int64)
+        if cap.ndim == 0: 
+            cap = np.repeat(cap, min(len(names) or size, size))
+        caps.append(np.concatenate([cap, np.zeros(max(0, size - len(cap)), dtype=np.int64)]))
+    result = capacitatedMatching(W, caps[0], caps[1], _flip=_flip)
+    Mu, Mv, val = result
+    return MatchResult((Mu, val), **result.meta)
+
+def evalKBestAssignments(W=None, k=10, workers=1):
+    """
+    Generate the *k best assignments as (assignment, value), best
+    first (see module kbest); e.g. alternatives to the optimal
+    assignment, which need not be unique.
+    """
+    from kbest import kBestMatching
+
+    if W is None: W = evalWeights()
+    for Mu, Mv, val in kBestMatching(W, k, workers=workers):
+        yield (Mu, val)
+
+def evalSweep(grid, workers=1):
+    """
+    Solve the assignment for every point of a *grid of binding 
+    rule coefficients (see module sweep), e.g. 
+    {'even': [1.5, 2, 2.5], 'common': [1, 1.25]}; features are 
+    computed once and every solve is warm-started. 
+    
+    Returns a list of (coefficients, assignment, value), in the 
+    order of sweep.gridPoints(*grid). 
+    """
+    from sweep import sweep
+    
+    ProteinSet, DrugSet = process_data()
+    results = sorted(sweep(proteinFeatures(ProteinSet), drugFeatures(DrugSet), 
+                           grid, workers=workers))
+    return [(r.coefficients, r.Mu, r.value) for r in results]
+
+def evalClassAssignment():
+    """
+    Evaluate optimal bipartite matching by grouping proteins and 
+    drugs into equivalence classes of identical binding behavior 
+    and solving the much smaller class-level transportation problem 
+    (see module compress). 
+    
+    Same output as evalOptAssignment() but without building the 
+    weight matrix. 
+    """
+    # class-level (compressed) solver, no N x N matrix needed
+    from compress import classMatching
+
+    global ProteinSet, DrugSet
+    ProteinSet, DrugSet = process_data()
+    Mu, Mv, val = classMatching(ProteinSet, DrugSet)
+    return (Mu, val)
     
 def _format(M):
     """
-    Convert matching result from dictionary to a list of tuples.
+    Convert matching result (a Matching or a dictionary) to a list
+    of tuples.
     """
-    assert type(M) == type({})
-    return [(i, j) for i, j in M.items()]
+    return asMatching(M).pairs()
         
         
 def timeMatching(W=None, match_func=maxProfitMatching, _flip=False):
@@ -161,80 +305,67 @@ def timeMatching(W=None, match_func=maxProfitMatching, _flip=False):
     from timer import Timer
     if W is None: W = evalWeights()
     
-    Mu, Mv, val = ({}, {}, 0)
+    Mu, Mv, val = (Matching([]), Matching([]), 0)
     if not hasattr(match_func, '__call__'): 
-        raise ValueError, "[timeMatching] Invalid match function: %s" % str(match_func)
+        raise ValueError("[timeMatching] Invalid match function: %s" % str(match_func))
     
     try:
         with Timer() as t:
             Mu, Mv, val = match_func(W, _flip=_flip) 
     finally:
         print("> %s took %.03f sec." % (match_func.__name__ + '()', t.interval))
-        print "  + assignment: %s" % _format(Mu)
-        print "  + sum of affinity: %f" % val
-    return (_format(Mu), val) 
+        print("  + assignment: %s" % Mu)
+        print("  + sum of affinity: %f" % val)
+    return (asMatching(Mu), val)
 
 def testCountChar(_type='drug'):
     process_data()
     if _type.startswith('d'): dataset = DrugSet
     else: dataset = ProteinSet
     for _str in dataset: 
-        print "%s -> %s" % (_str, str(countChar(_str)))
+        print("%s -> %s" % (_str, str(countChar(_str))))
     return
 
-def benchmark():
-    import numpy as np
-    from datastruct import LinkedLoop
-    from timer import Timer
+def testTiledAssignment(budget=1<<16): 
+    # tiled weights, floating point and exact (int64), reach the 
+    # same optimum as the dense matrix 
+    from weights import WeightScale
+    val = evalOptAssignment(evalWeights())[1]
+    for dtype, scale in ((np.float64, 1), (np.int64, WeightScale)): 
+        tiledVal = evalOptAssignment(evalWeights(dtype=dtype, budget=budget))[1]
+        assert float(tiledVal) / scale == val, \
+            "[testTiledAssignment] %s: %s, dense %s" % (np.dtype(dtype).name, tiledVal, val)
+        print("%s -> %f" % (np.dtype(dtype).name, float(tiledVal) / scale))
+    return
+
+def benchmark(repeat=3, warmup=1, trials=100000):
+    """
+    Time every stage (parse, features, weights, solve, verify) on 
+    the input files, for every available solver backend; see 
+    module bench for synthetic inputs, reports and baselines. 
+    Then compare the optimum with *trials random assignments. 
+    """
+    import bench
+    N = max([len(names) for names in process_data()])
+    case = bench.Case('input', N, 0.0, preprocess.PROTEIN_FILE, preprocess.DRUG_FILE)
+    report = bench.run([case], repeat=repeat, warmup=warmup)
+    print(bench.formatReport(report))
     
-    W = evalWeights()  
-    
-    print "1. Time the computation of matching algorithms ...\n"
-    Mu, val = timeMatching(W, maxProfitMatching)
-
-    # wrapper over C++ impl should run faster
-    # [note] set _flip to True to convert profit to cost
-    Mu2, val2 = timeMatching(np.array(W), minCostMatching, _flip=True)    
-    
-    # check if there exist different assignments between 
-    # two implementations; assignments may not be unique
-    print "\n2. Compare the matching results from two different implementations ...\n"
-    lloop = LinkedLoop(10)
-    for i, pair in enumerate(Mu):
-        if Mu2[i][1] != pair[1]: 
-            lloop.push("(%d -> %d) vs (%d -> %d)" % \
-                          (pair[0], pair[1], Mu2[i][0], Mu2[i][1]))
-    if LinkedLoop.total:
-        print "  + Examples of different assignment:"
-        for e in lloop.content():
-            print "     ++ %s" % str(e)    
-           
-    print "\n3. Now, compare optimum and random assignments ...\n"
-    nTrials = 100
-    avals = []
-    for i in range(nTrials): 
-        Mu3, val3 = evalRandomAssignment(W)
-        avals.append(val3)
-    print "  + random assignment:" 
-    print "    ++ pairs: %s" % Mu3
-    
-    # import math
-    # myu = sum(avals)/(len(avals)+0.0)
-    # print math.sqrt(sum([pow(e-myu, 2) for e in avals])/(len(avals)+0.0))
-    
-    print "    ++ max: %f, min: %f, avg: %f, std: %f" % \
-         (max(avals), min(avals), sum(avals)/len(avals), np.std(avals))
-    
-    #print "> history:\n%s\n" % avals
-    
-    Mu4, val4 = evalOptAssignment(W)
-    print "  +  opt assignment:"
-    print "     ++ pairs: %s" % Mu4
-    print "     ++ value: %f" % val4
-     
+    stats = evalSignificance(trials=trials)
+    q = stats.quantile([0.01, 0.5, 0.99])
+    print("\n> %d random assignments: mean %f, std %f, min %f, max %f" % \
+          (stats.count, stats.mean, stats.std(), stats.min, stats.max))
+    print("  + quantiles 1%%, 50%%, 99%%: %f, %f, %f" % tuple(q))
+    print("  + optimum %f, p-value %g" % (stats.optimum, stats.pValue()))
+    return report
     
 
 if __name__ == "__main__":
+    import sys, os
+    if len(sys.argv) != 3:
+        sys.stderr.write(preprocess.Usage % os.path.basename(sys.argv[0]))
+        raise SystemExit(1)
+    preprocess.setInputFiles(sys.argv[1], sys.argv[2])
     #testCountChar()
     # test_process_data()
     benchmark()
@@ -0,0 +1,150 @@
+'''
+Anytime assignment: the best matching found within a deadline,
+together with a certified bound on how far it can be from the optimum.
+
+A greedy assignment is available almost at once; the auction
+algorithm (see module auction) then improves on it phase by phase,
+every phase of epsilon scaling ending with a complete assignment,
+until the deadline passes, the optimum is reached or the assignment
+is provably close enough. Any prices p of the columns are dual
+labels, lv = p and lu = max_v (w[u, v] - p[v]), whose sum is an
+upper bound on the value of every assignment; the auction prices
+make it tighter as epsilon decreases, so that the gap between the
+best assignment and the least bound is known at all times.
+
+e.g.
+     Mu, Mv, val = result = anytimeMatching(W, deadline=0.1)
+     print("%f <= optimum <= %f" % (val, result.meta['bound']))
+     evalOptAssignment(W, deadline=0.1, gap=0.001)
+'''
+
+import time
+
+import numpy as np
+
+from auction import _auction, resolution
+from matching import Matching
+from result import MatchResult
+
+def greedyMatching(P, rowMax=None, stop=None):
+    """
+    Assign each row of the profit matrix P (m <= n) its best free
+    column, rows with the largest profits first; returns rowMatch.
+
+    *rowMax: P.max(axis=1), if already known
+    *stop: time.time() past which the rows left get the free
+           columns in order instead, in one step
+    """
+    m, n = P.shape
+    if rowMax is None: rowMax = P.max(axis=1)
+    rowMatch = -np.ones(m, dtype=np.int64)
+    taken = np.zeros(n, dtype=bool)
+    order = np.argsort(-rowMax, kind='mergesort')
+    for i, u in enumerate(order.tolist()):
+        if stop is not None and time.time() > stop:
+            rest = order[i:]
+            rowMatch[rest] = np.flatnonzero(~taken)[:len(rest)]
+            break
+        row = np.where(taken, -np.inf, P[u])
+        v = int(row.argmax())
+        rowMatch[u] = v
+        taken[v] = True
+    return rowMatch
+
+def dualBound(P, price):
+    """
+    Upper bound on the value of any assignment of the profit matrix
+    P (m <= n) from column labels *price: the sum of the labels and
+    of the tightest feasible row labels.
+
+    [note] 1. if m < n, the labels must be non-negative
+    """
+    return (P - price).max(axis=1).sum() + price.sum()
+
+def anytimeMatching(weights, _flip=False, deadline=0.1, gap=0.0, scale=5.0):
+    """
+    Compute an assignment of maximum profit within *deadline
+    seconds; same contract as maxWBiMatch.maxProfitMatching, but
+    the assignment need not be optimal. Returns a MatchResult
+    (Mu, Mv, value) whose .meta holds
+
+       bound:   upper bound on the optimum (lower bound if _flip)
+       gap:     |bound - value|, the most the value may be off
+       optimal: whether the assignment is known to be optimal
+       phases:  # of auction phases completed
+
+    *deadline: time limit in seconds, None for none
+    *gap: stop as soon as |bound - value| <= *gap * |bound|, e.g.
+          0.01 for an assignment within 1% of the optimum; 0 runs
+          to the optimum (or the deadline)
+    *scale: factor by which epsilon decreases between phases
+
+    [note] 1. there is always a result: the greedy assignment
+              stops at the deadline too, and matches the rows left
+              to the free columns in order
+           2. prices of the square problem may be negative, which
+              gives a first bound tighter than the sum of row maxima
+              (skipped, as a full pass, once the deadline passed)
+           3. the final epsilon (see auction.auctionMatching) takes
+              a scan of the weights, put off until the first phase
+              is over
+    """
+    start = time.time()
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[anytimeMatching] Need a 2-D weight matrix: %s" % str(W.shape))
+    transposed = W.shape[0] > W.shape[1]
+    sign = -1 if _flip else 1
+    P = W.T if transposed else W
+    if _flip: P = -P
+    P = np.ascontiguousarray(P, dtype=np.float64)
+    m, n = P.shape
+    stop = None if deadline is None else start + deadline
+
+    def result(rowMatch, value, bound, optimal, phases):
+        Mu = Matching(rowMatch, nCols=n)
+        Mv = Mu.inverse()
+        if transposed: Mu, Mv = (Mv, Mu)
+        return MatchResult((Mu, Mv, sign * value), bound=float(sign * bound),
+                           gap=float(abs(bound - value)), optimal=bool(optimal), phases=phases,
+                           elapsed=time.time() - start)
+
+    if m == 0:
+        return result(np.zeros(0, dtype=np.int64), 0.0, 0.0, True, 0)
+    rows = np.arange(m)
+
+    rowMax = P.max(axis=1)
+    best = greedyMatching(P, rowMax, stop)   # [1]
+    value = P[rows, best].sum()
+    bound = rowMax.sum()
+    if m == n and (stop is None or time.time() < stop):   # [2]
+        bound += (P - rowMax[:, None]).max(axis=0).sum()
+
+    def done():
+        return bound - value <= gap * abs(bound) or \
+               (stop is not None and time.time() > stop)
+
+    hi, lo = (rowMax.max(), P.min())
+    C = max(hi - lo, abs(hi), abs(lo)) or 1.0
+    epsilon, eps = (C / scale, None)
+    price = np.zeros(n)
+    phases, optimal = (0, False)
+    while not done():
+        rowMatch = _auction(P, m, price, epsilon, 1, None, 1, stop)
+        if rowMatch is None:
+            break
+        phases += 1
+        bound = min(bound, dualBound(P, price))
+        if P[rows, rowMatch[:m]].sum() > value:
+            best = rowMatch[:m].copy()
+            value = P[rows, best].sum()
+        if eps is None:   # [3]
+            res = resolution(P)
+            eps = (res if res is not None else 1e-9 * C) / (m + 1)
+        if epsilon <= eps:
+            optimal = res is not None
+            break
+        epsilon = max(epsilon / scale, eps)
+    if optimal or bound < value:
+        bound = value
+    return result(best, value, bound, optimal or bound == value, phases)
@@ -0,0 +1,163 @@
+'''
+Bertsekas' auction algorithm with epsilon scaling.
+
+Rows (persons) bid for columns (objects); a column goes to its
+highest bidder and its price rises by the bid increment, the gap
+between the bidder's best and second best net profit plus epsilon.
+Bidding is Jacobi style: in every round all the unassigned rows bid
+at once, which is one vectorized pass over their rows of the weight
+matrix, split across a thread pool for large rounds (NumPy releases
+the GIL in the array operations).
+
+Ties, which are frequent with affinity weights, cost only epsilon per
+bid, and epsilon scaling (solving for a decreasing sequence of
+epsilons, keeping the prices) bounds the number of rounds. The result
+is within m * epsilon of the optimum, hence optimal when epsilon is
+small enough (see auctionMatching).
+
+e.g.
+     Mu, Mv, val = auctionMatching(W)              # exact
+     Mu, Mv, val = auctionMatching(W, eps=0.01)    # faster, approximate
+     evalOptAssignment(W, match_func=auctionMatching)
+'''
+
+from multiprocessing.pool import ThreadPool
+
+import multiprocessing
+import time
+
+import numpy as np
+
+from weights import BlockSize, resolution
+from matching import Matching
+
+# least number of weights per bidding thread and round
+MinChunk = 1 << 16
+
+def _bids(W, rows, m, price, sign):
+    """
+    Bid of each row in *rows (ascending): (best column, new price 
+    of it). Rows >= m are padding, i.e. zero profit for every column.
+    Profits are computed in the dtype of *price, float64 or int64 
+    (exact, see module costscale).
+
+    [note] 1. rows with several best columns bid for the 
+              (row mod # of them)-th one, so that identical rows 
+              spread over tied columns instead of all outbidding 
+              each other for the same one
+    """
+    real = rows[rows < m]
+    low = -np.inf if price.dtype.kind == 'f' else np.iinfo(price.dtype).min
+    profit = np.zeros((len(rows), len(price)), dtype=price.dtype)
+    if len(real):
+        profit[:len(real)] = sign * np.asarray(W[real], dtype=price.dtype)
+    profit -= price
+    v1 = profit.max(axis=1)
+    tied = profit >= v1[:, None]
+    nTied = tied.sum(axis=1)
+    rank = np.cumsum(tied, axis=1)
+    best = np.argmax(rank > (rows % nTied)[:, None], axis=1)   # [1]
+    profit[tied] = low
+    v2 = np.where(nTied > 1, v1, profit.max(axis=1))
+    gap = np.where(v2 > low, v1 - v2, 0)   # single column
+    return (best, price[best] + gap)
+
+def auctionMatching(weights, _flip=False, eps=None, workers=None, scale=5.0):
+    """
+    Compute best assignment of maximum profit by the auction
+    algorithm; same contract as maxWBiMatch.maxProfitMatching,
+    i.e. returns (Mu, Mv, value).
+
+    *eps: final epsilon; the value is within m * eps of the optimum.
+          If None, eps = resolution / (m + 1), which makes the result
+          optimal for integer or dyadic (e.g. affinity) weights;
+          for other weights eps = 1e-9 * (weight range) / (m + 1) [1]
+    *workers: number of bidding threads (default: # of cores)
+    *scale: factor by which epsilon decreases between phases
+
+    [note] 1. the weight matrix is scanned once for its resolution,
+              unless it is a lazily evaluated matrix (see module
+              tiled), in which case the latter rule applies
+           2. if m < n, n - m padding rows with zero profit are
+              simulated so that every column ends up assigned; if
+              m > n, the transposed problem is solved
+    """
+    w = weights if getattr(weights, 'lazyRows', False) else np.asarray(weights)
+    if w.ndim != 2:
+        raise ValueError("[auctionMatching] Need a 2-D weight matrix: %s" % str(w.shape))
+    if w.shape[0] > w.shape[1]:   # [2]
+        Mv, Mu, val = auctionMatching(w.T, _flip=_flip, eps=eps, workers=workers,
+                                      scale=scale)
+        return (Mu, Mv, val)
+    m, n = w.shape
+    if m == 0:
+        Mu = Matching(np.zeros(0, dtype=np.int32), nCols=n)
+        return (Mu, Mu.inverse(), 0)
+    sign = -1 if _flip else 1
+
+    hi, lo = (float(w.max(axis=0).max()), float(w.min(axis=0).min()))
+    C = max(hi - lo, abs(hi), abs(lo)) or 1.0
+    if eps is None:
+        res = resolution(w)
+        eps = (res if res is not None else 1e-9 * C) / (m + 1)
+    if eps <= 0:
+        raise ValueError("[auctionMatching] Need eps > 0: %s" % eps)
+
+    if workers is None: workers = multiprocessing.cpu_count()
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        price = np.zeros(n)
+        epsilon = max(C / scale, eps)
+        while True:
+            rowMatch = _auction(w, m, price, epsilon, sign, pool, workers)
+            if epsilon <= eps:
+                break
+            epsilon = max(epsilon / scale, eps)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    Mu = Matching(rowMatch[:m], nCols=n)
+    return (Mu, Mu.inverse(), Mu.score(w))
+
+def _auction(W, m, price, eps, sign, pool, workers, deadline=None):
+    """
+    One phase of the auction at fixed *eps, starting with nothing
+    assigned; *price (float64, or int64 with an integer *eps) is 
+    updated in place. Returns the column of every row, padding rows 
+    included, or None if time.time() passes *deadline first.
+
+    [note] 1. a round is split over the workers only if each of
+              them gets at least MinChunk weights to look at
+    """
+    n = len(price)
+    rowMatch = -np.ones(n, dtype=np.int64)
+    owner = -np.ones(n, dtype=np.int64)
+    minRows = max(1, MinChunk // n)
+    maxRows = max(minRows, BlockSize // n)
+    while True:
+        free = np.flatnonzero(rowMatch < 0)
+        if not len(free):
+            return rowMatch
+        if deadline is not None and time.time() > deadline:
+            return None
+        step = min(maxRows, max(minRows, -(-len(free) // workers)))   # [1]
+        chunks = [free[i:i+step] for i in range(0, len(free), step)]
+        if pool is not None and len(chunks) > 1:
+            bids = pool.map(lambda rows: _bids(W, rows, m, price, sign), chunks)
+        else:
+            bids = [_bids(W, rows, m, price, sign) for rows in chunks]
+        best = np.concatenate([b[0] for b in bids])
+        bid = np.concatenate([b[1] for b in bids]) + eps
+
+        # highest bid for every column bid on
+        order = np.lexsort((-bid, best))
+        cols, first = np.unique(best[order], return_index=True)
+        winners = free[order[first]]
+
+        previous = owner[cols]
+        rowMatch[previous[previous >= 0]] = -1
+        owner[cols] = winners
+        rowMatch[winners] = cols
+        price[cols] = bid[order[first]]
@@ -0,0 +1,241 @@
+'''
+Registry of assignment solvers (backends) with automatic selection.
+
+The available backends are discovered once, on first use:
+
+     hungarian  hungarian.so (C++), square matrices only
+     scipy      scipy.optimize.linear_sum_assignment, if installed
+     python     maxWBiMatch.maxProfitMatching
+     auction    auction.auctionMatching
+     costscale  costscale.costScalingMatching, integer or dyadic weights
+
+Each one is timed on a few random matrices of increasing size and
+the timings are cached on disk (see CalibrationFile); a solve is then
+dispatched to the backend expected to be fastest for its shape and
+dtype, by log-log interpolation of those timings. The backend that
+ran is recorded in the metadata of the result (see MatchResult).
+
+e.g.
+     result = autoMatching(W)
+     Mu, Mv, val = result
+     print(result.meta['backend'])
+'''
+
+import os
+import json
+import tempfile
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+from maxWBiMatch import maxProfitMatching
+from weights import resolution
+from matching import Matching
+from result import MatchResult
+from cache import DefaultRoot
+from timer import Timer
+
+CalibrationFile = os.path.join(DefaultRoot, 'backends.json')
+CalibrationSizes = (32, 128, 512)
+
+# *solve(W, _flip) -> (Mu, Mv, value); *square: needs an n x n matrix;
+# *lazy: reads rows on demand (see module tiled), i.e. no dense copy;
+# *exact: needs weights that are multiples of some 2^-k (see 
+# weights.resolution), i.e. that scale to integers; *duals: solve() 
+# takes duals=True and returns its dual labels (see module verify)
+Backend = namedtuple('Backend', ['name', 'solve', 'square', 'lazy', 'exact', 'duals'])
+Backend.__new__.__defaults__ = (False, False)
+
+_registry, _hungarian = (None, None)
+_timings = None
+
+def _hungarianMatching(weights, _flip=False):
+    w = np.asarray(weights, dtype=np.float64)
+    rowMatch, _ = _hungarian.lap(w if _flip else -w)   # lap() minimizes cost
+    Mu = Matching(rowMatch, nCols=w.shape[1])
+    return (Mu, Mu.inverse(), Mu.score(w))
+
+def _scipyMatching(weights, _flip=False):
+    from scipy.optimize import linear_sum_assignment
+    w = np.asarray(weights)
+    rows, cols = linear_sum_assignment(w if _flip else -w)
+    rowMatch = -np.ones(w.shape[0], dtype=np.int32)
+    rowMatch[rows] = cols
+    Mu = Matching(rowMatch, nCols=w.shape[1])
+    return (Mu, Mu.inverse(), w[rows, cols].sum())
+
+def _auctionMatching(weights, _flip=False):
+    from auction import auctionMatching
+    return auctionMatching(weights, _flip=_flip)
+
+def _costScalingMatching(weights, _flip=False):
+    from costscale import costScalingMatching
+    return costScalingMatching(weights, _flip=_flip)
+
+def hungarianModule():
+    """
+    The hungarian.so module, or None if it cannot be loaded;
+    looked up once.
+    """
+    backends()
+    return _hungarian
+
+def backends():
+    """
+    The available backends by name (discovered on first call).
+    """
+    global _registry, _hungarian
+    if _registry is None:
+        _registry = OrderedDict()
+        try:
+            import hungarian
+            _hungarian = hungarian
+            register(Backend('hungarian', _hungarianMatching, True, False))
+        except ImportError:
+            pass
+        try:
+            from scipy.optimize import linear_sum_assignment
+            register(Backend('scipy', _scipyMatching, False, False))
+        except ImportError:
+            pass
+        register(Backend('python', maxProfitMatching, False, True, False, True))
+        register(Backend('auction', _auctionMatching, False, True))
+        register(Backend('costscale', _costScalingMatching, False, False, True))
+    return _registry
+
+def register(backend):
+    """
+    Add (or replace) a backend; invalidates the timings in memory.
+    """
+    global _timings
+    if _registry is None: backends()
+    _registry[backend.name] = backend
+    _timings = None
+
+def _kind(dtype):
+    return 'i' if np.dtype(dtype).kind in 'biu' else 'f'
+
+def _sample(n, kind, rng):
+    """
+    Random n x n matrix with many ties, like affinity weights.
+    """
+    w = rng.randint(0, 48, size=(n, n))
+    return w if kind == 'i' else w / 8.0
+
+def calibrate(sizes=CalibrationSizes, path=CalibrationFile, repeat=3, seed=0):
+    """
+    Time every backend on random matrices of the given sizes, for
+    float and integer weights (best of *repeat runs), and save the
+    timings as JSON into *path (None: keep them in memory only).
+
+    Returns {kind: {backend name: [[n, seconds], ...]}}.
+    """
+    global _timings
+    rng = np.random.RandomState(seed)
+    timings = {}
+    for kind in ('f', 'i'):
+        timings[kind] = dict((name, []) for name in backends())
+        for n in sizes:
+            w = _sample(n, kind, rng)
+            for name, backend in backends().items():
+                best = np.inf
+                for _ in range(repeat):
+                    with Timer() as t:
+                        backend.solve(w)
+                    best = min(best, t.interval)
+                timings[kind][name].append([n, best])
+    _timings = timings
+    if path is not None:
+        folder = os.path.dirname(path) or '.'
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=folder)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'backends': list(backends()), 'timings': timings}, f)
+        os.rename(tmp, path)   # atomic
+    return timings
+
+def timings(path=CalibrationFile):
+    """
+    The calibration timings, loaded from *path or measured if
+    missing or made with a different set of backends.
+    """
+    global _timings
+    if _timings is None:
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            if saved['backends'] == list(backends()):
+                _timings = saved['timings']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+    if _timings is None:
+        calibrate(path=path)
+    return _timings
+
+def estimate(name, shape, dtype):
+    """
+    Expected time of a backend on an m x n matrix, interpolating
+    the timings in log-log scale at the size (m^2 n)^(1/3).
+    """
+    points = timings()[_kind(dtype)].get(name)
+    if not points:
+        return np.inf
+    m, n = sorted(shape)
+    size = max(1.0, (float(m) * m * n) ** (1.0/3))
+    sizes = np.log([max(p[0], 1) for p in points])
+    times = np.log([max(p[1], 1e-9) for p in points])
+    x = np.log(size)
+    if len(points) == 1:
+        return float(np.exp(times[0] + 3 * (x - sizes[0])))
+    # extrapolate along the first or last segment
+    i = int(np.clip(np.searchsorted(sizes, x) - 1, 0, len(points) - 2))
+    slope = (times[i+1] - times[i]) / (sizes[i+1] - sizes[i])
+    return float(np.exp(times[i] + slope * (x - sizes[i])))
+
+def select(weights):
+    """
+    Name of the backend expected to be fastest on *weights.
+    """
+    lazy = not isinstance(weights, np.ndarray)
+    shape = weights.shape
+    dtype = getattr(weights, 'dtype', np.float64)
+    candidates = [b for b in backends().values()
+                  if (b.lazy or not lazy) and (not b.square or shape[0] == shape[1])]
+    candidates.sort(key=lambda b: estimate(b.name, shape, dtype))
+    for b in candidates:
+        if not b.exact or resolution(weights) is not None:   # scanned if need be
+            return b.name
+
+def autoMatching(weights, _flip=False, backend=None, duals=False):
+    """
+    Compute best assignment of maximum profit with the backend
+    expected to be fastest (or the named one); same contract as
+    maxWBiMatch.maxProfitMatching.
+
+    *duals: if True, .meta['duals'] holds dual labels certifying
+            the assignment (see module verify), the solver's own
+            if it has them, else recovered from the assignment
+            (None if it is not optimal)
+
+    Returns a MatchResult (Mu, Mv, value) whose metadata records
+    the backend and the solve time (seconds).
+    """
+    if not getattr(weights, 'lazyRows', False) and not isinstance(weights, np.ndarray):
+        weights = np.asarray(weights)
+    if backend is None:
+        backend = select(weights)
+    if backend not in backends():
+        raise ValueError("[autoMatching] Unknown or unavailable backend: %s" % backend)
+    solver = backends()[backend]
+    with Timer() as t:
+        if duals and solver.duals:
+            result = solver.solve(weights, _flip=_flip, duals=True)
+        else:
+            result = solver.solve(weights, _flip=_flip)
+    meta = dict(getattr(result, 'meta', {}))
+    meta.update(backend=backend, elapsed=t.interval)
+    if duals and 'duals' not in meta:
+        from verify import recoverDuals
+        meta['duals'] = recoverDuals(weights, result[0], _flip)
+    return MatchResult(result, **meta)
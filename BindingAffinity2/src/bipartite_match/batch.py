@@ -0,0 +1,148 @@
+'''
+Solve many independent assignment instances on a pool of worker
+processes.
+
+Weight matrices are not pickled to the workers; each one is written
+once into a memory-mapped file on a RAM-backed file system (/dev/shm
+when available) and the workers map it read-only. The pool is created
+on first use and reused by subsequent calls (see shutdown()).
+
+e.g.
+     for r in solve_many(matrices, solver=maxProfitMatching, workers=8):
+         print("%d: %f (%.3f sec.)" % (r.index, r.value, r.elapsed))
+'''
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+from maxWBiMatch import maxProfitMatching
+from timer import Timer
+
+BatchResult = namedtuple('BatchResult', ['index', 'Mu', 'Mv', 'value', 'elapsed'])
+
+_pool, _poolSize = (None, 0)
+
+def _sharedDir():
+    shm = '/dev/shm'
+    return shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+
+class SharedWeights(object):
+    """
+    Weight matrices shared with the worker processes: each one is
+    written into a memory-mapped file of a temporary folder, on a
+    RAM-backed file system when available, and mapped read-only by
+    the workers (see mapShared). close(), or the end of a with
+    block, removes the folder.
+
+    e.g.
+         with SharedWeights('kbest-') as shared:
+             handle = shared.add(W)
+             pool.map(task, [handle + args for args in ...])
+    """
+    def __init__(self, prefix='shared-'):
+        self.folder = tempfile.mkdtemp(prefix=prefix, dir=_sharedDir())
+        self.count = 0
+
+    def add(self, W, name=None):
+        """
+        Write *W into the folder; returns its handle, (path, shape,
+        dtype), which pickles cheaply.
+        """
+        W = np.ascontiguousarray(W)
+        if name is None: name = self.count
+        self.count += 1
+        path = os.path.join(self.folder, '%s.npy' % name)
+        mapped = np.memmap(path, mode='w+', dtype=W.dtype, shape=W.shape)
+        mapped[...] = W
+        mapped.flush()
+        del mapped
+        return (path, W.shape, W.dtype.str)
+
+    def remove(self, name):
+        """
+        Delete the file of the matrix added as *name, once no
+        longer needed.
+        """
+        path = os.path.join(self.folder, '%s.npy' % name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def close(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def mapShared(handle):
+    """
+    Read-only map of a matrix shared by SharedWeights.add().
+    """
+    path, shape, dtype = handle
+    return np.memmap(path, mode='r', dtype=dtype, shape=shape)
+
+def getPool(workers=None):
+    """
+    Return the process pool, (re)creating it only when the
+    number of workers changes.
+    """
+    global _pool, _poolSize
+    if workers is None: workers = multiprocessing.cpu_count()
+    if _pool is None or _poolSize != workers:
+        shutdown()
+        _pool, _poolSize = (multiprocessing.Pool(workers), workers)
+    return _pool
+
+def shutdown():
+    """
+    Terminate the worker processes, if any.
+    """
+    global _pool, _poolSize
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+    _pool, _poolSize = (None, 0)
+
+def _solveOne(task):
+    index, handle, solver, _flip = task
+    W = mapShared(handle)
+    with Timer() as t:
+        Mu, Mv, val = solver(W, _flip=_flip)
+    return BatchResult(index, Mu, Mv, val, t.interval)
+
+def _tasks(matrices, shared, solver, _flip):
+    for index, W in enumerate(matrices):
+        yield (index, shared.add(W, index), solver, _flip)
+
+def solve_many(matrices, solver=maxProfitMatching, workers=None, _flip=False):
+    """
+    Solve each weight matrix in *matrices (any iterable) with
+    *solver, a module-level matching function with the usual
+    (Mu, Mv, value) contract.
+
+    Yields a BatchResult per instance, in completion order;
+    BatchResult.index refers to the position in *matrices and
+    BatchResult.elapsed is the solve time in the worker.
+
+    *workers: number of worker processes (default: # of cores);
+              with workers=1 instances are solved in this process
+    """
+    if not hasattr(solver, '__call__'):
+        raise ValueError("[solve_many] Invalid match function: %s" % str(solver))
+    with SharedWeights('solve_many-') as shared:
+        tasks = _tasks(matrices, shared, solver, _flip)
+        if workers == 1:
+            results = (_solveOne(task) for task in tasks)
+        else:
+            results = getPool(workers).imap_unordered(_solveOne, tasks)
+        for result in results:
+            shared.remove(result.index)
+            yield result
@@ -0,0 +1,272 @@
+'''
+Benchmark suite: per-stage timings of the whole pipeline on
+synthetic inputs, for every solver backend.
+
+Each case is a pair of name files (synthetic ones are generated at a
+given N and tie density, see syntheticNames) that goes through the
+stages
+
+     parse     read the two files
+     features  per-name features (see module weights)
+     weights   the padded weight matrix
+     solve     one run per backend (see module backends)
+     verify    certify each assignment and its value (see module verify)
+
+Every stage is run *warmup times untimed, then *repeat times; the
+report keeps the minimum and median wall-clock and CPU times, and
+the peak memory allocated during the stage (tracemalloc, Python 3
+only). Reports are written as JSON or CSV and compared against a
+stored baseline, flagging stages that got slower.
+
+e.g.
+     python bench.py --sizes 100 1000 5000 --ties 0 0.5 \\
+                     --json report.json --baseline baseline.json
+'''
+
+import os
+import sys
+import csv
+import json
+import shutil
+import string
+import argparse
+import platform
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+import backends
+from timer import Timer
+from preprocess import readNames
+from weights import proteinFeatures, drugFeatures, weightMatrix
+from verify import certify
+
+try:
+    import tracemalloc
+except ImportError:   # Python 2
+    tracemalloc = None
+
+Case = namedtuple('Case', ['name', 'n', 'ties', 'proteinFile', 'drugFile'])
+
+# columns of the CSV report, i.e. the fields of a record
+Fields = ['case', 'n', 'ties', 'stage', 'backend', 'repeat', 'wallMin',
+          'wallMedian', 'cpuMin', 'cpuMedian', 'peakBytes', 'value', 'ok']
+
+def syntheticNames(n, ties=0.0, seed=0, minLength=3, maxLength=15):
+    """
+    n random lower-case names of random length; a fraction *ties
+    of them are copies of a few prototypes, i.e. names with
+    identical features, hence identical rows (columns) of weights.
+    """
+    rng = np.random.RandomState(seed)
+    letters = np.array(list(string.ascii_lowercase))
+    def name():
+        return ''.join(rng.choice(letters, rng.randint(minLength, maxLength+1)))
+    prototypes = [name() for _ in range(16)]
+    return [prototypes[rng.randint(len(prototypes))] if rng.random_sample() < ties
+            else name() for _ in range(n)]
+
+def syntheticCase(folder, n, ties=0.0, seed=0):
+    """
+    Write n synthetic protein and drug names into *folder.
+    """
+    name = 'n%d-t%g' % (n, ties)
+    files = []
+    for i, kind in enumerate(['proteins', 'drugs']):
+        path = os.path.join(folder, '%s-%s.txt' % (name, kind))
+        with open(path, 'w') as f:
+            f.write('\n'.join(syntheticNames(n, ties, seed=seed + i)) + '\n')
+        files.append(path)
+    return Case(name, n, ties, files[0], files[1])
+
+def measure(func, repeat=3, warmup=1):
+    """
+    Run func() *warmup times, then *repeat times timed, then once
+    more, untimed, for the peak memory if tracemalloc is available
+    (tracing slows down allocations).
+    
+    Returns (statistics, result of the last timed call).
+    """
+    for _ in range(warmup):
+        func()
+    walls, cpus, peak = ([], [], None)
+    for _ in range(repeat):
+        with Timer() as t:
+            result = func()
+        walls.append(t.interval)
+        cpus.append(t.cpu)
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    stats = {'repeat': repeat, 'wallMin': min(walls), 'wallMedian': float(np.median(walls)),
+             'cpuMin': min(cpus), 'cpuMedian': float(np.median(cpus)), 'peakBytes': peak}
+    return (stats, result)
+
+def verifyMatching(W, Mu, value):
+    """
+    True if Mu is an optimal assignment of W of value *value, as
+    certified by dual labels (see verify.certify).
+    """
+    return certify(W, (Mu, None, value)).ok
+
+def runCase(case, names=None, repeat=3, warmup=1):
+    """
+    Benchmark all the stages of one case, solving with the named
+    backends (default: all the available ones).
+
+    Returns the list of records (dictionaries with the Fields).
+    """
+    def record(stage, stats, backend='', value=None, ok=None):
+        r = dict(case=case.name, n=case.n, ties=case.ties, stage=stage,
+                 backend=backend, value=value, ok=ok)
+        r.update(stats)
+        return r
+
+    records = []
+    stats, (ProteinSet, DrugSet) = measure(lambda: (readNames(case.proteinFile),
+                                    readNames(case.drugFile)), repeat, warmup)
+    records.append(record('parse', stats))
+    stats, (pfeat, dfeat) = measure(lambda: (proteinFeatures(ProteinSet),
+                                    drugFeatures(DrugSet)), repeat, warmup)
+    records.append(record('features', stats))
+    stats, W = measure(lambda: weightMatrix(pfeat, dfeat), repeat, warmup)
+    records.append(record('weights', stats))
+
+    solved = []
+    for name in (names or list(backends.backends())):
+        stats, (Mu, Mv, value) = measure(lambda: backends.autoMatching(W, backend=name),
+                                         repeat, warmup)
+        records.append(record('solve', stats, name, float(value)))
+        solved.append((name, Mu, value))
+    for name, Mu, value in solved:
+        stats, ok = measure(lambda: verifyMatching(W, Mu, value), repeat, warmup)
+        records.append(record('verify', stats, name, float(value), bool(ok)))
+    return records
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'backends': list(backends.backends())}
+
+def run(cases, names=None, repeat=3, warmup=1):
+    """
+    Benchmark every case; returns the report, a dictionary with
+    the environment and the list of records.
+    """
+    records = []
+    for case in cases:
+        records.extend(runCase(case, names, repeat, warmup))
+    return {'environment': environment(), 'records': records}
+
+def runSynthetic(sizes=(100, 1000), ties=(0.0,), names=None, repeat=3, warmup=1, seed=0):
+    """
+    Benchmark synthetic cases of every size and tie density.
+    """
+    folder = tempfile.mkdtemp(prefix='bench-')
+    try:
+        cases = [syntheticCase(folder, n, t, seed) for n in sizes for t in ties]
+        return run(cases, names, repeat, warmup)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def writeJSON(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+
+def readJSON(path):
+    with open(path) as f:
+        return json.load(f)
+
+def writeCSV(report, path):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, Fields)
+        writer.writeheader()
+        for r in report['records']:
+            writer.writerow(r)
+
+def _key(r):
+    return (r['case'], r['stage'], r['backend'])
+
+def compare(report, baseline, tolerance=0.25, minSeconds=1e-3):
+    """
+    Stages whose median wall-clock time exceeds the baseline's by
+    more than a fraction *tolerance (and by at least *minSeconds,
+    below which timings are noise), and verifications that failed.
+
+    Returns a list of (record, baseline record or None).
+    """
+    base = dict((_key(r), r) for r in baseline['records'])
+    regressions = []
+    for r in report['records']:
+        if r['ok'] is False:
+            regressions.append((r, base.get(_key(r))))
+            continue
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        if r['wallMedian'] > b['wallMedian'] * (1 + tolerance) and \
+                r['wallMedian'] - b['wallMedian'] >= minSeconds:
+            regressions.append((r, b))
+    return regressions
+
+def formatReport(report, regressions=()):
+    """
+    Human readable table of the records, regressions marked by '!'.
+    """
+    slower = set(_key(r) for r, _ in regressions)
+    lines = ['%-14s %-8s %-9s %10s %10s %12s %s' % ('case', 'stage', 'backend',
+             'wall(s)', 'cpu(s)', 'peak(MB)', 'value')]
+    for r in report['records']:
+        peak = '%.1f' % (r['peakBytes'] / 1e6) if r['peakBytes'] is not None else '-'
+        value = '' if r['value'] is None else '%g' % r['value']
+        if r['ok'] is False: value += ' (FAILED)'
+        lines.append('%-14s %-8s %-9s %10.4f %10.4f %12s %s%s' % (r['case'], r['stage'],
+                     r['backend'], r['wallMedian'], r['cpuMedian'], peak, value,
+                     '  !' if _key(r) in slower else ''))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the matching pipeline.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                        help='numbers of proteins (= drugs), e.g. 100 1000 20000')
+    parser.add_argument('--ties', type=float, nargs='+', default=[0.0],
+                        help='fractions of names copied from a few prototypes')
+    parser.add_argument('--backends', nargs='+', default=None,
+                        help='solver backends (default: all available)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report as JSON')
+    parser.add_argument('--csv', help='write the records as CSV')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown w.r.t. the baseline (fraction)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store this report as the baseline')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.backends or []) - set(backends.backends())
+    if unknown:
+        parser.error('unavailable backends: %s' % ', '.join(sorted(unknown)))
+    report = runSynthetic(args.sizes, args.ties, args.backends, args.repeat,
+                          args.warmup, args.seed)
+    if args.json: writeJSON(report, args.json)
+    if args.csv: writeCSV(report, args.csv)
+
+    regressions = []
+    if args.baseline and not args.update_baseline and os.path.exists(args.baseline):
+        regressions = compare(report, readJSON(args.baseline), args.tolerance)
+    print(formatReport(report, regressions))
+    if args.baseline and args.update_baseline:
+        writeJSON(report, args.baseline)
+    if regressions:
+        sys.stderr.write('%d regression(s) w.r.t. %s\n' % (len(regressions), args.baseline))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+'''
+Persistent, content-addressed cache of parsed inputs, per-name
+features and weight matrices.
+
+Entries are keyed by hashes of the input files (and, for weight
+matrices, of the rule set version, dtype and padding; see
+rules.RuleSet.version), so they never go stale: a changed input or
+rule simply maps to a new key. Every entry is a directory of .npy
+files that are memory-mapped read-only on load, which lets several
+worker processes share one copy of a weight matrix through the page
+cache.
+
+The cache is bounded in size; the least recently used entries are
+evicted first.
+
+e.g.
+     ProteinSet, DrugSet, W = cachedWeights('proteins.txt', 'drugs.txt')
+'''
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from preprocess import readNames
+from weights import ProteinFeatures, DrugFeatures, proteinFeatures, \
+        drugFeatures, weightMatrix
+from rules import DefaultRules
+
+DefaultRoot = os.environ.get('BIPARTITE_MATCH_CACHE',
+                    os.path.join(os.path.expanduser('~'), '.cache', 'bipartite_match'))
+DefaultMaxBytes = 4 << 30
+
+def fileDigest(path, _chunk=1 << 20):
+    """
+    SHA-1 hex digest of a file's content.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_chunk), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Cache(object):
+    """
+    Directory of cache entries, <root>/<key>/<name>.npy, with
+    size-bounded LRU eviction. The modification time of an entry
+    directory records its last use.
+    """
+    def __init__(self, root=DefaultRoot, maxBytes=DefaultMaxBytes):
+        self.root = root
+        self.maxBytes = maxBytes
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def key(self, *parts):
+        return hashlib.sha1('|'.join([str(p) for p in parts]).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        """
+        Returns the arrays of an entry, memory-mapped read-only, as
+        a dictionary; None if there is no such entry.
+        """
+        folder = self.path(key)
+        try:
+            names = [f for f in os.listdir(folder) if f.endswith('.npy')]
+            entry = dict((f[:-4], np.load(os.path.join(folder, f), mmap_mode='r'))
+                         for f in names)
+            os.utime(folder, None)   # mark as recently used
+        except (OSError, IOError, ValueError):
+            return None
+        return entry
+
+    def store(self, key, **arrays):
+        """
+        Write an entry atomically (another process may be storing
+        the same key) and evict old entries if over budget.
+        """
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+        for name, a in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), a)
+        try:
+            os.rename(tmp, self.path(key))
+        except OSError:   # already stored
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def invalidate(self, key=None):
+        """
+        Remove one entry, or all of them if *key is None.
+        """
+        keys = [key] if key is not None else self.entries()
+        for k in keys:
+            shutil.rmtree(self.path(k), ignore_errors=True)
+
+    def entries(self):
+        return [k for k in os.listdir(self.root) if not k.startswith('.')]
+
+    def size(self, key):
+        folder = self.path(key)
+        return sum([os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)])
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in
+        maxBytes.
+        """
+        entries = []
+        for k in self.entries():
+            try:
+                entries.append((os.path.getmtime(self.path(k)), self.size(k), k))
+            except OSError:   # evicted by another process
+                pass
+        total = sum([e[1] for e in entries])
+        for _, size, k in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            self.invalidate(k)
+            total -= size
+
+def cachedFeatures(proteinFile, drugFile, cache=None):
+    """
+    Parsed names and per-name features of the input files.
+
+    Returns (ProteinSet, DrugSet, pfeat, dfeat, inputKey).
+    """
+    if cache is None: cache = Cache()
+    inputKey = cache.key('input', fileDigest(proteinFile), fileDigest(drugFile))
+    entry = cache.load(inputKey)
+    if entry is None:
+        ProteinSet, DrugSet = (readNames(proteinFile), readNames(drugFile))
+        pfeat, dfeat = (proteinFeatures(ProteinSet), drugFeatures(DrugSet))
+        cache.store(inputKey, proteins=np.array(ProteinSet, dtype=str),
+                    drugs=np.array(DrugSet, dtype=str), plength=pfeat.length,
+                    dlength=dfeat.length, dnVowel=dfeat.nVowel,
+                    dnConsonant=dfeat.nConsonant)
+        return (ProteinSet, DrugSet, pfeat, dfeat, inputKey)
+
+    pfeat = ProteinFeatures(entry['plength'])
+    dfeat = DrugFeatures(entry['dlength'], entry['dnVowel'], entry['dnConsonant'])
+    return (entry['proteins'].tolist(), entry['drugs'].tolist(), pfeat, dfeat, inputKey)
+
+def cachedWeights(proteinFile, drugFile, cache=None, dtype=np.float64, pad=True,
+                  rules=None):
+    """
+    Parsed names and the weight matrix of the input files (see
+    affinity.evalWeights), the latter memory-mapped read-only.
+
+    *rules: a rules.RuleSet (default: rules.DefaultRules); features 
+            it needs beyond the cached ones are computed from the 
+            names
+
+    Returns (ProteinSet, DrugSet, W).
+    """
+    if rules is None: rules = DefaultRules
+    if cache is None: cache = Cache()
+    ProteinSet, DrugSet, pfeat, dfeat, inputKey = \
+            cachedFeatures(proteinFile, drugFile, cache)
+    dtype = np.dtype(dtype)
+    weightKey = cache.key('weights', inputKey, rules.version, dtype.str, pad)
+    entry = cache.load(weightKey)
+    if entry is None:
+        pfeat = rules.features(ProteinSet, 'p', pfeat)
+        dfeat = rules.features(DrugSet, 'd', dfeat)
+        W = weightMatrix(pfeat, dfeat, dtype=dtype, pad=pad, rules=rules)
+        cache.store(weightKey, W=W)
+        entry = cache.load(weightKey) or {'W': W}   # unless evicted right away
+    return (ProteinSet, DrugSet, entry['W'])
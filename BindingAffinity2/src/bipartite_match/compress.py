@@ -0,0 +1,100 @@
+'''
+Solve the protein-drug assignment on equivalence classes of names.
+
+A binding affinity only depends on the length of the protein name and
+on the (length, # of vowels, # of consonants) signature of the drug
+name (see weights.weightBlock). Names sharing a signature are
+interchangeable, so even large libraries collapse into a few hundred
+classes. The assignment then reduces to a transportation problem
+between protein classes and drug classes (see module transport) whose
+supplies and demands are the class multiplicities; its optimal flow
+is finally expanded back into a full assignment of names.
+
+No N x N weight matrix is ever built; the class-level problem is
+P x D where P, D are the numbers of distinct signatures.
+'''
+
+import numpy as np
+
+from weights import ProteinFeatures, DrugFeatures, proteinFeatures, \
+        drugFeatures, weightBlock
+from transport import transportFlow
+from matching import Matching
+
+def proteinClasses(pfeat):
+    """
+    Group proteins by signature.
+
+    Returns (features, labels, counts): the features of one
+    representative per class, the class label of each protein and
+    the class multiplicities.
+    """
+    keys, labels, counts = np.unique(pfeat.length, return_inverse=True,
+                                     return_counts=True)
+    return (ProteinFeatures(keys), labels.ravel(), counts)
+
+def drugClasses(dfeat):
+    """
+    Group drugs by signature; see proteinClasses().
+    """
+    sig = np.column_stack([dfeat.length, dfeat.nVowel, dfeat.nConsonant])
+    keys, labels, counts = np.unique(sig.reshape(-1, 3), axis=0,
+                                     return_inverse=True, return_counts=True)
+    feat = DrugFeatures(keys[:, 0].copy(), keys[:, 1].copy(), keys[:, 2].copy())
+    return (feat, labels.ravel(), counts)
+
+def classMatching(ProteinSet, DrugSet):
+    """
+    Compute the maximum-affinity assignment between the two sets
+    of names via their equivalence classes.
+
+    Returns the mappings Mu : U->V, Mv : V->U and the value of the
+    matching, where U, V are padded (as in affinity.evalWeights) to
+    N = max(len(ProteinSet), len(DrugSet)) vertices each; padded
+    vertices have zero affinity to everything.
+    """
+    pfeat, plabels, pcounts = proteinClasses(proteinFeatures(ProteinSet))
+    dfeat, dlabels, dcounts = drugClasses(drugFeatures(DrugSet))
+    m, n = (len(ProteinSet), len(DrugSet))
+    N = max(m, n)
+
+    W = weightBlock(pfeat, dfeat)
+    # dummy classes absorb the padding
+    if m < N:
+        W = np.vstack([W, np.zeros((1, W.shape[1]))])
+        pcounts = np.append(pcounts, N-m)
+        plabels = np.append(plabels, np.repeat(len(pcounts)-1, N-m))
+    if n < N:
+        W = np.hstack([W, np.zeros((W.shape[0], 1))])
+        dcounts = np.append(dcounts, N-n)
+        dlabels = np.append(dlabels, np.repeat(len(dcounts)-1, N-n))
+
+    flow, val = transportFlow(W, pcounts, dcounts)
+    rowMatch = expandFlow(flow, plabels, dlabels)
+
+    Mu = Matching(rowMatch, nCols=N)
+    return (Mu, Mu.inverse(), val)
+
+def expandFlow(flow, rowLabels, colLabels):
+    """
+    Expand a class-level flow into an assignment of members; i.e.
+    flow<i,j> members of row class i are assigned to flow<i,j>
+    members of column class j.
+
+    Returns an array mapping each row to its column.
+    """
+    rowMembers = np.argsort(rowLabels, kind='mergesort')
+    colMembers = np.argsort(colLabels, kind='mergesort')
+    rowStart = np.concatenate([[0], np.cumsum(np.bincount(rowLabels,
+                                                minlength=flow.shape[0]))])
+    colStart = np.concatenate([[0], np.cumsum(np.bincount(colLabels,
+                                                minlength=flow.shape[1]))])
+
+    rowMatch = -np.ones(len(rowLabels), dtype=np.int64)
+    for i, j in zip(*np.nonzero(flow)):
+        f = flow[i, j]
+        rows = rowMembers[rowStart[i]:rowStart[i]+f]
+        rowMatch[rows] = colMembers[colStart[j]:colStart[j]+f]
+        rowStart[i] += f
+        colStart[j] += f
+    return rowMatch
@@ -0,0 +1,85 @@
+'''
+Goldberg-Kennedy cost scaling for the assignment problem, in exact
+integer arithmetic.
+
+The assignment is a unit-capacity flow from rows to columns. Refine
+starts from no flow and keeps the prices of the columns; every row
+with excess pushes it along its cheapest arc to a column v (the first
+push), v sends its previous unit of flow back to its former row (the
+second push, which gives that row the excess) and is relabeled so
+that the arc just used has reduced cost epsilon. A double push is
+exactly a bid of the auction algorithm and a refine an auction phase,
+so refine is auction._auction, run on integer profits and prices:
+all the active rows push at once, one vectorized pass over their
+rows of the weight matrix per round, the best bidder winning a
+contested column. Refine ends with every row (and column) assigned
+and epsilon-optimal prices; epsilon is then divided by alpha and
+refine starts again. What this module adds to auctionMatching is the
+exact arithmetic below.
+
+Weights are scaled to integers (see weights.integerWeights) and
+multiplied by n + 1, so that prices, reduced costs and epsilon are
+integers: there is no tolerance anywhere, and the assignment of the
+phase with epsilon = 1 is optimal. Ties, which are frequent with
+affinity weights, cost one epsilon per push as in module auction.
+
+e.g.
+     Mu, Mv, val = costScalingMatching(W)
+     W = evalWeights(dtype=np.int64)   # exact mode, see weights
+     Mu, Mv, val = costScalingMatching(W)   # val in 1/WeightScale
+'''
+
+import numpy as np
+
+from auction import _auction
+from weights import integerWeights
+from matching import Matching
+
+# largest scaled profit; prices stay within a few times of it
+MaxScaled = 1 << 56
+
+def costScalingMatching(weights, _flip=False, alpha=10):
+    """
+    Compute best assignment of maximum profit by cost scaling;
+    same contract as maxWBiMatch.maxProfitMatching, i.e. returns
+    (Mu, Mv, value), the value exactly as the sum of the weights.
+
+    *alpha: factor by which epsilon decreases between phases
+
+    [note] 1. weights must be integers or multiples of some 2^-k
+              (as affinity weights are), otherwise ValueError
+           2. if m < n, n - m padding rows with zero profit are
+              simulated so that every column ends up assigned; if
+              m > n, the transposed problem is solved
+    """
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[costScalingMatching] Need a 2-D weight matrix: %s" % str(W.shape))
+    if W.shape[0] > W.shape[1]:   # [2]
+        Mv, Mu, val = costScalingMatching(W.T, _flip=_flip, alpha=alpha)
+        return (Mu, Mv, val)
+    m, n = W.shape
+    if m == 0:
+        Mu = Matching(np.zeros(0, dtype=np.int32), nCols=n)
+        return (Mu, Mu.inverse(), 0)
+    if alpha < 2:
+        raise ValueError("[costScalingMatching] Need alpha >= 2: %s" % alpha)
+
+    P, _ = integerWeights(W)   # [1]
+    if _flip: np.negative(P, out=P)
+    P -= P.min()   # the optimal assignment does not change
+    C = int(P.max()) * (n + 1)
+    if C > MaxScaled:
+        raise ValueError("[costScalingMatching] Weights too large to scale: %d" % C)
+    P *= n + 1
+
+    price = np.zeros(n, dtype=np.int64)
+    eps = max(1, C // alpha)
+    while True:
+        rowMatch = _auction(P, m, price, eps, 1, None, 1)   # refine
+        if eps == 1:
+            break
+        eps = max(1, eps // alpha)
+
+    Mu = Matching(rowMatch[:m], nCols=n)
+    return (Mu, Mu.inverse(), Mu.score(W))
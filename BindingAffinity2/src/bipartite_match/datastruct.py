@@ -6,6 +6,7 @@ a circular queue.
 
 @author: barnett
 '''
+from __future__ import print_function
 
 class LinkedLoop(object):
     head = 0
@@ -62,58 +63,58 @@ if __name__ == "__main__":
     lloop = LinkedLoop(N)
     
     M= 27
-    print ">>>> cycle 1 <<<<"
+    print(">>>> cycle 1 <<<<")
     for i in range(M):
         lloop.push(i)
-        print lloop, lloop.total
+        print(lloop, lloop.total)
     for j in range(N): 
         a = lloop.pop()
-        print "popped %s | content: %s | total: %d" % (a, lloop, lloop.total)
+        print("popped %s | content: %s | total: %d" % (a, lloop, lloop.total))
         
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
-    print "> empty? %s" % bool(lloop.isEmpty())
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
+    print("> empty? %s" % bool(lloop.isEmpty()))
         
-    print ">>>> cycle 2 <<<<"
+    print(">>>> cycle 2 <<<<")
     for i in range(4):
         lloop.push(20+i); 
-        print lloop
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
+        print(lloop)
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
     
     for j in range(4):
         a = lloop.pop()
-        print "popped %s | %s" % (a, lloop)
+        print("popped %s | %s" % (a, lloop))
     
-    print "> empty? %s" % bool(lloop.isEmpty())    
+    print("> empty? %s" % bool(lloop.isEmpty()))    
     
-    print ">>>> cycle 3 <<<<"
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
+    print(">>>> cycle 3 <<<<")
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
     for i in range(M):
         lloop.push(i+30)
-        print lloop, lloop.total
+        print(lloop, lloop.total)
     for j in range(N): 
         a = lloop.pop()
-        print "popped %s | content: %s | total: %d" % (a, lloop, lloop.total) 
+        print("popped %s | content: %s | total: %d" % (a, lloop, lloop.total)) 
          
          
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
-    print ">>>> cycle 4 <<<<"
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
+    print(">>>> cycle 4 <<<<")
     for i in range(4):
         lloop.push(20+i); 
-        print lloop
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
+        print(lloop)
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
     
     for j in range(4):
         a = lloop.pop()
-        print "popped %s | %s" % (a, lloop)
-    print "> empty? %s" % bool(lloop.isEmpty())  
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)
+        print("popped %s | %s" % (a, lloop))
+    print("> empty? %s" % bool(lloop.isEmpty()))  
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))
     
-    print "> try popping empty list ..."
+    print("> try popping empty list ...")
     for i in range(3):
         a = lloop.pop()
-        print "popped %s | content: %s | total: %d" % (a, lloop, lloop.total)   
-    print "> head, tail pointers should not change"
-    print "(head: %s, tail: %s)" % (lloop.head, lloop.tail)    
+        print("popped %s | content: %s | total: %d" % (a, lloop, lloop.total))   
+    print("> head, tail pointers should not change")
+    print("(head: %s, tail: %s)" % (lloop.head, lloop.tail))    
     
             
             
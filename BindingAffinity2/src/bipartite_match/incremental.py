@@ -0,0 +1,133 @@
+'''
+Incremental re-matching when proteins or drugs are added or removed.
+
+IncrementalMatcher keeps the dual labels (lu, lv) and the matching of
+the last solve. After an insertion or deletion only the vertices that
+lost their partner, and the new ones, are left free; labels of new
+vertices are set so that all labels stay feasible (see
+HungarianSolver.warmStart). Each free vertex costs one augmenting
+path, i.e. O(n^2), so k changes cost O(k n^2) instead of a full O(n^3)
+solve.
+
+e.g.
+     matcher = IncrementalMatcher(ProteinSet, DrugSet)
+     matcher.insertDrugs(['Xarelto', 'Eliquis'])
+     matcher.deleteDrugs(['Lipitor'])
+     Mu, value = matcher.result()
+'''
+
+import numpy as np
+
+from maxWBiMatch import HungarianSolver
+from matching import Matching
+from weights import ProteinFeatures, DrugFeatures, proteinFeatures, \
+        drugFeatures, weightMatrix
+
+class IncrementalMatcher(object):
+    """
+    Maximum-affinity assignment between two sets of names, padded
+    to N = max(# proteins, # drugs) as in affinity.evalWeights, that
+    is maintained under insertions and deletions.
+    """
+    def __init__(self, ProteinSet, DrugSet, dtype=np.float64):
+        self.ProteinSet = list(ProteinSet)
+        self.DrugSet = list(DrugSet)
+        self.dtype = dtype
+        self.pfeat = proteinFeatures(self.ProteinSet)
+        self.dfeat = drugFeatures(self.DrugSet)
+        self.solver = HungarianSolver(self._weights())
+        self.solver.solve()
+        self._shape = (len(self.ProteinSet), len(self.DrugSet))
+
+    def _weights(self):
+        return weightMatrix(self.pfeat, self.dfeat, dtype=self.dtype)
+
+    def insertProteins(self, names):
+        names = list(names)
+        self.ProteinSet += names
+        pf = proteinFeatures(names)
+        self.pfeat = ProteinFeatures(np.append(self.pfeat.length, pf.length))
+        keep = np.arange(len(self.ProteinSet) - len(names))
+        self._update(rows=np.append(keep, -np.ones(len(names), dtype=np.int64)))
+
+    def deleteProteins(self, names):
+        keep = _remaining(self.ProteinSet, names)
+        self.ProteinSet = [self.ProteinSet[i] for i in keep]
+        self.pfeat = ProteinFeatures(self.pfeat.length[keep])
+        self._update(rows=keep)
+
+    def insertDrugs(self, names):
+        names = list(names)
+        self.DrugSet += names
+        df = drugFeatures(names)
+        self.dfeat = DrugFeatures(*[np.append(a, b) for a, b in zip(self.dfeat, df)])
+        keep = np.arange(len(self.DrugSet) - len(names))
+        self._update(cols=np.append(keep, -np.ones(len(names), dtype=np.int64)))
+
+    def deleteDrugs(self, names):
+        keep = _remaining(self.DrugSet, names)
+        self.DrugSet = [self.DrugSet[i] for i in keep]
+        self.dfeat = DrugFeatures(*[a[keep] for a in self.dfeat])
+        self._update(cols=keep)
+
+    def _update(self, rows=None, cols=None):
+        """
+        Re-solve after a change, where *rows (*cols) maps each real
+        protein (drug) to its former index, or -1 if new; None if
+        unchanged.
+        """
+        old = self.solver
+        m, n = (len(self.ProteinSet), len(self.DrugSet))
+        N = max(m, n)
+        rowOrigin = _origin(rows, m, N, self._shape[0], old.n)
+        colOrigin = _origin(cols, n, N, self._shape[1], old.n)
+
+        lu = np.where(rowOrigin >= 0, old.lu[rowOrigin], np.nan)
+        lv = np.where(colOrigin >= 0, old.lv[colOrigin], np.nan)
+
+        # new index of every former column, -1 if deleted
+        colIndex = -np.ones(old.n, dtype=np.int64)
+        colIndex[colOrigin[colOrigin >= 0]] = np.flatnonzero(colOrigin >= 0)
+        rowMatch = np.where(rowOrigin >= 0, old.rowMatch[rowOrigin], -1)
+        rowMatch = np.where(rowMatch >= 0, colIndex[rowMatch], -1)
+
+        self.solver = HungarianSolver(self._weights())
+        self.solver.warmStart(lu, lv, rowMatch)
+        self.solver.solve(warm=True)
+        self._shape = (m, n)
+
+    def result(self):
+        """
+        Returns the current assignment Mu : U->V (a Matching) and
+        its value.
+        """
+        solver = self.solver
+        return (Matching(solver.rowMatch.copy(), solver.colMatch.copy()),
+                solver.value())
+
+def _remaining(names, removed):
+    """
+    Indices of *names left after deleting (the first occurrence
+    of) each name in *removed.
+    """
+    keep = np.ones(len(names), dtype=bool)
+    position = {}
+    for i in range(len(names)-1, -1, -1):
+        position.setdefault(names[i], []).append(i)
+    for name in removed:
+        if not position.get(name):
+            raise ValueError("[IncrementalMatcher] Unknown name: %s" % name)
+        keep[position[name].pop()] = False
+    return np.flatnonzero(keep)
+
+def _origin(mapping, real, N, oldReal, oldN):
+    """
+    Former index of each of the N (padded) vertices on one side, 
+    or -1 for new ones. Padding vertices are interchangeable and 
+    reused as far as possible. 
+    """
+    origin = -np.ones(N, dtype=np.int64)
+    origin[:real] = np.arange(real) if mapping is None else mapping
+    reuse = min(N - real, oldN - oldReal)
+    origin[real:real+reuse] = oldReal + np.arange(reuse)
+    return origin
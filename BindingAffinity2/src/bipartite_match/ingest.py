@@ -0,0 +1,375 @@
+'''
+Streaming ingestion of large protein and drug files.
+
+Names are read in chunks of about ChunkBytes and turned into their
+per-name features (see module weights) in the same pass, without
+ever building the list of names: every chunk is scanned as a byte
+array, line boundaries, stripping, vowel/letter counts and a 64-bit
+hash of each name all come out of a few cumulative sums. Only the
+hashes and the features are kept, about 32 bytes per name.
+
+Supported inputs (the format is guessed from the extension, see
+guessFormat; gzip compression from the content):
+
+     plain   one name per line, blank lines skipped (as in
+             preprocess.readNames)
+     fasta   the names are the header lines, '>' stripped; sequence
+             lines are skipped
+     csv     the names are one column (by index or by header name)
+     tsv     same, tab-separated
+
+Duplicate names are dropped by default, the first occurrence wins;
+duplicates are detected on the hashes, kept in a HashSet. With
+several workers an uncompressed file is split into byte ranges
+(aligned on line boundaries) scanned by worker processes (see
+batch.getPool); a compressed one is decompressed here and its chunks
+are scanned by the workers.
+
+e.g.
+     pfeat, dfeat = ingest('proteins.fa.gz', 'drugs.csv', workers=8)
+     W = weightMatrix(pfeat, dfeat)
+'''
+
+import os
+import csv
+import gzip
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from weights import ProteinFeatures, DrugFeatures
+
+# bytes read (and scanned) at a time
+ChunkBytes = 1 << 22
+# smallest byte range handed to a worker
+MinRangeBytes = 1 << 24
+
+Formats = ('plain', 'fasta', 'csv', 'tsv')
+
+def _table(chars):
+    t = np.zeros(256, dtype=bool)
+    t[[ord(c) for c in chars]] = True
+    return t
+
+_Space = _table(' \t\n\r\x0b\x0c')
+_Vowel = _table('aeiouAEIOU')
+_Alpha = _table('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_Continuation = np.zeros(256, dtype=bool)   # UTF-8 continuation bytes
+_Continuation[0x80:0xc0] = True
+
+# polynomial hash modulo 2^64 (an odd base is invertible)
+_Base = 0x100000001b3
+_Mask = (1 << 64) - 1
+_powers = np.ones(1, dtype=np.uint64)
+_inverses = np.ones(1, dtype=np.uint64)
+
+def _inverse(a):
+    x = a    # Newton's iteration, doubling the correct low bits each step
+    for _ in range(6):
+        x = (x * (2 - a * x)) & _Mask
+    return x
+
+def _powerTables(n):
+    """
+    Base^k and Base^-k for k < n (grown on demand).
+    """
+    global _powers, _inverses
+    if len(_powers) < n:
+        n = max(n, 2 * len(_powers))
+        _powers = np.empty(n, dtype=np.uint64)
+        _powers[0], _powers[1:] = (1, _Base)
+        np.cumprod(_powers, out=_powers)
+        _inverses = np.empty(n, dtype=np.uint64)
+        _inverses[0], _inverses[1:] = (1, _inverse(_Base))
+        np.cumprod(_inverses, out=_inverses)
+    return (_powers, _inverses)
+
+def _mix(h):
+    # splitmix64 finalizer
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xbf58476d1ce4e5b9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94d049bb133111eb)
+    h ^= h >> np.uint64(31)
+    return h
+
+def _scan(data, fasta=False):
+    """
+    Names of a block of lines (bytes) and their features.
+
+    Returns (hashes, length, nVowel, nAlpha) arrays, one entry per
+    name, in order; length is in characters (UTF-8).
+    """
+    b = np.frombuffer(data, dtype=np.uint8)
+    if not len(b):
+        return _concat([])
+    ends = np.flatnonzero(b == 10)
+    if b[-1] != 10:
+        ends = np.append(ends, len(b))
+    starts = np.append(0, ends[:-1] + 1)
+    if fasta:
+        header = (starts < ends) & (b[np.minimum(starts, len(b) - 1)] == ord('>'))
+        starts, ends = (starts[header] + 1, ends[header])
+
+    # strip: first and last non-space byte of every line
+    solid = np.flatnonzero(~_Space[b])
+    i = np.searchsorted(solid, starts)
+    j = np.searchsorted(solid, ends) - 1
+    keep = i <= j
+    first, last = (solid[i[keep]], solid[j[keep]] + 1)
+
+    def count(table):
+        c = np.zeros(len(b) + 1, dtype=np.int32)
+        np.cumsum(table[b], out=c[1:])
+        return c[last] - c[first]
+    length = (last - first) - count(_Continuation)
+
+    powers, inverses = _powerTables(len(b) + 1)
+    prefix = np.zeros(len(b) + 1, dtype=np.uint64)
+    np.cumsum(b * powers[:len(b)], out=prefix[1:])
+    hashes = (prefix[last] - prefix[first]) * inverses[first]
+    hashes ^= (last - first).astype(np.uint64)
+    return (_mix(hashes), length, count(_Vowel), count(_Alpha))
+
+def _csvNames(data, column, delimiter):
+    """
+    One column of a block of CSV lines, as plain lines (bytes).
+    """
+    if isinstance(data, str):   # Python 2
+        lines = data.splitlines()
+    else:
+        lines = data.decode('utf-8', 'surrogateescape').splitlines()
+    names = [row[column] for row in csv.reader(lines, delimiter=delimiter)
+             if len(row) > column]
+    text = '\n'.join(names)
+    return text if isinstance(text, bytes) else text.encode('utf-8', 'surrogateescape')
+
+def _scanBlock(data, fmt, column):
+    if fmt in ('csv', 'tsv'):
+        data = _csvNames(data, column, ',' if fmt == 'csv' else '\t')
+    return _scan(data, fasta=(fmt == 'fasta'))
+
+def _chunks(f, chunkBytes=ChunkBytes, size=None):
+    """
+    Blocks of whole lines read from f (at most *size bytes).
+    """
+    tail = b''
+    while size is None or size > 0:
+        data = f.read(chunkBytes if size is None else min(chunkBytes, size))
+        if not data:
+            break
+        if size is not None: size -= len(data)
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            tail += data
+            continue
+        yield tail + data[:cut]
+        tail = data[cut:]
+    if tail:
+        yield tail
+
+def _scanRange(task):
+    path, start, end, fmt, column, chunkBytes = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        parts = [_scanBlock(data, fmt, column)
+                 for data in _chunks(f, chunkBytes, end - start)]
+    return _concat(parts)
+
+def _scanChunk(task):
+    data, fmt, column = task
+    return _scanBlock(data, fmt, column)
+
+def _concat(parts):
+    if not parts:
+        return (np.zeros(0, dtype=np.uint64),) + tuple(np.zeros(0, dtype=np.int32)
+                                                       for _ in range(3))
+    return tuple(np.concatenate(p) for p in zip(*parts))
+
+class HashSet(object):
+    """
+    Set of 64-bit hashes, stored as a few sorted runs of uint64 (8
+    bytes per entry). A new run is merged with the previous one
+    while that is less than twice as large, so there are O(log n)
+    runs and every entry is merged O(log n) times.
+    """
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum([len(run) for run in self.runs])
+
+    def contains(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            i = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[i] == hashes
+        return found
+
+    def add(self, hashes):
+        """
+        Insert *hashes; returns the mask of the entries that were
+        new, i.e. not in the set nor earlier in *hashes.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        unique, first = np.unique(hashes, return_index=True)
+        new = ~self.contains(unique)
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first[new]] = True
+        run = unique[new]
+        if len(run):
+            self.runs.append(run)
+            while len(self.runs) > 1 and len(self.runs[-2]) < 2 * len(self.runs[-1]):
+                run = self.runs.pop()
+                self.runs[-1] = np.union1d(self.runs[-1], run)
+        return mask
+
+def guessFormat(path):
+    """
+    Input format from the file name, ignoring a .gz suffix.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.fa', '.fasta', '.faa', '.fna'):
+        return 'fasta'
+    if ext in ('.csv', '.tsv'):
+        return ext[1:]
+    return 'plain'
+
+def isCompressed(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+def _column(header, column, fmt):
+    if isinstance(column, int):
+        return column
+    if not isinstance(header, str): header = header.decode('utf-8')
+    header = header.rstrip('\r\n')
+    names = next(csv.reader([header], delimiter=',' if fmt == 'csv' else '\t'))
+    names = [name.strip() for name in names]
+    if column not in names:
+        raise ValueError("[ingest] No column %s in %s" % (column, names))
+    return names.index(column)
+
+def _ranges(path, start, parts):
+    """
+    About *parts byte ranges [a, b) of the file from *start on,
+    each made of whole lines.
+    """
+    size = os.path.getsize(path)
+    cuts = [start]
+    with open(path, 'rb') as f:
+        for k in range(1, parts):
+            c = start + (size - start) * k // parts
+            if c <= cuts[-1]:
+                continue
+            f.seek(c - 1)
+            f.readline()    # the line through byte c-1 belongs to the previous range
+            if cuts[-1] < f.tell() < size:
+                cuts.append(f.tell())
+    cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def _scanStream(f, fmt, column, workers, chunkBytes):
+    """
+    Scan the chunks of a (compressed) stream on the pool, at most
+    2 * *workers chunks in flight.
+    """
+    from batch import getPool
+    pool = getPool(workers)
+    pending = deque()
+    for data in _chunks(f, chunkBytes):
+        pending.append(pool.apply_async(_scanChunk, ((data, fmt, column),)))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def scanFile(path, fmt=None, column=0, header=None, workers=1, chunkBytes=ChunkBytes):
+    """
+    Yields (hashes, length, nVowel, nAlpha) arrays for consecutive
+    blocks of the names in *path (see module docstring).
+
+    *fmt: one of Formats (default: guessFormat(path))
+    *column: index or header name of the column of names (csv, tsv)
+    *header: if True, the first line is a header (default: True for
+             csv and tsv)
+    *workers: number of worker processes; 1 scans in this process
+    """
+    if fmt is None: fmt = guessFormat(path)
+    if fmt not in Formats:
+        raise ValueError("[scanFile] Unknown format %s, expected one of %s" % \
+                           (fmt, ', '.join(Formats)))
+    if header is None: header = fmt in ('csv', 'tsv')
+    if not header and not isinstance(column, int):
+        raise ValueError("[scanFile] Column %s needs a header line" % column)
+    if workers is None: workers = multiprocessing.cpu_count()
+    compressed = isCompressed(path)
+    f = gzip.open(path, 'rb') if compressed else open(path, 'rb')
+    try:
+        if header:
+            column = _column(f.readline(), column, fmt)
+        ranges = []
+        if workers > 1 and not compressed:
+            start = f.tell()
+            parts = min(4 * workers, (os.path.getsize(path) - start) // MinRangeBytes)
+            ranges = _ranges(path, start, parts) if parts > 1 else []
+
+        if len(ranges) > 1:
+            from batch import getPool
+            tasks = [(path, a, b, fmt, column, chunkBytes) for a, b in ranges]
+            for part in getPool(workers).imap(_scanRange, tasks):   # in file order
+                yield part
+        elif workers > 1 and compressed:
+            for part in _scanStream(f, fmt, column, workers, chunkBytes):
+                yield part
+        else:
+            for data in _chunks(f, chunkBytes):
+                yield _scanBlock(data, fmt, column)
+    finally:
+        f.close()
+
+def readFeatures(path, kind='protein', unique=True, **options):
+    """
+    Per-name features of the names in *path: ProteinFeatures if
+    *kind is 'protein', DrugFeatures if 'drug' (as given by
+    weights.proteinFeatures and weights.drugFeatures).
+
+    *unique: if True, drop repeated names (first one kept)
+    *options: see scanFile
+
+    [note] 1. names are compared by 64-bit hash; for n names the
+              chance of a collision is about n^2 / 2^65
+    """
+    if kind not in ('protein', 'drug'):
+        raise ValueError("[readFeatures] Unknown kind: %s" % kind)
+    seen = HashSet() if unique else None
+    columns = ([], [], []) if kind == 'drug' else ([],)
+    for hashes, length, nVowel, nAlpha in scanFile(path, **options):
+        if seen is not None:
+            new = seen.add(hashes)   # [1]
+            length, nVowel, nAlpha = (length[new], nVowel[new], nAlpha[new])
+        for parts, values in zip(columns, (length, nVowel, nAlpha)):
+            parts.append(values)
+
+    # the parts of a feature are dropped once it is concatenated, so at
+    # most one feature is held twice
+    total = sum([len(p) for p in columns[0]])
+    out = []
+    for parts in columns:
+        out.append(np.concatenate(parts, out=np.empty(total, dtype=np.int64)) \
+                   if parts else np.zeros(0, dtype=np.int64))
+        del parts[:]
+    if kind == 'protein':
+        return ProteinFeatures(out[0])
+    out[2] -= out[1]    # consonants = letters - vowels
+    return DrugFeatures(out[0], out[1], out[2])
+
+def ingest(proteinFile, drugFile, unique=True, **options):
+    """
+    Features of both input files, (pfeat, dfeat); see readFeatures.
+    """
+    return (readFeatures(proteinFile, 'protein', unique, **options),
+            readFeatures(drugFile, 'drug', unique, **options))
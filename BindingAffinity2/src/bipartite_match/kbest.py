@@ -0,0 +1,168 @@
+'''
+K-best assignments, Murty's algorithm.
+
+The assignments of a weight matrix are enumerated by decreasing
+value (increasing cost with _flip=True). Every node of the search is
+a subproblem, the assignments that contain the edges of a set I and
+none of a set X, together with its best assignment M. When a node is
+popped from the priority queue, M is reported and the rest of the
+subproblem is partitioned among children: with e1, ..., ek the edges
+of M not in I, child i requires e1, ..., e(i-1) and forbids ei.
+
+Constraints are imposed by lowering weights to a penalty below any
+feasible assignment: a forbidden edge, and every other edge in the
+row and column of a required one. Weights only go down, so the dual
+labels of the parent stay feasible and M minus ei stays tight: each
+child is warm-started (see HungarianSolver.warmStart) with a single
+free row and costs one augmenting path, O(n^2), instead of a full
+solve. A child whose best assignment uses a penalized edge has no
+assignment at all and is dropped.
+
+The children of a node are solved in parallel on the worker
+processes of batch.getPool, the weight matrix being shared through a
+memory-mapped file as in module batch. Results are generated lazily:
+nothing is expanded beyond the assignments the caller asks for.
+
+e.g.
+     for Mu, Mv, val in kBestMatching(W, k=10, workers=4):
+         print("%f %s" % (val, Mu))
+'''
+
+import heapq
+
+import numpy as np
+
+from maxWBiMatch import HungarianSolver
+from matching import Matching
+
+def _penalized(W, included, excluded, low):
+    """
+    Copy of W with the edges ruled out by the constraints set to
+    *low.
+    """
+    Wc = np.array(W, dtype=np.float64)
+    if len(included):
+        rows, cols = (included[:, 0], included[:, 1])
+        kept = Wc[rows, cols]
+        Wc[rows, :] = low
+        Wc[:, cols] = low
+        Wc[rows, cols] = kept
+    if len(excluded):
+        Wc[excluded[:, 0], excluded[:, 1]] = low
+    return Wc
+
+def _solveChild(W, included, excluded, lu, lv, rowMatch, freeRow, low):
+    """
+    Best assignment of a child subproblem, warm-started from the
+    parent's labels and assignment without *freeRow.
+
+    Returns (value, rowMatch, lu, lv), or None if infeasible.
+    """
+    Wc = _penalized(W, included, excluded, low)
+    solver = HungarianSolver(Wc)
+    start = rowMatch.copy()
+    start[freeRow] = -1
+    m, n = Wc.shape
+    if m < n:
+        # [note] with m < n a free column must have a zero label;
+        #        raising the row labels to stay feasible may loosen
+        #        matched edges, whose columns are freed in turn
+        lu, lv = (lu.copy(), lv.copy())
+        freed = [rowMatch[freeRow]]
+        while freed:
+            lv[freed] = 0
+            lu = np.maximum(lu, Wc[:, freed].max(axis=1))
+            rows = np.flatnonzero(start >= 0)
+            loose = rows[lu[rows] + lv[start[rows]] != Wc[rows, start[rows]]]
+            freed = start[loose][lv[start[loose]] != 0].tolist()
+            start[loose] = -1
+    solver.warmStart(lu, lv, start)
+    solver.solve(warm=True)
+    rows = np.arange(len(Wc))
+    if (Wc[rows, solver.rowMatch] == low).any():
+        return None
+    return (W[rows, solver.rowMatch].sum(), solver.rowMatch.copy(),
+            solver.lu.copy(), solver.lv.copy())
+
+def _childTask(task):
+    from batch import mapShared
+    return _solveChild(mapShared(task[:3]), *task[3:])
+
+def _children(node, W, low, pool, shared):
+    """
+    Solve the children of *node; returns their nodes (feasible
+    ones only).
+    """
+    _, _, included, excluded, rowMatch, lu, lv = node
+    fixed = set(included[:, 0].tolist())
+    free = [u for u in range(len(rowMatch)) if u not in fixed]
+    args = []
+    for i, u in enumerate(free):
+        inc = np.vstack([included] + [[(r, rowMatch[r])] for r in free[:i]]).astype(np.int64)
+        exc = np.vstack([excluded, [(u, rowMatch[u])]]).astype(np.int64)
+        args.append((inc, exc, lu, lv, rowMatch, u, low))
+    if pool is None:
+        results = [_solveChild(W, *a) for a in args]
+    else:
+        results = pool.map(_childTask, [shared + a for a in args])
+    return [(inc, exc, result) for (inc, exc, _, _, _, _, _), result in zip(args, results)
+            if result is not None]
+
+def kBestMatching(weights, k=None, _flip=False, workers=1):
+    """
+    Generate the assignments of *weights as (Mu, Mv, value), best
+    first, at most *k of them (all of them if None).
+
+    *_flip: if True, treat *weights as a cost matrix
+    *workers: # of worker processes solving the children of a node
+              (see batch.getPool); 1 solves them in this process
+
+    [note] 1. every assignment is generated exactly once; equal
+              values come out in no particular order
+           2. the weight matrix may be rectangular, as for
+              maxProfitMatching
+    """
+    W = np.asarray(weights)
+    transposed = W.ndim == 2 and W.shape[0] > W.shape[1]
+    if transposed: W = W.T
+    sign = -1 if _flip else 1
+    W = np.ascontiguousarray(sign * W, dtype=np.float64)   # maximize profit
+    m, n = W.shape
+    # below the value of any feasible assignment, whatever the edge
+    hi, lo = ((W.max(), W.min()) if W.size else (0.0, 0.0))
+    low = lo - (m * (hi - lo) + 1.0)
+
+    def result(rowMatch, value):
+        Mu = Matching(rowMatch, nCols=n)
+        if transposed:
+            return (Mu.inverse(), Mu, sign * value)
+        return (Mu, Mu.inverse(), sign * value)
+
+    root = HungarianSolver(W)
+    root.solve()
+    none = np.zeros((0, 2), dtype=np.int64)
+    rowMatch = root.rowMatch.copy()
+    heap = [(-W[np.arange(m), rowMatch].sum(), 0, none, none, rowMatch,
+             root.lu.astype(np.float64), root.lv.astype(np.float64))]
+    count = 1
+
+    pool, shared, files = (None, None, None)   # files: a batch.SharedWeights
+    try:
+        generated = 0
+        while heap and (k is None or generated < k):
+            node = heapq.heappop(heap)
+            yield result(node[4], -node[0])
+            generated += 1
+            if k is not None and generated >= k:
+                break
+            if workers != 1 and pool is None:
+                from batch import getPool, SharedWeights
+                pool = getPool(workers)
+                files = SharedWeights('kbest-')
+                shared = files.add(W, 'W')
+            for inc, exc, (value, rowMatch, lu, lv) in _children(node, W, low, pool, shared):
+                heapq.heappush(heap, (-value, count, inc, exc, rowMatch, lu, lv))
+                count += 1
+    finally:
+        if files is not None:
+            files.close()
@@ -7,7 +7,8 @@ Main entry for finding optimal assignments
 between proteins and drugs in terms of their 
 maximum binding affinity. 
 
-Usage : python match.py file-1 file-2
+Usage : python match.py [--benchmark] [--no-cache] [--backend NAME]
+                        [--exact] file-1 file-2
         where file-1 holds newline separated protein names
               file-2 holds newline separated drug names 
 '''
@@ -16,18 +17,74 @@ Usage : python match.py file-1 file-2
 #       timeMatching, evalWeights, benchmark
        
 # from maxWBiMatch import maxProfitMatching, minCostMatching
-import affinity
+# [note] affinity (numpy, the solvers) is imported in main(), after 
+#        the command line is parsed, so that --help and usage errors 
+#        return at once 
+import sys
+import argparse
 
-def main(verbose=False):
-    if not verbose: 
-        assignments, value = affinity.evalOptAssignment()
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description='Optimal assignment of drugs '
+                                     'to proteins by maximum binding affinity.')
+    parser.add_argument('protein_file', help='newline-separated protein names')
+    parser.add_argument('drug_file', help='newline-separated drug names')
+    parser.add_argument('--benchmark', action='store_true', 
+                        help='time every stage and solver backend instead')
+    parser.add_argument('--no-cache', action='store_true', 
+                        help='do not reuse inputs and weights of earlier runs')
+    parser.add_argument('--backend', default=None, 
+                        help='solver backend (default: the fastest available)')
+    parser.add_argument('--exact', action='store_true', 
+                        help='solve on integer weights (see weights.WeightScale)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    *argv: command line arguments (default: sys.argv[1:]); see 
+           parseArgs(). Without --no-cache, parsed inputs and the 
+           weight matrix of earlier runs on the same files are 
+           reused (see module cache); with --exact, the weights 
+           are integers (exact mode, see weights.weightMatrix) 
+    """
+    args = parseArgs(argv)
+    import preprocess
+    preprocess.setInputFiles(args.protein_file, args.drug_file)
+    import affinity
+    
+    if not args.benchmark: 
+        from weights import WeightScale
+        scale = WeightScale if args.exact else 1
+        assignments, value = solve(args)
         msg = "> Assignment:\n%s\n" % assignments 
-        msg += "> BA value:  \n%f\n" % value
-        print msg
+        msg += "> BA value:  \n%f\n" % (float(value) / scale)
+        print(msg)
     else: 
         affinity.benchmark()
+    return 0
+
+def solve(args):
+    """
+    Optimal assignment of the input files set by main(), as options 
+    *args (see parseArgs()) ask; returns the MatchResult of 
+    affinity.evalOptAssignment, value in units of the weights. 
+    """
+    import affinity
+    import numpy as np
+    from cache import Cache
+    W = affinity.evalWeights(dtype=np.int64 if args.exact else np.float64, 
+                             cache=None if args.no_cache else Cache())
+    return affinity.evalOptAssignment(W, backend=args.backend)
+
+def testPresolve(protein_file='proteins.txt', drug_file='drugs.txt'):
+    # the command line solves the bundled inputs presolved, with or 
+    # without a chosen backend
+    import preprocess
+    preprocess.setInputFiles(protein_file, drug_file)
+    for argv in ([], ['--backend', 'python'], ['--exact', '--no-cache']):
+        result = solve(parseArgs([protein_file, drug_file] + argv))
+        assert 'presolve' in result.meta, "[testPresolve] Not presolved: %s" % argv
+        print("%s -> %s" % (argv, result.meta['presolve']))
     return
 
 if __name__ == "__main__":
-    main()
-
+    sys.exit(main())
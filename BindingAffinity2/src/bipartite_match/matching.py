@@ -0,0 +1,273 @@
+'''
+Compact representation of a matching.
+
+A Matching holds the row -> column (rowMatch) and column -> row
+(colMatch) assignments as int32 arrays, -1 marking a free vertex,
+instead of a pair of dictionaries Mu, Mv. It still reads like Mu
+(M[u], M.get(u), M.items(), dict(M), ...), M.inverse() is Mv without
+copying anything, np.asarray(M) is rowMatch, and the value of the
+matching is a single gather, W[rows, cols].sum().
+
+A MultiMatching is the same for b-matchings, in which a row may be
+matched to several columns and vice versa (see
+transport.capacitatedMatching): the columns of every row are held
+contiguously in one array, in compressed sparse row form.
+
+e.g.
+     Mu, Mv, val = maxProfitMatching(W)
+     assert Mu.score(W) == val and Mv[Mu[0]] == 0
+'''
+
+import numpy as np
+
+class Matching(object):
+    """
+    Matching between the m rows and the n columns of a weight
+    matrix.
+
+    *rowMatch: column of each row, -1 if free
+    *colMatch: row of each column, -1 if free; derived from
+               *rowMatch (with n = *nCols) if not given
+    """
+    def __init__(self, rowMatch, colMatch=None, nCols=None):
+        self.rowMatch = np.asarray(rowMatch, dtype=np.int32)
+        if colMatch is None:
+            matched = self.rowMatch >= 0
+            if nCols is None:
+                nCols = int(self.rowMatch.max()) + 1 if matched.any() else 0
+            colMatch = -np.ones(nCols, dtype=np.int32)
+            colMatch[self.rowMatch[matched]] = np.flatnonzero(matched)
+        self.colMatch = np.asarray(colMatch, dtype=np.int32)
+
+    @classmethod
+    def fromDict(cls, M, shape=None):
+        """
+        Matching of a dictionary Mu : U->V (or a list of pairs).
+        """
+        pairs = list(M.items()) if hasattr(M, 'items') else list(M)
+        rows = np.array([u for u, _ in pairs], dtype=np.int64)
+        cols = np.array([v for _, v in pairs], dtype=np.int64)
+        m, n = shape if shape is not None else \
+                (rows.max() + 1 if len(rows) else 0, cols.max() + 1 if len(cols) else 0)
+        rowMatch = -np.ones(m, dtype=np.int32)
+        rowMatch[rows] = cols
+        return cls(rowMatch, nCols=n)
+
+    @property
+    def shape(self):
+        return (len(self.rowMatch), len(self.colMatch))
+
+    def inverse(self):
+        """
+        The same matching seen from the columns (Mv); shares the
+        arrays.
+        """
+        return Matching(self.colMatch, self.rowMatch)
+
+    def rows(self):
+        """
+        Matched rows, in increasing order.
+        """
+        return np.flatnonzero(self.rowMatch >= 0)
+
+    def cols(self):
+        """
+        Columns of the matched rows, in the order of rows().
+        """
+        return self.rowMatch[self.rowMatch >= 0]
+
+    def score(self, W, _T=False):
+        """
+        Total weight of the matching under W (under W^T if *_T).
+        """
+        rows, cols = (self.rows(), self.cols())
+        if _T: rows, cols = (cols, rows)
+        if not isinstance(W, np.ndarray) and getattr(W, 'lazyRows', False):
+            return sum([W[u, v] for u, v in zip(rows.tolist(), cols.tolist())])
+        return np.asarray(W)[rows, cols].sum()
+
+    # dictionary interface, as Mu : U->V
+    def __getitem__(self, u):
+        v = self.rowMatch[u] if 0 <= u < len(self.rowMatch) else -1
+        if v < 0:
+            raise KeyError(u)
+        return int(v)
+
+    def get(self, u, default=None):
+        return self[u] if u in self else default
+
+    def __contains__(self, u):
+        return 0 <= u < len(self.rowMatch) and self.rowMatch[u] >= 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.rowMatch >= 0))
+
+    def keys(self):
+        return self.rows().tolist()
+
+    def values(self):
+        return self.cols().tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def toDict(self):
+        return dict(self.items())
+
+    def pairs(self):
+        """
+        The matching as a list of (row, column) tuples.
+        """
+        return self.items()
+
+    def __array__(self, dtype=None, copy=None):
+        return self.rowMatch if dtype is None else self.rowMatch.astype(dtype)
+
+    def __eq__(self, other):
+        if isinstance(other, Matching):
+            return np.array_equal(self.rowMatch, other.rowMatch) and \
+                    np.array_equal(self.colMatch, other.colMatch)
+        if isinstance(other, dict):
+            return self.toDict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self.pairs())
+
+    def __repr__(self):
+        return 'Matching(%d pairs, %d x %d)' % ((len(self),) + self.shape)
+
+class MultiMatching(object):
+    """
+    Matching between the m rows and the n columns of a weight
+    matrix in which a row (column) may have several columns (rows).
+
+    *rowStart: the columns of row u are cols[rowStart[u]:rowStart[u+1]]
+    *cols: columns of all the rows, by row, increasing within a row
+    *nCols: # of columns
+    """
+    def __init__(self, rowStart, cols, nCols):
+        self.rowStart = np.asarray(rowStart, dtype=np.int64)
+        self.colIndex = np.asarray(cols, dtype=np.int32)
+        self.nCols = int(nCols)
+
+    @classmethod
+    def fromPairs(cls, rows, cols, shape):
+        """
+        MultiMatching of the pairs (rows[k], cols[k]) of an m x n
+        (*shape) matrix.
+        """
+        rows, cols = (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))
+        order = np.lexsort((cols, rows))
+        counts = np.bincount(rows, minlength=shape[0])
+        rowStart = np.concatenate([[0], np.cumsum(counts)])
+        return cls(rowStart, cols[order], shape[1])
+
+    @property
+    def shape(self):
+        return (len(self.rowStart) - 1, self.nCols)
+
+    def degrees(self):
+        """
+        # of columns of every row.
+        """
+        return np.diff(self.rowStart)
+
+    def rows(self):
+        """
+        Row of every pair, in the order of cols().
+        """
+        return np.repeat(np.arange(self.shape[0]), self.degrees())
+
+    def cols(self):
+        """
+        Column of every pair, by row.
+        """
+        return self.colIndex
+
+    def inverse(self):
+        """
+        The same matching seen from the columns (Mv).
+        """
+        return MultiMatching.fromPairs(self.cols(), self.rows(), self.shape[::-1])
+
+    def score(self, W, _T=False):
+        """
+        Total weight of the matching under W (under W^T if *_T).
+        """
+        rows, cols = (self.rows(), self.cols())
+        if _T: rows, cols = (cols, rows)
+        return np.asarray(W)[rows, cols].sum()
+
+    # dictionary interface, as Mu : U->[V]
+    def __getitem__(self, u):
+        if u not in self:
+            raise KeyError(u)
+        return self.colIndex[self.rowStart[u]:self.rowStart[u+1]].tolist()
+
+    def get(self, u, default=None):
+        return self[u] if u in self else default
+
+    def __contains__(self, u):
+        return 0 <= u < self.shape[0] and self.rowStart[u+1] > self.rowStart[u]
+
+    def __len__(self):
+        """
+        # of pairs.
+        """
+        return len(self.colIndex)
+
+    def keys(self):
+        return np.flatnonzero(self.degrees() > 0).tolist()
+
+    def items(self):
+        return [(u, self[u]) for u in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def toDict(self):
+        return dict(self.items())
+
+    def pairs(self):
+        """
+        The matching as a list of (row, column) tuples.
+        """
+        return list(zip(self.rows().tolist(), self.cols().tolist()))
+
+    def __eq__(self, other):
+        if isinstance(other, MultiMatching):
+            return self.nCols == other.nCols and \
+                    np.array_equal(self.rowStart, other.rowStart) and \
+                    np.array_equal(self.colIndex, other.colIndex)
+        if isinstance(other, dict):
+            return self.toDict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self.pairs())
+
+    def __repr__(self):
+        return 'MultiMatching(%d pairs, %d x %d)' % ((len(self),) + self.shape)
+
+def asMatching(M, shape=None):
+    """
+    M as a Matching; a mapping U->V (or a list of pairs) is
+    converted, see Matching.fromDict.
+    """
+    return M if isinstance(M, Matching) else Matching.fromDict(M, shape)
@@ -11,82 +11,327 @@ for min weight matching, simply negate the weights.
             3. https://pypi.python.org/pypi/munkres
 
 
-Global variables:
+Solver state (see HungarianSolver):
        n = number of vertices on each side
-       U,V vertex sets
+       U,V vertex sets, i.e. row and column indices of w 
        lu,lv are the labels of U and V resp.
        the matching is encoded as 
-       - a mapping Mu from U to V, 
-       - and Mv from V to U.
+       - an array rowMatch from U to V (Mu), 
+       - and colMatch from V to U (Mv); -1 marks a free vertex.
     
     The algorithm repeatedly builds an alternating tree, rooted in a
-    free vertex u0. S is the set of vertices in U covered by the tree.
-    For every vertex v, T[v] is the parent in the tree and Mv[v] the
+    free vertex u0. S is the set of vertices in U covered by the tree
+    and T the set of vertices in V covered by it. For every vertex v 
+    in T, parent[v] is the parent in the tree and colMatch[v] the
     child.
 
-    The algorithm maintains minSlack, s.t. for every vertex v not in
-    T, minSlack[v]=(val,u1), where val is the minimum slack
-    lu[u] + lv[v] - w[u][v] over u in S, and u1 is the vertex that
-    realizes this minimum.
+    The algorithm maintains slack and slackU, s.t. for every vertex 
+    v not in T, slack[v] is the minimum slack lu[u] + lv[v] - w[u][v]
+    over u in S, and slackU[v] is the vertex u that realizes this 
+    minimum.
 
     Complexity is O(n^3), because there are n iterations in
-    maxWeightMatching, and each call to augment costs O(n^2). This is
+    solve(), and each call to augment costs O(n^2). This is
     because augment() makes at most n iterations itself, and each
-    updating of minSlack costs O(n).
+    (vectorized) update of slack costs O(n).
 """
 
 import numpy as np
 import sys
 
-def improveLabels(val):
-    """ 
-    Change the labels, and maintain minSlack. 
+from result import MatchResult
+from matching import Matching
+from timer import Timer
+
+class SolverStats(object):
     """
-    for u in S:
-        lu[u] -= val
-    for v in V:
-        if v in T:
-            lv[v] += val
-        else:
-            minSlack[v][0] -= val
+    Counters and timers of the internals of a HungarianSolver,
+    filled in only when requested (see HungarianSolver).
 
-def improveMatching(v):
-    """ 
-    Apply the alternating path from v to the root in the tree. 
+       augments       # of augmenting paths, i.e. calls to augment()
+       treeSteps      # of rows added to the alternating trees
+       labelUpdates   # of calls to improveLabels()
+       slackUpdates   # of slack entries examined by addToTree()
+       pathLengths    # of matched edges flipped by each augmenting path
+       time           seconds spent in each phase ('init', 'augment')
     """
-    u = T[v]
-    if u in Mu:
-        improveMatching(Mu[u])
-    Mu[u] = v
-    Mv[v] = u
+    def __init__(self):
+        self.augments = 0
+        self.treeSteps = 0
+        self.labelUpdates = 0
+        self.slackUpdates = 0
+        self.pathLengths = []
+        self.time = {'init': 0.0, 'augment': 0.0}
 
-def slack(u,v): return lu[u]+lv[v]-w[u][v]
+    def record(self, steps, labels, length, n):
+        """
+        Account for one augment() that took *steps tree steps and
+        *labels label updates and flipped a path of *length, on a
+        graph with n vertices in V.
+        """
+        self.augments += 1
+        self.treeSteps += steps
+        self.labelUpdates += labels
+        self.slackUpdates += steps * n    # one addToTree() per step
+        self.pathLengths.append(length)
 
-def augment():
-    """ 
-    Augment the matching, possibly improving the labels on the way.
+    def asDict(self):
+        lengths = self.pathLengths
+        return {'augments': self.augments, 'treeSteps': self.treeSteps,
+                'labelUpdates': self.labelUpdates, 'slackUpdates': self.slackUpdates,
+                'maxPathLength': max(lengths) if lengths else 0,
+                'meanPathLength': float(np.mean(lengths)) if lengths else 0.0,
+                'time': dict(self.time)}
+
+    def __repr__(self):
+        return 'SolverStats(%s)' % ', '.join(['%s=%s' % kv for kv in sorted(self.asDict().items())])
+
+class HungarianSolver(object):
+    """
+    Array-based Kuhn-Munkres solver for the maximum-profit 
+    assignment problem. 
+    
+    All the state lives in the solver object (preallocated 
+    arrays for labels, slack, tree masks, etc.), so that 
+    independent solves can run side by side in one process. 
+    
+    *weights: m x n profit matrix with m <= n; every vertex of U 
+              (row) gets matched, n - m vertices of V stay free. 
+              This costs O(m^2 n), i.e. no padding to n x n needed. 
+              Only rows, column maxima (minima) and single entries 
+              are read, so a memory-mapped matrix or a 
+              tiled.TiledWeights works without loading it [1]
+    *_flip: if True, treat *weights as a cost matrix; i.e. 
+            maximize the profit -weights 
+    *stats: True or a SolverStats to fill in; solve() then returns
+            a MatchResult with the SolverStats in .meta['stats'] [2]
+    *hook: called as hook(event, stats) after every augmenting
+           path (event 'augment') and at the end of solve()
+           ('done'); implies *stats
+    
+    [note] 1. int64 and floating point weights are used as they 
+              are, other dtypes are converted (which loads them; 
+              lazy matrices must have one of those dtypes)
+           2. disabled (the default), instrumentation costs one
+              test per augmenting path
     """
-    while True:
-        # select edge (u,v) with u in S, v not in T and min slack
-        ((val, u), v) = min([(minSlack[v], v) for v in V if v not in T])
-        assert u in S
-        if val>0:        
-            improveLabels(val)
-        # now we are sure that (u,v) is saturated
-        assert slack(u,v)==0
-        T[v] = u                            # add (u,v) to the tree
-        if v in Mv:
-            u1 = Mv[v]                      # matched edge, 
-            assert not u1 in S
-            S[u1] = True                    # ... add endpoint to tree 
-            for v in V:                     # maintain minSlack
-                if not v in T and minSlack[v][0] > slack(u1,v):
-                    minSlack[v] = [slack(u1,v), u1]
+    def __init__(self, weights, _flip=False, stats=None, hook=None):
+        w = weights if getattr(weights, 'lazyRows', False) else np.asarray(weights)
+        if w.dtype != np.int64 and w.dtype.kind != 'f': 
+            if not isinstance(w, np.ndarray): 
+                raise ValueError("[HungarianSolver] Lazy weights must be int64 or "
+                                 "floating point: %s" % str(w.dtype))
+            w = w.astype(np.int64 if w.dtype.kind in 'biu' else np.float64)
+        if w.ndim != 2 or w.shape[0] > w.shape[1]: 
+            raise ValueError("[HungarianSolver] Need an m x n weight matrix, m <= n: %s" % \
+                               str(w.shape))
+        self.w = w
+        self.sign = -1 if _flip else 1   # more profit is equivalent to less cost
+        self.m, self.n = m, n = w.shape
+        
+        # labels are kept in the precision of the weights 
+        dtype = np.int64 if w.dtype.kind == 'i' else np.float64
+        self.lu = np.zeros(m, dtype=dtype)
+        self.lv = np.zeros(n, dtype=dtype)
+        self.rowMatch = -np.ones(m, dtype=np.int64)   # Mu
+        self.colMatch = -np.ones(n, dtype=np.int64)   # Mv
+        
+        # alternating tree 
+        self.S = np.zeros(m, dtype=bool)
+        self.T = np.zeros(n, dtype=bool)
+        self.parent = -np.ones(n, dtype=np.int64)
+        self.slack = np.zeros(n, dtype=np.float64)
+        self.slackU = np.zeros(n, dtype=np.int64)
+        
+        if hook is not None and not stats: stats = True
+        self.stats = SolverStats() if stats is True else (stats or None)
+        self.hook = hook
+        
+    def row(self, u):
+        """
+        Profit of assigning u to each vertex in V. 
+        """
+        return self.w[u] if self.sign > 0 else -self.w[u]
+        
+    def initLabels(self):
+        """
+        Start with column maxima as labels of V, the tightest 
+        feasible labels of U given those, and greedily match 
+        along the tight edges. 
+        
+        [note] 1. on rectangular matrices free vertices of V must 
+                  end with zero labels; start with lv = 0 instead
+        """
+        if self.m < self.n:   # [1] 
+            self.lv[:] = 0
+        elif self.sign > 0: 
+            self.lv[:] = self.w.max(axis=0)
+        else: 
+            self.lv[:] = -self.w.min(axis=0)
+        self.rowMatch[:] = -1
+        self.colMatch[:] = -1
+        for u in range(self.m): 
+            reduced = self.row(u) - self.lv
+            self.lu[u] = reduced.max()
+            tight = np.flatnonzero(reduced == self.lu[u])
+            free = tight[self.colMatch[tight] < 0]
+            if len(free): 
+                v = free[0]
+                self.rowMatch[u] = v
+                self.colMatch[v] = u
+        return
+    
+    def improveLabels(self, val):
+        """ 
+        Change the labels, and maintain slack. 
+        """
+        val = self.lu.dtype.type(val)
+        self.lu[self.S] -= val
+        self.lv[self.T] += val
+        self.slack -= val     # no-op on T, where slack is infinite
+        
+    def improveMatching(self, v):
+        """ 
+        Apply the alternating path from v to the root in the tree. 
+        Returns the # of matched edges flipped.
+        """
+        rowMatch, colMatch, parent = (self.rowMatch, self.colMatch, self.parent)
+        length = -1
+        while v >= 0: 
+            u = parent[v]
+            v1 = rowMatch[u]
+            rowMatch[u] = v
+            colMatch[v] = u
+            v = v1
+            length += 1
+        return length
+            
+    def addToTree(self, u):
+        """
+        Add u to S and maintain slack over the vertices not in T. 
+        """
+        self.S[u] = True
+        slack_u = self.lu[u] + self.lv - self.row(u)
+        better = slack_u < self.slack
+        better &= ~self.T
+        self.slack[better] = slack_u[better]
+        self.slackU[better] = u
+        
+    def augment(self, u0):
+        """ 
+        Augment the matching by growing the alternating tree 
+        from the free vertex u0, improving the labels on the way.
+        """
+        self.S[:] = False
+        self.T[:] = False
+        self.slack[:] = np.inf
+        free = self.colMatch < 0
+        self.addToTree(u0)
+        steps, labels = (1, 0)
+        while True:
+            # select edge (u,v) with u in S, v not in T and min slack
+            v = int(np.argmin(self.slack))
+            val = self.slack[v]
+            if val > 0: 
+                self.improveLabels(val)
+                labels += 1
+            # among the saturated edges, prefer one to a free vertex
+            # (cuts the tree short on tie-heavy weights)
+            if not free[v]: 
+                saturated = np.flatnonzero((self.slack <= 0) & free)
+                if len(saturated): 
+                    v = int(saturated[0])
+            # now (u,v) is saturated (up to rounding)
+            self.parent[v] = self.slackU[v]   # add (u,v) to the tree
+            self.T[v] = True
+            self.slack[v] = np.inf
+            u1 = self.colMatch[v]
+            if u1 < 0: 
+                length = self.improveMatching(v)       # v is a free vertex
+                if self.stats is not None:
+                    self.stats.record(steps, labels, length, self.n)
+                return
+            self.addToTree(u1)                # matched edge, add endpoint to tree
+            steps += 1
+            
+    def value(self): 
+        """
+        Value of the matching, i.e. total edge weight, which 
+        equals the sum of the labels at the optimum. 
+        """
+        val = self.lu.sum() + self.lv.sum()
+        return self.sign * val
+            
+    def warmStart(self, lu, lv, rowMatch):
+        """
+        Start from the labels and the matching of a previous solve 
+        on a (slightly) different weight matrix, e.g. after rows or 
+        columns were inserted or deleted. 
+        
+        Labels of new vertices are given as NaN and are set to 
+        the smallest value keeping all the labels feasible; matched 
+        edges that are no longer tight are dropped, so that only 
+        the affected vertices have to be augmented again. 
+        """
+        lu = np.array(lu, dtype=np.float64)
+        lv = np.array(lv, dtype=np.float64)
+        newU, newV = (np.isnan(lu), np.isnan(lv))
+        oldU = np.flatnonzero(~newU)
+        if newV.any(): 
+            cols = np.flatnonzero(newV)
+            if len(oldU): 
+                w = self.sign * self.w[np.ix_(oldU, cols)]
+                lv[cols] = (w - lu[oldU][:, None]).max(axis=0)
+            else: 
+                lv[cols] = 0
+        for u in np.flatnonzero(newU): 
+            lu[u] = (self.row(u) - lv).max()
+        self.lu[:] = lu
+        self.lv[:] = lv
+        
+        self.rowMatch[:] = -1
+        self.colMatch[:] = -1
+        for u, v in enumerate(rowMatch): 
+            if v >= 0 and self.colMatch[v] < 0 and \
+                    self.lu[u] + self.lv[v] == self.sign * self.w[u, v]: 
+                self.rowMatch[u] = v
+                self.colMatch[v] = u
+        return
+            
+    def solve(self, warm=False):
+        """
+        Returns the mappings Mu : U->V, Mv : V->U encoding the 
+        matching (as Matching objects, Mv = Mu.inverse()) as well
+        as the value of it.
+        
+        *warm: if True, continue from the current labels and 
+               matching (see warmStart()) 
+        """
+        stats, hook = (self.stats, self.hook)
+        if stats is None:
+            if not warm:
+                self.initLabels()
+            for u0 in np.flatnonzero(self.rowMatch < 0):
+                self.augment(u0)
         else:
-            improveMatching(v)              # v is a free vertex
-            return
+            with Timer() as t:
+                if not warm:
+                    self.initLabels()
+            stats.time['init'] += t.interval
+            with Timer() as t:
+                for u0 in np.flatnonzero(self.rowMatch < 0):
+                    self.augment(u0)
+                    if hook is not None: hook('augment', stats)
+            stats.time['augment'] += t.interval
 
-def maxProfitMatching(weights, _flip=False):  # minimum cost
+        Mu = Matching(self.rowMatch.copy(), self.colMatch.copy())
+        Mv = Mu.inverse()
+        if stats is None:
+            return (Mu, Mv, self.value())
+        if hook is not None: hook('done', stats)
+        return MatchResult((Mu, Mv, self.value()), stats=stats)
+    
+def maxProfitMatching(weights, _flip=False, stats=None, hook=None, duals=False):  # minimum cost
     """ 
     Compute best assignment of maximum profit; i.e. each weight 
     represents profile (rather than cost).  
@@ -96,31 +341,29 @@ def maxProfitMatching(weights, _flip=False):  # minimum cost
     as well as the value of it.
     
     *_flip: if True, convert input weight matrix to cost matrix 
-    """
-    global U,V,S,T,Mu,Mv,lu,lv, minSlack, w
+    *stats, *hook: solver instrumentation, see HungarianSolver
+    *duals: if True, return a MatchResult with the final labels 
+            (lu of the rows, lv of the columns of *weights) in 
+            .meta['duals'], a certificate of optimality (see 
+            module verify) 
     
-    w  = np.array(weights)
-    if _flip: 
-        w = -w   # more profit is equivalent to less cost
-        
-    n  = len(w)
-    U  = V = range(n)
-    lu = [ max([w[u][v] for v in V]) for u in U]  # start with trivial labels
-    lv = [ 0                         for v in V]
-    Mu = {}                                       # start with empty matching
-    Mv = {}
-    while len(Mu)<n:
-        free = [u for u in V if u not in Mu]      # choose free vertex u0
-        u0 = free[0]
-        S = {u0: True}                            # grow tree from u0 on
-        T = {}
-        minSlack = [[slack(u0,v), u0] for v in V]
-        augment()
-    
-    # val. of matching is total edge weight 
-    val = sum(lu)+sum(lv)
-    
-    return (Mu, Mv, 0.0-val if _flip else val)
+    The weight matrix may be rectangular, in which case every 
+    vertex on the smaller side gets matched. 
+    """
+    w = weights if getattr(weights, 'lazyRows', False) else np.asarray(weights)
+    transposed = w.ndim == 2 and w.shape[0] > w.shape[1]
+    solver = HungarianSolver(w.T if transposed else w, _flip, stats, hook)
+    result = solver.solve()
+    if not transposed and not duals: 
+        return result
+    Mu, Mv, val = result
+    meta = dict(getattr(result, 'meta', {}))
+    if duals: 
+        meta['duals'] = (solver.lu.copy(), solver.lv.copy())
+    if transposed: 
+        Mu, Mv = (Mv, Mu)
+        if duals: meta['duals'] = meta['duals'][::-1]
+    return MatchResult((Mu, Mv, val), **meta) if meta else (Mu, Mv, val)
 
 def minCostMatching(weights, _flip=False):
     """
@@ -130,66 +373,51 @@ def minCostMatching(weights, _flip=False):
     *_flip: if True, convert cost matrix *weights 
                to an equivalent profit matrix
     """
-    _library= False
-    try: 
-        import hungarian
-        _library = True
-    except: 
-        import os
-        msg = "[minCostMatching] hungarian.so not found in %s?" % \
-               os.getcwd()
-        print msg
-    
-    _weights = np.array(weights)
-    if not _library: 
-        if not _flip: # W represents cost by default 
-            _weights = flip(weights) # convert to profit
-        else: # W would represent profit had we wanted to convert it
-            pass
-        return maxProfitMatching(_weights)
+    # hungarian.so is looked up once, see backends.hungarianModule()
+    from backends import hungarianModule
+    hungarian = hungarianModule()
     
+    _weights = np.asarray(weights)
+    if hungarian is None: 
+        # the solver negates the weights itself, no flipped copy needed
+        Mu, Mv, _ = maxProfitMatching(_weights, _flip=(not _flip))
+        return (Mu, Mv, Mu.score(_weights))
+        
     # library hungarian is available, use it
     if _flip:  # convert to max profit problem
         _weights = flip(weights)
-    
+        
     match1, match2 = hungarian.lap(_weights)
-    
-    Mu, Mv = ({}, {})
-    for i, j in enumerate(match1):
-        Mu[i] = j
-    for i, j in enumerate(match2):
-        Mv[j] = i
+    Mu = Matching(match1, nCols=_weights.shape[1])
         
     # evaluate total cost (or profit) using the original weight matrix
-    # assert evalMatch(Mu, weights) == evalMatch(Mv, weights), "Inconsistent total weight"
-    return (Mu, Mv, evalMatch(Mu, weights))
+    return (Mu, Mu.inverse(), evalMatch(Mu, weights))
     
 def evalMatch(M, W, _T=False):
-    _M = dict(M)
-    _W = np.array(W)
-    #print "dim: %s" % str(_W.shape)
-    if _T: _W = _W.transpose()
-    totalWeight = 0
-    for i, j in _M.items():
-        totalWeight += _W[i][j]    
-    return totalWeight
-
-def flip(W):
+    """
+    Total weight of the matching M (a Matching or a mapping
+    U->V) under W, or under W^T if *_T (W is not transposed).
+    """
+    if not isinstance(M, Matching):
+        M = Matching.fromDict(M)
+    return M.score(W, _T)
+
+def flip(W, inplace=False):
     """
     Convert a cost matrix an equivalent profit matrix and 
     vice versa; i.e. if W is a cost matrix then output is 
-    profit matrix. 
+    profit matrix, max(W) - W.
+
+    *inplace: if True, overwrite W (an ndarray) and return it
+
+    [note] 1. solvers that only need the flipped order accept
+              _flip=True instead, which negates on the fly
     """
-    weights = np.array(W)
-    upperbound = np.max(weights)
-    _weights = []
-    for row in weights:
-        cost_row = []
-        for col in row:
-            #cost_row += [sys.maxsize - col]
-            cost_row += [upperbound - col]
-        _weights += [cost_row]
-    return _weights
+    weights = np.asarray(W)
+    upperbound = weights.max()
+    if inplace:
+        return np.subtract(upperbound, weights, out=weights)
+    return upperbound - weights
   
 def demo():
     #import numpy as np
@@ -203,18 +431,20 @@ def demo():
          [12, 8, 16, 19, 10]]     # costs, min-cost = 51
     
     _flip = False
-    feedback = raw_input('> W represents cost? (y/n)  \n')
+    try: ask = raw_input   # Python 2
+    except NameError: ask = input
+    feedback = ask('> W represents cost? (y/n)  \n')
     if feedback.lower().startswith('y'): 
         _flip = True
     
     W = np.array(W)
     Mu, Mv, val = maxProfitMatching(W, _flip=_flip)  # convert to min. cost
-    print "> Using maximum profit match ...\n"
-    print "(%s, %s, %f)" % (Mu, Mv, val)
+    print("> Using maximum profit match ...\n")
+    print("(%s, %s, %f)" % (Mu, Mv, val))
     
     # adding or subtracting a common weight from 
     # rows or columns should not change the assignment
-    print "\n> Subtracting a common weight from rows and columns ...\n"
+    print("\n> Subtracting a common weight from rows and columns ...\n")
     N = len(W)
     _W = np.array(W, copy=True)
     for i in range(N):
@@ -223,7 +453,7 @@ def demo():
             _W[i,j] -= mval   # row "reduction"
     Mu2, Mv2, _ =  maxProfitMatching(_W, _flip=_flip)
     
-    print "(%s, %s, %f)" % (Mu2, Mv2, evalMatch(Mv2, W, _T=True))
+    print("(%s, %s, %f)" % (Mu2, Mv2, evalMatch(Mv2, W, _T=True)))
     
     Wt = _W.transpose()
     for i in range(N):
@@ -232,16 +462,16 @@ def demo():
             Wt[i,j] -= mval   # column "reduction"
     _W = Wt.transpose()
     Mu3, Mv3, _ = maxProfitMatching(_W, _flip=_flip)
-    print "(%s, %s, %f)" % (Mu3, Mv3, evalMatch(Mv3, W, _T=True))
+    print("(%s, %s, %f)" % (Mu3, Mv3, evalMatch(Mv3, W, _T=True)))
     
     for match in [Mu2, Mu3, ]:
         for i, j in Mu.items():
             assert match[i] == j, "Inconsistent matching after reduction!"
 
-    print "\n> Compare the result with the impl from PyPi (which uses min-cost match) ...\n"
+    print("\n> Compare the result with the impl from PyPi (which uses min-cost match) ...\n")
     
     Mu4, Mv4, val = minCostMatching(W, _flip=(not _flip))
-    print "(%s, %s, %f)" % (Mu4, Mv4, val)
+    print("(%s, %s, %f)" % (Mu4, Mv4, val))
     
     return 
 
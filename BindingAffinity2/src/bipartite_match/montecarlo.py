@@ -0,0 +1,192 @@
+'''
+Monte Carlo baseline: the distribution of the value of a random
+assignment, and the significance of the optimum against it.
+
+Random assignments are drawn a block at a time as an int array of
+permutations (argsort of uniform random numbers, one row per trial)
+and scored together by fancy indexing into the weight matrix. Blocks
+only feed running statistics (see RunningStats), so memory does not
+grow with the number of trials.
+
+Block b is drawn from its own stream, RandomState([seed, b]), so the
+same assignments are drawn however the blocks are spread over worker
+processes (statistics then agree up to rounding).
+
+e.g.
+     stats = monteCarlo(W, trials=10**6, optimum=val, workers=8)
+     print("%f +/- %f, p = %g" % (stats.mean, stats.std(), stats.pValue()))
+'''
+
+import multiprocessing
+
+import numpy as np
+
+from weights import BlockSize
+
+# of histogram bins used for the quantiles (see RunningStats)
+Bins = 4096
+
+class RunningStats(object):
+    """
+    Mergeable summary of a stream of assignment values: count,
+    mean, variance (Chan et al. parallel update), extrema, a
+    histogram over fixed *edges for quantiles, and the count of
+    values >= *optimum for the empirical p-value.
+    """
+    def __init__(self, edges, optimum=None):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.optimum = optimum
+        self.count = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.min, self.max = (np.inf, -np.inf)
+        self.hist = np.zeros(len(self.edges) + 1, dtype=np.int64)   # under/overflow at the ends
+        self.nAtLeast = 0
+
+    def update(self, values):
+        """
+        Add a block of values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        block = RunningStats(self.edges, self.optimum)
+        block.count = len(values)
+        if not block.count:
+            return self
+        block.mean = values.mean()
+        block.M2 = ((values - block.mean) ** 2).sum()
+        block.min, block.max = (values.min(), values.max())
+        block.hist = np.bincount(np.searchsorted(self.edges, values, side='right'),
+                                 minlength=len(self.hist))
+        if self.optimum is not None:
+            block.nAtLeast = int((values >= self.optimum).sum())
+        return self.merge(block)
+
+    def merge(self, other):
+        """
+        Fold in the statistics of another stream (same edges).
+        """
+        n = self.count + other.count
+        if not other.count:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.M2 += other.M2 + delta ** 2 * self.count * other.count / n
+        self.count = n
+        self.min, self.max = (min(self.min, other.min), max(self.max, other.max))
+        self.hist += other.hist
+        self.nAtLeast += other.nAtLeast
+        return self
+
+    def std(self, ddof=1):
+        return np.sqrt(self.M2 / (self.count - ddof)) if self.count > ddof else np.nan
+
+    def quantile(self, q):
+        """
+        Approximate q-quantile(s), interpolated within histogram bins
+        (exact to the bin width; clipped to the observed range).
+        """
+        q = np.asarray(q, dtype=np.float64)
+        cum = np.cumsum(self.hist)
+        target = q * self.count
+        i = np.clip(np.searchsorted(cum, target, side='left'), 1, len(self.edges) - 1)
+        lo, hi = (self.edges[i-1], self.edges[i])
+        before = cum[i-1]
+        inBin = np.maximum(self.hist[i], 1)
+        x = lo + (hi - lo) * np.clip((target - before) / inBin, 0, 1)
+        return np.clip(x, self.min, self.max)
+
+    def pValue(self):
+        """
+        Empirical p-value of the optimum, (k + 1) / (n + 1) where k
+        random assignments reached it.
+        """
+        if self.optimum is None:
+            raise ValueError("[RunningStats] No optimum given")
+        return (self.nAtLeast + 1.0) / (self.count + 1.0)
+
+    def asDict(self):
+        d = {'count': self.count, 'mean': float(self.mean), 'std': float(self.std()),
+             'min': float(self.min), 'max': float(self.max),
+             'quantiles': dict(('%g' % q, float(x)) for q, x in
+                               zip([0.01, 0.05, 0.5, 0.95, 0.99],
+                                   self.quantile([0.01, 0.05, 0.5, 0.95, 0.99])))}
+        if self.optimum is not None:
+            d.update(optimum=float(self.optimum), pValue=self.pValue())
+        return d
+
+def randomPermutations(rng, trials, n, m=None):
+    """
+    *trials random injections of m (default n) rows into n
+    columns, as a trials x m int array.
+    """
+    perms = np.argsort(rng.random_sample((trials, n)), axis=1)
+    return perms if m is None or m == n else perms[:, :m]
+
+def scoreAssignments(W, perms):
+    """
+    Value of each assignment (row of *perms) under W.
+    """
+    return W[np.arange(perms.shape[1]), perms].sum(axis=1)
+
+def _blockValues(W, block, size, seed):
+    rng = np.random.RandomState([seed, block])
+    m, n = W.shape
+    return scoreAssignments(W, randomPermutations(rng, size, n, m))
+
+def _edges(W, seed, bins=Bins):
+    """
+    Histogram edges covering +/- 8 standard deviations around the
+    mean of a pilot block (values outside fall in the end bins).
+    """
+    pilot = _blockValues(W, 0, 256, seed)
+    width = 8 * max(pilot.std(), 1e-9 * max(1.0, abs(pilot.mean())))
+    return np.linspace(pilot.mean() - width, pilot.mean() + width, bins + 1)
+
+def _runBlocks(task):
+    from batch import mapShared
+    handle, blocks, sizes, seed, edges, optimum = task
+    W = mapShared(handle)
+    stats = RunningStats(edges, optimum)
+    for block, size in zip(blocks, sizes):
+        stats.update(_blockValues(W, block, size, seed))
+    return stats
+
+def monteCarlo(W, trials=100000, optimum=None, seed=0, workers=1, blockSize=None):
+    """
+    Statistics (a RunningStats) of the values of *trials uniformly
+    random assignments under the weight matrix W.
+
+    *optimum: value of the optimal assignment, for pValue()
+    *workers: number of worker processes (see batch.getPool);
+              1 runs in this process
+    *blockSize: trials per block (default: about weights.BlockSize
+                random numbers per block)
+    """
+    W = np.asarray(W)
+    if W.shape[0] > W.shape[1]:
+        W = W.T
+    m, n = W.shape
+    if blockSize is None:
+        blockSize = max(1, BlockSize // max(n, 1))
+    sizes = [min(blockSize, trials - b0) for b0 in range(0, trials, blockSize)]
+    blocks = list(range(len(sizes)))
+    edges = _edges(W, seed)
+
+    if workers == 1 or len(blocks) < 2:
+        stats = RunningStats(edges, optimum)
+        for block, size in zip(blocks, sizes):
+            stats.update(_blockValues(W, block, size, seed))
+        return stats
+
+    from batch import getPool, SharedWeights
+    if workers is None: workers = multiprocessing.cpu_count()
+    pool = getPool(workers)
+    nTasks = min(len(blocks), 4 * workers)
+    with SharedWeights('montecarlo-') as shared:
+        handle = shared.add(W, 'W')
+        tasks = [(handle, blocks[i::nTasks], sizes[i::nTasks], seed, edges, optimum)
+                 for i in range(nTasks)]
+        stats = RunningStats(edges, optimum)
+        for part in pool.imap(_runBlocks, tasks):   # fixed merge order
+            stats.merge(part)
+        return stats
@@ -5,47 +5,61 @@ Created on Nov 22, 2013
 
 Process the input data; i.e. 
    protein file and drug file 
-
+    
+The input files are set by setInputFiles() (match.main does it from
+the command line); importing this module has no side effects.
 '''
+from __future__ import print_function
 import sys, os
- 
-if len(sys.argv) != 3:
-    msg = "Usage : python %s protein_file drug_file\n" % os.path.basename(sys.argv[0])
-    msg += "        where protein_file holds newline-separated protein names\n"
-    msg += "              drug_file holds newline-separated drug names\n"
-    sys.stderr.write(msg)
-    raise SystemExit(1)
-
+    
 ### system/global variables 
-
-PROTEIN_FILE = sys.argv[1]
-DRUG_FILE = sys.argv[2]
+    
+PROTEIN_FILE = None
+DRUG_FILE = None
 #PROTEIN_FILE = 'proteins.txt'
 #DRUG_FILE = 'drugs.txt'
-CURDIR = os.getcwd()
-
+    
+Usage = "Usage : python %s protein_file drug_file\n" \
+        "        where protein_file holds newline-separated protein names\n" \
+        "              drug_file holds newline-separated drug names\n"
+    
+def setInputFiles(proteinFile, drugFile):
+    """
+    Set the protein and drug files read by process_data().
+    """
+    global PROTEIN_FILE, DRUG_FILE
+    PROTEIN_FILE, DRUG_FILE = (proteinFile, drugFile)
     
 def _check_files():
+    if PROTEIN_FILE is None or DRUG_FILE is None:
+        raise RuntimeError("[Input] No input files, see setInputFiles()")
     msg = ''
     st = 0
+    CURDIR = os.getcwd()
     if not os.path.exists(PROTEIN_FILE): 
         msg += "[Input] Could not find %s in %s" % (PROTEIN_FILE, CURDIR)
         st += 1
     if not os.path.exists(DRUG_FILE):
         msg += "[Input] Could not find %s in %s" % (DRUG_FILE, CURDIR)
         st += 1
-    if st: raise RuntimeError, msg
+    if st: raise RuntimeError(msg)
     return
 
 # parse input file
 
+def readNames(path):
+    """
+    Read newline-separated names from a file, skipping blank lines.
+    """
+    with open(path) as f: 
+        return [line.strip() for line in f if line.strip()]
+
 def process_data():
     """
     Read data from files and store them in lists.
     """
     _check_files()
-    return ([line.strip() for line in open(PROTEIN_FILE) if line.strip()], 
-            [line.strip() for line in open(DRUG_FILE) if line.strip()]) 
+    return (readNames(PROTEIN_FILE), readNames(DRUG_FILE)) 
    
 def test_process_data(_debug=1):
     proteinSet, drugSet = process_data()
@@ -55,7 +69,7 @@ def test_process_data(_debug=1):
         msg += "> proteins:\n%s\n" % proteinSet 
         msg += "> # of drugs:\n%d\n" % len(drugSet) 
         msg += "> drugs:\n%s\n" % drugSet 
-        print msg
+        print(msg)
     
     # assuming that # of drugs and # of proteins are the same
     assert len(drugSet) == len(proteinSet), \
@@ -63,4 +77,8 @@ def test_process_data(_debug=1):
     return
 
 if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.stderr.write(Usage % os.path.basename(sys.argv[0]))
+        raise SystemExit(1)
+    setInputFiles(sys.argv[1], sys.argv[2])
     test_process_data()
\ No newline at end of file
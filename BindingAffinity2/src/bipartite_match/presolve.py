@@ -0,0 +1,200 @@
+'''
+Presolve for the assignment problem: shrink it before the solver runs.
+
+Two reductions, both exact, are tried on the m x n weight matrix
+(m <= n, transposed otherwise):
+
+     duplicates  identical rows (columns) are interchangeable; with
+                 affinity weights, whose rows only depend on the
+                 length of the protein name, there are a few dozen
+                 distinct rows and a few hundred distinct columns.
+                 If that shrinks the problem enough, the assignment
+                 is solved as a transportation problem between the
+                 classes of rows and columns (see module transport),
+                 as compress.classMatching does from the names
+     forced      row and column reduction, lu = max_v w[u][v] and
+                 lv = max_u (w[u][v] - lu[u]), gives dual labels whose
+                 sum is an upper bound on the optimum, and a greedy
+                 assignment a lower bound. An edge whose reduced cost
+                 lu[u] + lv[v] - w[u][v] exceeds the difference is in
+                 no optimal assignment (it is dominated); a row left
+                 with a single edge, or a column of a square problem,
+                 is forced onto it, which removes a row and a column,
+                 possibly leaving other rows with a single edge, etc.
+
+Only the rows and columns left after the second, the core, go to the
+solver; its assignment is mapped back and the value is that of the
+whole assignment under the original weights.
+
+e.g.
+     Mu, Mv, val = result = presolvedMatching(W, match_func=autoMatching)
+     print(result.meta['presolve'])
+     evalOptAssignment(W, presolve=False)   # no presolve
+'''
+
+import numpy as np
+
+from anytime import greedyMatching
+from transport import transportFlow
+from compress import expandFlow
+from matching import Matching, asMatching
+from result import MatchResult
+from verify import _rowBlocks, _tolerance
+
+# solve on the classes of duplicates if their total number is at most
+# this fraction of the number of rows and columns
+ClassRatio = 0.25
+
+def duplicateRows(W):
+    """
+    Group identical rows of *W.
+
+    Returns (labels, representatives, counts): the class of each row,
+    the first row of every class and the class multiplicities.
+
+    [note] 1. rows are hashed by the sum of their bits (as float64)
+              times random keys, modulo 2^64, which unlike a float
+              product does not depend on the order of summation,
+              i.e. on the memory layout; rows with the same hash are
+              compared with the first one, and a row that differs
+              (a collision) gets a class of its own
+    """
+    m, n = W.shape
+    keys = np.random.RandomState(0).randint(1, 1 << 62, size=n).astype(np.uint64)
+    h = np.zeros(m, dtype=np.uint64)
+    for r0, r1 in _rowBlocks(W):   # [1]
+        bits = (np.array(W[r0:r1], dtype=np.float64) + 0.0).view(np.uint64)   # no -0.0
+        h[r0:r1] = (bits * keys).sum(axis=1, dtype=np.uint64)
+    _, first, labels = np.unique(h, return_index=True, return_inverse=True)
+    first = first[labels.ravel()]
+    same = np.ones(m, dtype=bool)
+    for r0, r1 in _rowBlocks(W):
+        same[r0:r1] = (W[r0:r1] == W[first[r0:r1]]).all(axis=1)
+    first = np.where(same, first, np.arange(m))
+    reps, labels, counts = np.unique(first, return_inverse=True, return_counts=True)
+    return (labels.ravel(), reps, counts)
+
+def forcedAssignments(P, tol=0):
+    """
+    Edges of the profit matrix P (m <= n) that are in every optimal
+    assignment, by row and column reduction (see the module
+    documentation); returns (rows, cols), in the order fixed.
+    """
+    m, n = P.shape
+    lu = P.max(axis=1)
+    lv = np.full(n, -np.inf)
+    for r0, r1 in _rowBlocks(P):
+        lv = np.maximum(lv, (P[r0:r1] - lu[r0:r1, None]).max(axis=0))
+    if m < n:
+        lv = np.maximum(lv, 0)
+    rowMatch = greedyMatching(P, lu)
+    slack = lu.sum() + lv.sum() - P[np.arange(m), rowMatch].sum() + tol
+
+    cand = np.empty((m, n), dtype=bool)
+    for r0, r1 in _rowBlocks(P):
+        cand[r0:r1] = lu[r0:r1, None] + lv - P[r0:r1] <= slack
+    rowCount, colCount = (cand.sum(axis=1), cand.sum(axis=0))
+    rowFree, colFree = (np.ones(m, dtype=bool), np.ones(n, dtype=bool))
+    fixedRows, fixedCols = ([], [])
+    while True:
+        rows = np.flatnonzero(rowFree & (rowCount == 1))
+        cols = cand[rows].argmax(axis=1)
+        if m == n:
+            byCol = np.flatnonzero(colFree & (colCount == 1))
+            rows = np.concatenate([rows, cand[:, byCol].argmax(axis=0)])
+            cols = np.concatenate([cols, byCol])
+        if not len(rows):
+            break
+        _, first = np.unique(rows, return_index=True)
+        rows, cols = (rows[first], cols[first])
+        _, first = np.unique(cols, return_index=True)
+        rows, cols = (rows[first], cols[first])
+        rowFree[rows], colFree[cols] = (False, False)
+        colCount -= cand[rows].sum(axis=0)
+        rowCount -= cand[:, cols].sum(axis=1)
+        cand[rows], cand[:, cols] = (False, False)
+        rowCount[rows], colCount[cols] = (0, 0)
+        fixedRows.append(rows)
+        fixedCols.append(cols)
+    if not fixedRows:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    return (np.concatenate(fixedRows), np.concatenate(fixedCols))
+
+def _classMatching(P, rowClasses, colClasses):
+    """
+    Assignment of the profit matrix P (m <= n) as a transportation
+    problem between the classes of identical rows and columns;
+    returns rowMatch.
+    """
+    (rlabels, rreps, rcounts), (clabels, creps, ccounts) = (rowClasses, colClasses)
+    m, n = P.shape
+    C = P[rreps][:, creps]
+    if m < n:   # a dummy class takes the free columns
+        C = np.vstack([C, np.zeros((1, C.shape[1]))])
+        rcounts = np.append(rcounts, n - m)
+        rlabels = np.append(rlabels, np.repeat(len(rreps), n - m))
+    flow, _ = transportFlow(C, rcounts, ccounts)
+    return expandFlow(flow, rlabels, clabels)[:m]
+
+def presolvedMatching(weights, _flip=False, match_func=None, ratio=ClassRatio,
+                      maximize=True):
+    """
+    Compute best assignment, presolved (see the module
+    documentation); same contract as *match_func (by default
+    backends.autoMatching), which solves the core. Returns a
+    MatchResult (Mu, Mv, value) whose .meta['presolve'] holds
+
+       classes: # of distinct rows and columns
+       forced:  # of forced assignments
+       core:    shape of the problem passed to *match_func, None if
+                solved on the classes of duplicates
+
+    and .meta['backend'] the solver that ran: that of *match_func,
+    'transport' on the classes, 'presolve' if every row was forced.
+
+    *ratio: solve on the classes of duplicates if there are at most
+            *ratio * (m + n) of them (0 never does, i.e. only
+            *match_func solves)
+    *maximize: whether *match_func maximizes the weights (as
+               maxProfitMatching) or minimizes them (as
+               minCostMatching), before *_flip; the reductions
+               follow the same objective
+    """
+    if match_func is None:
+        from backends import autoMatching as match_func
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[presolvedMatching] Need a 2-D weight matrix: %s" % str(W.shape))
+    transposed = W.shape[0] > W.shape[1]
+    A = W.T if transposed else W
+    m, n = A.shape
+    P = -A if _flip == maximize else A   # profits of the objective
+
+    rowClasses, colClasses = (duplicateRows(P), duplicateRows(P.T))
+    classes = (len(rowClasses[1]), len(colClasses[1]))
+    stats = {'classes': classes, 'forced': 0, 'core': None}
+    meta = {'backend': 'transport'}
+    if m and sum(classes) <= ratio * (m + n):
+        rowMatch = _classMatching(P, rowClasses, colClasses)
+    else:
+        rows, cols = forcedAssignments(np.asarray(P, dtype=np.float64), _tolerance(W, None))
+        rowMatch = -np.ones(m, dtype=np.int64)
+        rowMatch[rows] = cols
+        coreRows = np.flatnonzero(rowMatch < 0)
+        coreCols = np.setdiff1d(np.arange(n), cols)
+        stats.update(forced=len(rows), core=(len(coreRows), len(coreCols)))
+        meta = {'backend': 'presolve'}
+        if len(coreRows):
+            core = A[np.ix_(coreRows, coreCols)]
+            result = match_func(core, _flip=_flip)
+            meta = dict(getattr(result, 'meta', {}))
+            meta.pop('duals', None)   # of the core
+            meta.setdefault('backend', match_func.__name__)
+            coreMatch = np.asarray(asMatching(result[0], core.shape).rowMatch)
+            matched = coreMatch >= 0
+            rowMatch[coreRows[matched]] = coreCols[coreMatch[matched]]
+
+    Mu = Matching(rowMatch, nCols=n)
+    Mu, Mv = (Mu.inverse(), Mu) if transposed else (Mu, Mu.inverse())
+    meta['presolve'] = stats
+    return MatchResult((Mu, Mv, Mu.score(W)), **meta)
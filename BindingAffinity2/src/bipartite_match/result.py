@@ -0,0 +1,14 @@
+'''
+Result of a matching function with metadata attached.
+'''
+
+class MatchResult(tuple):
+    """
+    Result tuple of a matching function, e.g. (Mu, Mv, value),
+    that also carries a dictionary of metadata, .meta (e.g. which
+    backend ran and for how long, solver statistics).
+    """
+    def __new__(cls, result, **meta):
+        self = tuple.__new__(cls, result)
+        self.meta = meta
+        return self
@@ -0,0 +1,206 @@
+'''
+Declarative binding rules, compiled into one vectorized expression.
+
+A rule set is written in terms of per-name features, p.<feature> of
+the protein and d.<feature> of the drug:
+
+     base:        (condition, value) pairs; the value of the first
+                  condition that holds is the binding affinity
+                  (*default if none does)
+     multipliers: (condition, factor) pairs; the affinity is
+                  multiplied by the factor of every condition that
+                  holds
+
+Features are the outputs of countChar (nVowel, nConsonant, nOther),
+the length of the name and the number of characters of any class
+declared in *classes, e.g. classes={'nDigit': '0123456789'};
+expressions may use arithmetic, comparisons, &, |, ~ and the
+functions gcd, where, minimum, maximum, abs, floor and ceil.
+
+The whole rule set is compiled once into a single NumPy expression
+(nested where()s times the multipliers), evaluated with the protein
+features as a column and the drug features as a row, i.e. on a block
+of rows of the weight matrix at a time by broadcasting (see
+weights.weightBlock). RuleSet.version, a hash of the definition,
+identifies it, e.g. in the keys of cached weight matrices (see module
+cache).
+
+e.g.
+     rules = RuleSet(base=[('p.length % 2 == 0', '2 * d.nVowel'),
+                           ('p.length % 2 == 1', '2.5 * d.nConsonant + d.nDigit')],
+                     multipliers=[('gcd(p.length, d.length) > 1', 1.25)],
+                     classes={'nDigit': '0123456789'})
+     W = evalWeights(rules=rules)
+'''
+
+import re
+import ast
+import json
+import hashlib
+
+import numpy as np
+
+Vowels = set(['a', 'e', 'i', 'o', 'u'])
+_NonAlpha = re.compile('[^a-zA-Z]')
+_Field = re.compile(r'\b([pd])\.([A-Za-z_]\w*)')
+
+# bump whenever the meaning of a rule definition changes, e.g. a new
+# feature definition or expression function
+FormatVersion = '1'
+
+# functions available in expressions
+Functions = {'gcd': np.gcd, 'where': np.where, 'minimum': np.minimum,
+             'maximum': np.maximum, 'abs': np.abs, 'floor': np.floor,
+             'ceil': np.ceil}
+
+def countChar(name):
+    """
+    Given a string (e.g. drug name), count the number of vowels,
+    consonants and other characters (numbers, hyphens, etc).
+
+    Return a summary in 3-tuple: (nVowel, nConsonant, nOther)
+    """
+    _name = _NonAlpha.sub('', name)
+    nAlphabets, nTotal = (len(_name), len(name))
+    lowered = _name.lower()
+    nVowels = sum([lowered.count(ch) for ch in Vowels])
+    return (nVowels, nAlphabets-nVowels, nTotal-nAlphabets)
+
+# features computed from countChar(), in the order of its result
+CharFeatures = ('nVowel', 'nConsonant', 'nOther')
+StandardFeatures = ('length',) + CharFeatures
+
+class Features(object):
+    """
+    Per-name feature arrays as attributes, like
+    weights.ProteinFeatures and weights.DrugFeatures.
+    """
+    def __init__(self, **arrays):
+        self.__dict__.update(arrays)
+
+    def __repr__(self):
+        return 'Features(%s)' % ', '.join(sorted(self.__dict__))
+
+class RuleSet(object):
+    """
+    Compiled rule set; see the module documentation.
+
+    *base: sequence of (condition, value) expression pairs
+    *multipliers: sequence of (condition, factor) expression pairs
+    *classes: feature name -> characters counted by it
+    *default: affinity if no base condition holds
+    *scale: integer weights (see weights.weightMatrix) hold the
+            affinities times *scale, which must make them exact
+
+    Raises ValueError on unknown features or names, and on syntax
+    errors.
+    """
+    def __init__(self, base, multipliers=(), classes=None, default=0.0, scale=8):
+        self.base = [(str(c), str(v)) for c, v in base]
+        self.multipliers = [(str(c), str(f)) for c, f in multipliers]
+        self.classes = dict(classes or {})
+        self.default = float(default)
+        self.scale = int(scale)
+        for name in self.classes:
+            if name in StandardFeatures or not re.match(r'^[A-Za-z_]\w*$', name):
+                raise ValueError("[RuleSet] Invalid character class name: %s" % name)
+
+        expr = repr(self.default)
+        for cond, value in reversed(self.base):
+            expr = 'where(%s, %s, %s)' % (cond, value, expr)
+        for cond, factor in self.multipliers:
+            expr = '(%s) * where(%s, %s, 1)' % (expr, cond, factor)
+        self.expression = expr
+
+        known = StandardFeatures + tuple(sorted(self.classes))
+        self.fields = {'p': [], 'd': []}
+        for side, name in _Field.findall(expr):
+            if name not in known:
+                raise ValueError("[RuleSet] Unknown feature: %s.%s" % (side, name))
+            if name not in self.fields[side]:
+                self.fields[side].append(name)
+        try:
+            tree = ast.parse(expr, '<rules>', 'eval')
+        except SyntaxError as e:
+            raise ValueError("[RuleSet] Invalid expression: %s (%s)" % (expr, e))
+        # features are attributes of p and d, any other bare name must be a function
+        unknown = set([node.id for node in ast.walk(tree) if isinstance(node, ast.Name)]) - \
+                  set(Functions) - set(['p', 'd'])
+        if unknown:
+            raise ValueError("[RuleSet] Unknown names: %s" % ', '.join(sorted(unknown)))
+        self._code = compile(tree, '<rules>', 'eval')
+
+        definition = json.dumps([FormatVersion, self.base, self.multipliers,
+                                 sorted(self.classes.items()), self.default, self.scale])
+        self.version = hashlib.sha1(definition.encode('utf-8')).hexdigest()[:16]
+
+    def __repr__(self):
+        return 'RuleSet(%s)' % self.version
+
+    def features(self, names, side='d', base=None):
+        """
+        Features of *names used on *side ('p' for proteins, 'd' for
+        drugs), taken from *base (e.g. a weights.DrugFeatures) where
+        it has them and computed otherwise.
+
+        [note] 1. the length is always there, it gives the number
+                  of names
+        """
+        arrays = {}
+        counts = None
+        for name in ['length'] + self.fields[side]:   # [1]
+            if base is not None and hasattr(base, name):
+                arrays[name] = np.asarray(getattr(base, name))
+            elif name == 'length':
+                arrays[name] = np.fromiter((len(s) for s in names), dtype=np.int64,
+                                           count=len(names))
+            elif name in CharFeatures:
+                if counts is None:
+                    counts = np.array([countChar(s) for s in names],
+                                      dtype=np.int64).reshape(len(names), 3)
+                arrays[name] = counts[:, CharFeatures.index(name)].copy()
+            else:
+                chars = self.classes[name]
+                arrays[name] = np.fromiter((sum([s.count(c) for c in chars]) for s in names),
+                                           dtype=np.int64, count=len(names))
+        return Features(**arrays)
+
+    def evaluate(self, pfeat, dfeat, rows=slice(None), cols=slice(None)):
+        """
+        Affinities between the proteins selected by *rows and the
+        drugs selected by *cols (slices or index arrays) as a float64
+        array; *pfeat, *dfeat hold (at least) the features used.
+
+        [note] 1. names with the same features used have the same
+                  affinities: the expression is evaluated once per
+                  distinct protein and drug signature (a few dozen 
+                  to a few hundred with real names) and the block 
+                  gathered from that
+        """
+        p, pclass = _signatures(pfeat, self.fields['p'], rows)   # [1]
+        d, dclass = _signatures(dfeat, self.fields['d'], cols)
+        namespace = dict(Functions, p=Features(**dict((name, a[:, None]) for name, a in p.items())),
+                         d=Features(**dict((name, a[None, :]) for name, a in d.items())))
+        w = eval(self._code, {'__builtins__': {}}, namespace)
+        w = np.asarray(w, dtype=np.float64)
+        shape = (pclass.max() + 1 if len(pclass) else 0, dclass.max() + 1 if len(dclass) else 0)
+        if w.shape != shape:   # constant along an axis
+            w = np.array(np.broadcast_to(w, shape))
+        return w.take(pclass, axis=0).take(dclass, axis=1)
+
+def _signatures(feat, fields, index):
+    """
+    Distinct values of the *fields of the names selected by *index:
+    returns ({field: values}, class of each name).
+    """
+    size = len(feat.length[index])
+    if not fields:
+        return ({}, np.zeros(size, dtype=np.int64))
+    columns = np.column_stack([np.asarray(getattr(feat, name))[index] for name in fields])
+    keys, classes = np.unique(columns.reshape(size, len(fields)), axis=0, return_inverse=True)
+    return (dict((name, keys[:, i]) for i, name in enumerate(fields)), classes.ravel())
+
+# the binding rules of the application
+DefaultRules = RuleSet(base=[('p.length % 2 == 0', '2 * d.nVowel'),
+                             ('p.length % 2 == 1', '2.5 * d.nConsonant')],
+                       multipliers=[('gcd(p.length, d.length) > 1', 1.25)])
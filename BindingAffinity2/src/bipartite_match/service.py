@@ -0,0 +1,412 @@
+'''
+Resident matching service: an asyncio front end that feeds a warm
+pool of solver processes, so that many small assignment queries do
+not each pay for a process start, the imports and the parsing.
+
+Requests are JSON objects, sent one per line over a Unix socket (or
+a TCP port), or POSTed over HTTP to /match:
+
+     {"id": 1, "proteinFile": "proteins.txt", "drugFile": "drugs.txt"}
+     {"id": 2, "proteins": ["ABC", ...], "drugs": ["Aspirin", ...]}
+     {"id": 3, "weights": [[1, 2], [3, 4]], "backend": "python",
+      "deadline": 0.5}
+
+and answered, in the same order on a connection, with
+
+     {"id": 1, "value": 1587.5, "assignment": [[0, 74], ...],
+      "backend": "transport", "presolve": {"classes": [12, 21], ...},
+      "elapsed": 0.01, "cached": false}
+
+or {"id": ..., "error": "...", "status": 503}. {"op": "metrics"} (GET
+/metrics over HTTP) returns the counters and the p50/p99 latencies.
+
+Every request goes through affinity.evalOptAssignment in one of the
+worker processes. Weight matrices of input files are taken from the
+on-disk cache (see module cache), shared through the page cache, and
+results are kept in an LRU keyed by the content of the input, so a
+repeated query is answered without solving; identical queries in
+flight are solved once. At most *workers requests are solved at a
+time; up to *maxPending more wait for a worker, further requests are
+rejected at once (status 503). A request still waiting when its
+deadline passes is dropped (504); a running solve cannot be
+interrupted, its result is then only cached.
+
+[note] Python 3 only (asyncio).
+
+e.g.
+     python service.py --socket /tmp/match.sock --workers 4
+     python service.py --http 127.0.0.1:8080
+'''
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# # of latencies kept for the percentiles
+Window = 10000
+# longest request line (JSON lines) accepted
+MaxRequestBytes = 64 << 20
+
+Reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error',
+           503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+def _warm():
+    # worker initializer: load numpy, the solvers and the backend
+    # timings before the first request
+    import affinity
+    affinity.evalOptAssignment(np.eye(2))
+
+def _solve(kind, payload, backend):
+    """
+    Run one request in a worker; returns (pairs, value, backend, 
+    presolve), the last the statistics of module presolve.
+    """
+    import affinity
+    from weights import proteinFeatures, drugFeatures, weightMatrix
+    if kind == 'files':
+        from cache import Cache, cachedWeights
+        _, _, W = cachedWeights(payload[0], payload[1], Cache())
+    elif kind == 'names':
+        W = weightMatrix(proteinFeatures(payload[0]), drugFeatures(payload[1]))
+    else:
+        W = np.asarray(payload, dtype=np.float64)
+
+    result = affinity.evalOptAssignment(W, backend=backend)
+    assignment, value = result
+    return (assignment.pairs(), float(value), result.meta.get('backend'),
+            result.meta.get('presolve'))
+
+def testPresolve():
+    # requests are presolved in the workers, with or without a backend
+    proteins, drugs = (['ABC', 'ABCD', 'AB', 'ABC'], ['Aspirin', 'Aspirin', 'Tylenol', 'Advil'])
+    for backend in (None, 'python'):
+        for kind, payload in (('names', (proteins, drugs)), ('weights', np.eye(4).tolist())):
+            pairs, value, used, presolve = _solve(kind, payload, backend)
+            assert presolve is not None, "[testPresolve] Not presolved: %s" % kind
+            print("%s %s -> %s by %s" % (kind, backend, presolve, used))
+    return
+
+class Metrics(object):
+    """
+    Request counters and the latencies (seconds, from receipt to
+    answer) of the last Window requests.
+    """
+    def __init__(self):
+        self.counts = dict(requests=0, errors=0, cacheHits=0, rejected=0, timeouts=0)
+        self.latencies = deque(maxlen=Window)
+        self.started = time.time()
+
+    def record(self, latency, status, cached=False):
+        self.counts['requests'] += 1
+        self.latencies.append(latency)
+        if cached: self.counts['cacheHits'] += 1
+        if status == 503: self.counts['rejected'] += 1
+        elif status == 504: self.counts['timeouts'] += 1
+        elif status != 200: self.counts['errors'] += 1
+
+    def snapshot(self, **extra):
+        d = dict(self.counts, uptime=time.time() - self.started, **extra)
+        if self.latencies:
+            p50, p99 = np.percentile(np.array(self.latencies), [50, 99])
+            d.update(p50=float(p50), p99=float(p99),
+                     mean=float(np.mean(self.latencies)))
+        return d
+
+class MatchService(object):
+    """
+    Request handling, see the module docstring.
+
+    *workers: # of solver processes
+    *maxPending: # of requests allowed to wait for a worker
+    *cacheSize: # of results kept
+    *deadline: default deadline of a request (seconds), None for no
+               deadline
+    *backend: default solver backend (see module backends)
+    """
+    def __init__(self, workers=1, maxPending=64, cacheSize=256, deadline=None, backend=None):
+        self.workers = workers
+        self.maxPending = maxPending
+        self.cacheSize = cacheSize
+        self.deadline = deadline
+        self.backend = backend
+        self.metrics = Metrics()
+        self.results = OrderedDict()   # LRU
+        self.inflight = {}
+        self.deadlines = {}   # latest deadline of the waiters of a task in flight
+        self.pending = 0
+        self.executor = None
+        self.slots = None
+
+    async def start(self):
+        """
+        Start and warm up the worker processes.
+        """
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_warm)
+        self.slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, time.sleep, 0)
+                               for _ in range(self.workers)])
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def _parse(self, request):
+        """
+        (kind, payload, backend, cache key) of a request.
+        """
+        if not isinstance(request, dict):
+            raise ServiceError(400, "[service] Request must be a JSON object")
+        backend = request.get('backend', self.backend)
+        if backend is not None:
+            from backends import backends
+            if backend not in backends():
+                raise ServiceError(400, "[service] Unknown or unavailable backend: %s" % backend)
+        if 'proteinFile' in request and 'drugFile' in request:
+            from cache import fileDigest
+            files = (request['proteinFile'], request['drugFile'])
+            for path in files:
+                if not os.path.exists(path):
+                    raise ServiceError(400, "[service] Could not find %s" % path)
+            loop = asyncio.get_running_loop()   # hash the files off the loop
+            content = await asyncio.gather(*[loop.run_in_executor(None, fileDigest, p)
+                                             for p in files])
+            kind, payload = ('files', files)
+        elif 'proteins' in request and 'drugs' in request:
+            kind = 'names'
+            payload = content = (list(request['proteins']), list(request['drugs']))
+        elif 'weights' in request:
+            try:
+                W = np.asarray(request['weights'], dtype=np.float64)
+            except (TypeError, ValueError) as e:   # ragged or not numbers
+                raise ServiceError(400, "[service] Invalid weights: %s" % e)
+            if W.ndim != 2:
+                raise ServiceError(400, "[service] Need a 2-D weight matrix: %s" % str(W.shape))
+            kind, payload = ('weights', W)
+            content = request['weights']
+        else:
+            raise ServiceError(400, "[service] Need proteinFile and drugFile, "
+                                    "proteins and drugs, or weights")
+        key = hashlib.sha1(json.dumps([kind, content, backend]).encode('utf-8')).hexdigest()
+        return (kind, payload, backend, key)
+
+    async def _run(self, kind, payload, backend, key):
+        # wait for a worker (bounded queue) until the latest deadline
+        # of the requests waiting for the result, then solve
+        if self.pending >= self.workers + self.maxPending:
+            raise ServiceError(503, "[service] Too many pending requests")
+        self.pending += 1
+        try:
+            while True:
+                deadline = self.deadlines.get(key)
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                try:
+                    await asyncio.wait_for(self.slots.acquire(), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    if self.deadlines.get(key) == deadline:   # not extended meanwhile
+                        raise ServiceError(504, "[service] Deadline exceeded while queued")
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, _solve, kind, payload, backend)
+            finally:
+                self.slots.release()
+        finally:
+            self.pending -= 1
+
+    def _store(self, key, future):
+        self.inflight.pop(key, None)
+        self.deadlines.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.results[key] = future.result()
+        while len(self.results) > self.cacheSize:
+            self.results.popitem(last=False)
+
+    async def submit(self, request):
+        """
+        Answer one request (a dictionary); never raises.
+
+        [note] 1. an identical request in flight is shared, and
+                  waits in the queue as long as the latest deadline
+                  of its requests; each of them still times out at
+                  its own
+        """
+        received = time.time()
+        rid = request.get('id') if isinstance(request, dict) else None
+        cached = False
+        try:
+            if isinstance(request, dict) and request.get('op') == 'metrics':
+                return dict(self.metrics.snapshot(pending=self.pending,
+                                                  cached=len(self.results)), id=rid)
+            kind, payload, backend, key = await self._parse(request)
+            deadline = request.get('deadline', self.deadline)
+            deadline = None if deadline is None else received + float(deadline)
+            if key in self.results:
+                self.results.move_to_end(key)
+                pairs, value, used, presolve = self.results[key]
+                cached = True
+            else:
+                task = self.inflight.get(key)
+                if task is None:
+                    self.deadlines[key] = deadline
+                    task = asyncio.ensure_future(self._run(kind, payload, backend, key))
+                    task.add_done_callback(lambda f, key=key: self._store(key, f))
+                    self.inflight[key] = task
+                elif self.deadlines[key] is not None:   # [1]
+                    self.deadlines[key] = None if deadline is None else \
+                            max(self.deadlines[key], deadline)
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                try:
+                    pairs, value, used, presolve = await asyncio.wait_for(asyncio.shield(task),
+                                                                          timeout)
+                except asyncio.TimeoutError:
+                    raise ServiceError(504, "[service] Deadline exceeded")
+            response = dict(id=rid, value=value, assignment=pairs, backend=used,
+                            presolve=presolve, elapsed=time.time() - received, cached=cached)
+            status = 200
+        except ServiceError as e:
+            response, status = (dict(id=rid, error=str(e), status=e.status), e.status)
+        except Exception as e:
+            response, status = (dict(id=rid, error='%s: %s' % (type(e).__name__, e),
+                                     status=500), 500)
+        self.metrics.record(time.time() - received, status, cached)
+        return response
+
+    async def handleLines(self, reader, writer):
+        """
+        JSON-lines connection: one request per line, answered in
+        order.
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:   # longer than MaxRequestBytes
+                    writer.write(json.dumps(dict(error="[service] Request too long",
+                                                 status=400)).encode('utf-8') + b'\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError as e:
+                    response = dict(error="[service] Invalid JSON: %s" % e, status=400)
+                else:
+                    response = await self.submit(request)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handleHTTP(self, reader, writer):
+        """
+        Minimal HTTP/1.1: POST /match with a JSON request, GET
+        /metrics; keep-alive unless asked otherwise.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, path, version = (line.decode('latin-1').split() + ['', ''])[:3]
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if not h.strip():
+                        break
+                    name, _, value = h.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if method == 'GET' and path == '/metrics':
+                    response = await self.submit({'op': 'metrics'})
+                elif method == 'POST' and path in ('/', '/match'):
+                    try:
+                        response = await self.submit(json.loads(body.decode('utf-8')))
+                    except ValueError as e:
+                        response = dict(error="[service] Invalid JSON: %s" % e, status=400)
+                else:
+                    response = dict(error="[service] No such resource: %s %s" % (method, path),
+                                    status=404)
+                status = response.get('status', 200)
+                data = json.dumps(response).encode('utf-8')
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                              'Content-Length: %d\r\nConnection: %s\r\n\r\n' % \
+                              (status, Reasons.get(status, ''), len(data),
+                               'close' if close else 'keep-alive')).encode('latin-1') + data)
+                await writer.drain()
+                if close:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(service, socket=None, host=None, port=None, http=False):
+    """
+    Start *service and serve it on a Unix *socket or on (*host,
+    *port), JSON lines or *http; runs until cancelled.
+    """
+    await service.start()
+    handler = service.handleHTTP if http else service.handleLines
+    if socket is not None:
+        if os.path.exists(socket):
+            os.remove(socket)
+        server = await asyncio.start_unix_server(handler, path=socket, limit=MaxRequestBytes)
+    else:
+        server = await asyncio.start_server(handler, host, port, limit=MaxRequestBytes)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.stop()
+        if socket is not None and os.path.exists(socket):
+            os.remove(socket)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resident matching service.')
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--socket', help='Unix socket path (JSON lines)')
+    where.add_argument('--tcp', help='HOST:PORT (JSON lines)')
+    where.add_argument('--http', help='HOST:PORT (HTTP)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='requests allowed to wait for a worker')
+    parser.add_argument('--cache-size', type=int, default=256, help='results kept')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='default per-request deadline (seconds)')
+    parser.add_argument('--backend', default=None, help='default solver backend')
+    args = parser.parse_args(argv)
+
+    service = MatchService(args.workers, args.max_pending, args.cache_size,
+                           args.deadline, args.backend)
+    host, port = (None, None)
+    if args.tcp or args.http:
+        host, _, port = (args.tcp or args.http).rpartition(':')
+        host, port = (host or '127.0.0.1', int(port))
+    try:
+        asyncio.run(serve(service, args.socket, host, port, http=bool(args.http)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
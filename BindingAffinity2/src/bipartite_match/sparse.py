@@ -0,0 +1,201 @@
+'''
+Assignment on a sparse candidate graph.
+
+Instead of the full (padded) weight matrix, keep only the top-k
+candidate drugs of every protein in CSR form (indptr, indices, data)
+and match every protein on that graph by successive shortest
+augmenting paths (Dijkstra with node potentials over the candidate
+edges only). Time and memory then follow m * k rather than
+max(m, n)^2, which pays off when there are far fewer proteins than
+drugs (m << n).
+
+The result is optimal on the candidate graph. If that graph has no
+matching covering all the proteins, sparseMaxProfitMatching and
+topKMatching fall back to the dense rectangular solver (see
+maxWBiMatch). evalOptAssignment(W, sparse=k) solves with
+topKMatching.
+
+e.g.
+     Mu, Mv, val = sparseMaxProfitMatching(pfeat, dfeat, k=50)
+     result = evalOptAssignment(W, sparse=50)
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+from maxWBiMatch import maxProfitMatching
+from matching import Matching
+from result import MatchResult
+from weights import weightBlock, BlockSize
+
+# m x n graph, row u has the candidates indices[indptr[u]:indptr[u+1]]
+CandidateGraph = namedtuple('CandidateGraph', ['indptr', 'indices', 'data', 'shape'])
+
+def topKGraph(blocks, k, shape, seed=0):
+    """
+    Build a CandidateGraph from an iterable of row blocks of the
+    weight matrix, keeping the k largest weights of every row.
+
+    [note] 1. ties are broken at random, so that identical rows 
+              (frequent with affinity weights) get different 
+              candidates rather than competing for the same k 
+    """
+    m, n = shape
+    k = min(k, n)
+    rng = np.random.RandomState(seed)
+    indices, data = ([], [])
+    for block in blocks:
+        block = np.asarray(block)
+        if k < n:
+            jitter = 1e-9 * (np.abs(block).max() + 1) * rng.random_sample(block.shape)
+            top = np.argpartition(-(block + jitter), k-1, axis=1)[:, :k]  # [1]
+        else:
+            top = np.tile(np.arange(n), (len(block), 1))
+        indices.append(top)
+        data.append(np.take_along_axis(block, top, axis=1))
+    indices = np.concatenate(indices).reshape(m, k)
+    data = np.concatenate(data).reshape(m, k)
+    indptr = np.arange(0, m*k+1, k, dtype=np.int64)
+    return CandidateGraph(indptr, indices.ravel().astype(np.int64), data.ravel(), (m, n))
+
+def denseTopK(W, k):
+    """
+    Candidate graph of a dense weight matrix.
+    """
+    W = np.asarray(W)
+    return topKGraph([W], k, W.shape)
+
+def featureTopK(pfeat, dfeat, k):
+    """
+    Candidate graph of the proteins and drugs given by their
+    features (see module weights), evaluated in row blocks so that
+    the full weight matrix is never held in memory.
+
+    [note] 1. drugs with the same features have the same weights:
+              blocks are evaluated on one drug of each kind and
+              expanded, instead of finding the kinds again for
+              every block
+    """
+    m, n = (len(pfeat.length), len(dfeat.length))
+    columns = np.column_stack([np.asarray(a) for a in dfeat]).reshape(n, len(dfeat))
+    _, first, kind = np.unique(columns, axis=0, return_index=True, return_inverse=True)
+    kinds = type(dfeat)(*[np.asarray(a)[first] for a in dfeat])   # [1]
+    kind = kind.ravel()
+    step = max(1, BlockSize // max(n, 1))
+    blocks = (weightBlock(pfeat, kinds, slice(r0, min(r0+step, m)))[:, kind]
+              for r0 in range(0, m, step))
+    return topKGraph(blocks, k, (m, n))
+
+def sparseMatching(graph, _flip=False):
+    """
+    Compute the best assignment of maximum profit matching every
+    row of the candidate *graph.
+
+    Returns (Mu, Mv, value), or None if there is no matching
+    covering all the rows.
+
+    *_flip: if True, the weights of *graph represent cost
+
+    [note] 1. only the columns of some candidate edge (at most m * k)
+              take part; they are numbered 0 .. c-1
+           2. Dijkstra as in the dense Hungarian method: a scanned
+              row relaxes all its edges at once, and the next column
+              is the closest one not yet reached, by one argmin over
+              the c columns; each row is scanned at most once per
+              augmenting path
+    """
+    indptr, indices, data, (m, n) = graph
+    cols, local = np.unique(indices, return_inverse=True)   # [1]
+    local = local.ravel()
+    c = len(cols)
+    cost = data if _flip else -data   # solve for minimum cost
+    rowMatch = -np.ones(m, dtype=np.int64)
+    colMatch = -np.ones(c, dtype=np.int64)
+    matchCost = np.zeros(m)
+
+    # potentials s.t. reduced costs cost + pu[u] - pv[v] >= 0
+    pu = np.zeros(m)
+    for u in range(m):
+        if indptr[u] < indptr[u+1]:
+            pu[u] = -cost[indptr[u]:indptr[u+1]].min()
+    pv = np.zeros(c)
+
+    for s in range(m):
+        du = np.full(m, np.inf)
+        dv = np.full(c, np.inf)
+        open_ = np.full(c, np.inf)   # dv of the columns not reached yet
+        reached = np.zeros(c, dtype=bool)
+        predV = -np.ones(c, dtype=np.int64)
+        du[s] = 0
+        u = s
+        while True:   # [2]
+            e0, e1 = (indptr[u], indptr[u+1])
+            vs = local[e0:e1]
+            nd = du[u] + cost[e0:e1] + pu[u] - pv[vs]
+            better = (nd < dv[vs]) & ~reached[vs] & (vs != rowMatch[u])
+            vs = vs[better]
+            open_[vs] = dv[vs] = nd[better]
+            predV[vs] = u
+            v = int(open_.argmin())
+            if open_[v] == np.inf:
+                return None
+            open_[v], reached[v] = (np.inf, True)
+            if colMatch[v] < 0:
+                break
+            u = colMatch[v]
+            du[u] = dv[v] - matchCost[u] + pv[v] - pu[u]
+        target = v
+
+        bound = dv[target]
+        pu += np.minimum(du, bound)
+        pv += np.minimum(dv, bound)
+        v = target
+        while v >= 0:
+            u = predV[v]
+            e = indptr[u] + np.flatnonzero(local[indptr[u]:indptr[u+1]] == v)[0]
+            v1 = rowMatch[u]
+            rowMatch[u], colMatch[v], matchCost[u] = (v, u, cost[e])
+            v = v1
+
+    Mu = Matching(cols[rowMatch], nCols=n)
+    val = -matchCost.sum() if not _flip else matchCost.sum()
+    return (Mu, Mu.inverse(), val)
+
+def sparseMaxProfitMatching(pfeat, dfeat, k=50):
+    """
+    Match every protein with one of its top-k candidate drugs
+    (requires # proteins <= # drugs), falling back to the dense
+    rectangular solver if the candidate graph has no such matching.
+    """
+    result = sparseMatching(featureTopK(pfeat, dfeat, k))
+    if result is None:
+        result = maxProfitMatching(weightBlock(pfeat, dfeat))
+    return result
+
+def topKMatching(weights, _flip=False, k=50):
+    """
+    Compute best assignment of the weight matrix on its top-k
+    candidate graph: the k best columns of every row, or of every
+    column if there are more rows than columns. Optimal on that
+    graph, which is meant for far fewer rows than columns; falls
+    back to the dense rectangular solver if it has no matching
+    covering the smaller side.
+
+    Returns a MatchResult (Mu, Mv, value) whose .meta['backend'] is
+    'sparse', or 'python' after the fallback.
+
+    *_flip: if True, *weights represent cost
+    """
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[topKMatching] Need a 2-D weight matrix: %s" % str(W.shape))
+    transposed = W.shape[0] > W.shape[1]
+    A = W.T if transposed else W
+    P = -A if _flip else A   # profits
+    result, backend = (sparseMatching(denseTopK(P, k)), 'sparse')
+    if result is None:
+        result, backend = (maxProfitMatching(P), 'python')
+    Mu = result[0]
+    Mu, Mv = (Mu.inverse(), Mu) if transposed else (Mu, Mu.inverse())
+    return MatchResult((Mu, Mv, Mu.score(W)), backend=backend)
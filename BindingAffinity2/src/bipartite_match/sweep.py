@@ -0,0 +1,162 @@
+'''
+Parametric sweeps over the coefficients of the binding rules.
+
+The default rules (see rules.DefaultRules) have three coefficients:
+
+     even    BA = even * # of vowels, for proteins of even length
+     odd     BA = odd * # of consonants, for proteins of odd length
+     common  BA is multiplied by common if the lengths share a factor
+
+so that every weight matrix of a sweep is the same affine combination
+(even * E + odd * O) * (1 + (common - 1) * G) of the vowel, consonant
+and common factor terms E, O, G. These are computed once, on the
+equivalence classes of names (see module compress), and each grid
+point rebuilds its matrix from them by a combination over the classes
+and a single gather.
+
+Every solve is warm-started (see HungarianSolver.warmStart) from the
+row labels and the assignment of the nearest grid point solved before
+it: the column labels, then the row labels are lowered to the least
+feasible ones for the new weights, and the edges of the assignment
+that are still tight are kept; with small steps in the coefficients
+that is all but a few percent of them, each of the others costing
+one augmenting path. Grid points are ordered along a nearest neighbor
+path through the grid, which is cut into one contiguous piece per
+worker process (see batch.getPool).
+
+e.g.
+     grid = {'even': [1.5, 2, 2.5], 'odd': [2, 2.5, 3], 'common': [1, 1.25]}
+     for r in sweep(pfeat, dfeat, grid, workers=4):
+         print("%s: %f" % (r.coefficients, r.value))
+'''
+
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+from compress import proteinClasses, drugClasses
+from maxWBiMatch import HungarianSolver
+from matching import Matching
+from timer import Timer
+
+Coefficients = ('even', 'odd', 'common')
+Defaults = {'even': 2.0, 'odd': 2.5, 'common': 1.25}
+
+SweepResult = namedtuple('SweepResult', ['index', 'coefficients', 'Mu', 'value',
+                                         'elapsed', 'warm'])
+
+class SweepTerms(object):
+    """
+    The terms E, O, G of the weight matrices of a sweep, on the
+    classes of names, with the class of each name.
+    """
+    def __init__(self, pfeat, dfeat, N=None):
+        pcls, self.plabels, _ = proteinClasses(pfeat)
+        dcls, self.dlabels, _ = drugClasses(dfeat)
+        self.m, self.n = (len(self.plabels), len(self.dlabels))
+        self.N = N if N is not None else max(self.m, self.n)
+        even = (pcls.length % 2 == 0)[:, None]
+        self.E = np.where(even, dcls.nVowel[None, :], 0).astype(np.float64)
+        self.O = np.where(even, 0, dcls.nConsonant[None, :]).astype(np.float64)
+        self.G = np.gcd.outer(pcls.length, dcls.length) > 1
+
+    def weights(self, even, odd, common):
+        """
+        The padded N x N weight matrix for the given coefficients.
+        """
+        small = (even * self.E + odd * self.O) * np.where(self.G, common, 1.0)
+        W = np.zeros((self.N, self.N))
+        W[:self.m, :self.n] = small.take(self.plabels, axis=0).take(self.dlabels, axis=1)
+        return W
+
+def gridPoints(grid):
+    """
+    The coefficients of every point of *grid, a dictionary of lists
+    of values (a coefficient left out keeps its default) or a list
+    of such dictionaries, one per point.
+    """
+    if hasattr(grid, 'items'):
+        for name in grid:
+            if name not in Coefficients:
+                raise ValueError("[gridPoints] Unknown coefficient: %s" % name)
+        values = [grid.get(name, [Defaults[name]]) for name in Coefficients]
+        return [dict(zip(Coefficients, [float(v) for v in point]))
+                for point in itertools.product(*values)]
+    points = []
+    for point in grid:
+        coeff = dict(Defaults)
+        coeff.update(point)
+        points.append(dict((name, float(coeff[name])) for name in Coefficients))
+    return points
+
+def sweepOrder(X):
+    """
+    Order of the rows of *X (points, one per row) along a greedy
+    nearest neighbor path starting from the first one.
+    """
+    left = list(range(1, len(X)))
+    order = [0] if len(X) else []
+    while left:
+        d = np.abs(X[left] - X[order[-1]]).sum(axis=1)
+        order.append(left.pop(int(np.argmin(d))))
+    return order
+
+def _solveChain(task):
+    """
+    Solve grid points in order, each warm-started from the nearest
+    one solved before it; returns their SweepResults.
+    """
+    terms, chain = task
+    solved, results = ([], [])
+    for index, coeff, x in chain:
+        with Timer() as t:
+            W = terms.weights(coeff['even'], coeff['odd'], coeff['common'])
+            solver = HungarianSolver(W)
+            if solved:
+                near = min(solved, key=lambda s: np.abs(s[0] - x).sum())
+                lv = (W - near[1][:, None]).max(axis=0)
+                lu = (W - lv).max(axis=1)
+                solver.warmStart(lu, lv, near[2])
+                solver.solve(warm=True)
+            else:
+                solver.solve()
+        solved.append((x, solver.lu.copy(), solver.rowMatch.copy()))
+        Mu = Matching(solver.rowMatch.copy(), solver.colMatch.copy())
+        results.append(SweepResult(index, coeff, Mu, solver.value(), t.interval,
+                                   len(solved) > 1))
+    return results
+
+def sweep(pfeat, dfeat, grid, workers=1, N=None):
+    """
+    Solve the assignment for every point of *grid (see gridPoints);
+    yields a SweepResult per point, index being its position in
+    gridPoints(*grid).
+
+    *pfeat, *dfeat: per-name features (see weights.proteinFeatures,
+                    weights.drugFeatures)
+    *workers: # of worker processes (see batch.getPool); with 1,
+              the points are solved in this process, all of them
+              on a single warm-started path
+    *N: size of the padded matrices (default: max(# proteins,
+        # drugs), as affinity.evalWeights)
+    """
+    points = gridPoints(grid)
+    terms = SweepTerms(pfeat, dfeat, N)
+    X = np.array([[p[name] for name in Coefficients] for p in points]).reshape(-1, 3)
+    span = X.max(axis=0) - X.min(axis=0) if len(X) else np.ones(3)
+    X = X / np.where(span > 0, span, 1.0)   # comparable steps
+    order = sweepOrder(X)
+
+    nChains = max(1, min(workers or 1, len(order)))
+    bounds = np.linspace(0, len(order), nChains + 1).astype(int)
+    tasks = [(terms, [(i, points[i], X[i]) for i in order[b0:b1]])
+             for b0, b1 in zip(bounds[:-1], bounds[1:])]
+    if workers == 1:
+        chains = (_solveChain(task) for task in tasks)
+    else:
+        from batch import getPool
+        chains = getPool(workers).imap_unordered(_solveChain, tasks)
+    for results in chains:
+        for result in results:
+            yield result
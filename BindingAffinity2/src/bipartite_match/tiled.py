@@ -0,0 +1,147 @@
+'''
+Out-of-core weight matrix.
+
+TiledWeights stands in for the N x N weight matrix of affinity
+.evalWeights without ever holding it in memory: tiles (blocks of
+rows) are generated on demand from the per-name features (see module
+weights) and at most a configurable budget of bytes worth of tiles is
+kept resident, least recently used tiles being dropped first.
+
+HungarianSolver (see maxWBiMatch) only reads the weights row by row,
+so it accepts a TiledWeights, or a memory-mapped matrix as written by
+TiledWeights.toMemmap(), in place of a dense ndarray; peak memory is
+then set by the tile budget plus O(N) solver state, not by N^2.
+
+e.g.
+     W = TiledWeights(pfeat, dfeat, budget=512 << 20)
+     Mu, Mv, val = maxProfitMatching(W)
+     # or, to pay for generating the weights only once
+     Mu, Mv, val = maxProfitMatching(W.toMemmap('weights.npy'))
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from weights import weightBlock, BlockSize
+
+DefaultBudget = 256 << 20   # bytes
+
+class TiledWeights(object):
+    """
+    Lazily evaluated, padded N x N weight matrix supporting row
+    access (W[u], W[rows], W[rows, cols]) and reductions along an
+    axis (W.max(axis), W.min(axis)).
+
+    *budget: bytes of tiles kept resident
+    *tileRows: rows per tile [1]
+    *rules: a rules.RuleSet (default: rules.DefaultRules)
+
+    [note] 1. the solvers visit rows in no particular order, and
+              every miss evaluates a whole tile, so tiles default
+              to a single row; full passes (reductions, toMemmap)
+              go by blocks of weights.BlockSize entries regardless
+    """
+    lazyRows = True   # solvers must not convert it to an ndarray
+
+    def __init__(self, pfeat, dfeat, N=None, dtype=np.float64,
+                 budget=DefaultBudget, tileRows=None, rules=None):
+        self.pfeat, self.dfeat = (pfeat, dfeat)
+        self.rules = rules
+        self.m, self.n = (len(pfeat.length), len(dfeat.length))
+        if N is None: N = max(self.m, self.n)
+        self.shape = (N, N)
+        self.ndim = 2
+        self.dtype = np.dtype(dtype)
+
+        rowBytes = max(1, N * self.dtype.itemsize)
+        self.tileRows = tileRows or 1   # [1]
+        self.maxTiles = max(1, budget // (self.tileRows * rowBytes))
+        self._tiles = OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def evalRows(self, r0, r1):
+        """
+        Evaluate rows [r0, r1).
+        """
+        N = self.shape[0]
+        r1 = min(r1, N)
+        block = np.zeros((r1-r0, N), dtype=self.dtype)
+        if r0 < self.m:
+            rows = slice(r0, min(r1, self.m))
+            block[:rows.stop-r0, :self.n] = weightBlock(self.pfeat, self.dfeat,
+                                                        rows, dtype=self.dtype,
+                                                        rules=self.rules)
+        return block
+
+    def blocks(self):
+        """
+        Yield (first row, block of rows) covering the matrix.
+        """
+        N = self.shape[0]
+        step = max(1, BlockSize // max(N, 1))
+        for r0 in range(0, N, step):
+            yield (r0, self.evalRows(r0, r0 + step))
+
+    def tile(self, t):
+        """
+        Tile t, from the resident tiles if possible.
+        """
+        block = self._tiles.pop(t, None)
+        if block is None:
+            block = self.evalRows(t * self.tileRows, (t+1) * self.tileRows)
+            while len(self._tiles) >= self.maxTiles:
+                self._tiles.popitem(last=False)
+        self._tiles[t] = block   # (re)insert as most recently used
+        return block
+
+    def row(self, u):
+        return self.tile(u // self.tileRows)[u % self.tileRows]
+
+    def __getitem__(self, key):
+        cols = None
+        if isinstance(key, tuple):
+            key, cols = key
+        if isinstance(key, (int, np.integer)):
+            rows = self.row(int(key))
+        elif isinstance(key, slice):
+            rows = np.array([self.row(u) for u in range(*key.indices(self.shape[0]))])
+        else:
+            index = np.asarray(key)
+            rows = np.array([self.row(u) for u in index.ravel()])
+            rows = rows.reshape(index.shape + (self.shape[1],))
+            if index.ndim == 2 and cols is not None:   # np.ix_ style
+                rows = rows[:, 0, :]
+        if cols is None:
+            return rows
+        cols = np.asarray(cols)
+        return rows[..., cols.ravel()] if cols.ndim == 2 else rows[..., cols]
+
+    def reduce(self, ufunc, axis):
+        """
+        Reduce along *axis (0 or 1), block by block (blocks are not
+        kept, so a full pass does not flush the resident tiles).
+        """
+        parts = [ufunc.reduce(block, axis=axis) for _, block in self.blocks()]
+        return ufunc.reduce(np.array(parts), axis=0) if axis == 0 else np.concatenate(parts)
+
+    def max(self, axis):
+        return self.reduce(np.maximum, axis)
+
+    def min(self, axis):
+        return self.reduce(np.minimum, axis)
+
+    def toMemmap(self, path):
+        """
+        Write the whole matrix, block by block, into a .npy file and
+        return it memory-mapped read-only.
+        """
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype,
+                                        shape=self.shape)
+        for r0, block in self.blocks():
+            out[r0:r0+len(block)] = block
+            out.flush()
+        del out
+        return np.load(path, mmap_mode='r')
@@ -1,11 +1,23 @@
 
+
 import time
 
-class Timer:    
+# wall-clock and CPU time; time.clock (CPU time on Linux, wall time
+# on Windows) is gone since Python 3.8
+_wall = getattr(time, 'perf_counter', time.time)
+_cpu = getattr(time, 'process_time', None) or time.clock
+
+class Timer(object):
+    """
+    Elapsed wall-clock time (interval) and CPU time of this
+    process (cpu) of a with block, in seconds.
+    """
     def __enter__(self):
-        self.start = time.clock()
+        self.start = _wall()
+        self.cpuStart = _cpu()
         return self
 
     def __exit__(self, *args):
-        self.end = time.clock()
+        self.end = _wall()
         self.interval = self.end - self.start
+        self.cpu = _cpu() - self.cpuStart
@@ -0,0 +1,246 @@
+'''
+Transportation problem (min-cost flow on a complete bipartite graph)
+solved via successive shortest paths with node potentials.
+
+Given a P x D profit matrix w, supplies s (one per row) and demands
+d (one per column) with sum(s) == sum(d), find a nonnegative integer
+flow f maximizing
+
+   sum<i,j> ( w<i,j> * f<i,j> )
+   subject to    sum<j> f<i,j> = s<i>
+                 sum<i> f<i,j> = d<j>
+
+The assignment problem is the special case s = d = 1. With
+multiplicities (e.g. equivalence classes of names, see module
+compress) a whole batch of units is shipped along each augmenting
+path, so the number of iterations depends on the number of rows and
+columns rather than on sum(s).
+
+Each iteration runs a dense Dijkstra over the residual graph in
+O((P+D)^2) with the reduced costs c<a,b> + pi<a> - pi<b> >= 0.
+
+Capacitated (b-)matching is the variant with f<i,j> in {0, 1} and
+supplies and demands that are upper bounds, the capacities of rows
+and columns (e.g. a protein screened against up to c<i> drugs, a drug
+assigned to up to d<j> proteins): capacitatedFlow() ships as many
+units as they allow, at maximum profit, without replicating rows or
+columns. Every augmenting path ships a single unit; as a Dijkstra
+costs O((P+D)^2), all the shortest paths of its tree (many, with
+tie-heavy weights) are shipped along at once, and the work grows at
+most linearly with the total capacity.
+
+e.g.
+     flow, val = transportFlow(W, supply, demand)
+     Mu, Mv, val = capacitatedMatching(W, rowCap=3, colCap=2)
+     Mu[0]   # the columns of row 0
+'''
+
+import numpy as np
+
+from matching import MultiMatching
+from result import MatchResult
+
+def transportFlow(weights, supply, demand, _flip=False):
+    """
+    Compute an optimal flow of maximum profit.
+
+    Returns (flow, value) where flow is a P x D integer matrix.
+
+    *_flip: if True, treat *weights as a cost matrix
+    """
+    w = np.asarray(weights, dtype=np.float64)
+    c = w if _flip else -w   # solve for minimum cost
+    P, D = c.shape
+    sup = np.array(supply, dtype=np.int64)
+    dem = np.array(demand, dtype=np.int64)
+    if sup.shape != (P,) or dem.shape != (D,):
+        raise ValueError("[transportFlow] Expect %d supplies and %d demands" % (P, D))
+    if sup.sum() != dem.sum() or (sup < 0).any() or (dem < 0).any():
+        raise ValueError("[transportFlow] Unbalanced problem: supply %d, demand %d" % \
+                           (sup.sum(), dem.sum()))
+
+    flow = np.zeros((P, D), dtype=np.int64)
+    pr = np.zeros(P)          # potentials of rows
+    pc = c.min(axis=0)        # ... and columns, s.t. c + pr - pc >= 0
+
+    while sup.any():
+        dr, dc, predR, predC, t, bound = _shortestPaths(c, flow, pr, pc, 
+                                                        sup > 0, dem > 0)
+        if t < 0:
+            raise ValueError("[transportFlow] No augmenting path found.")
+        pr += np.minimum(dr, bound)
+        pc += np.minimum(dc, bound)
+        _augment(flow, sup, dem, predR, predC, t)
+
+    return (flow, (flow * w).sum())
+
+def _augment(flow, sup, dem, predR, predC, t, capacity=None):
+    """
+    Ship the bottleneck amount along the path to column *t traced
+    back by the predecessors, in place; returns the amount.
+    """
+    # trace the path back to its source row and find the bottleneck
+    forward, backward = ([], [])
+    amount, j = (dem[t], t)
+    while True:
+        i = predC[j]
+        forward.append((i, j))
+        if capacity is not None:
+            amount = min(amount, capacity - flow[i, j])
+        if predR[i] < 0:
+            source = i
+            amount = min(amount, sup[i])
+            break
+        j = predR[i]
+        backward.append((i, j))
+        amount = min(amount, flow[i, j])
+    if amount <= 0:
+        return 0
+
+    for i, j in forward:
+        flow[i, j] += amount
+    for i, j in backward:
+        flow[i, j] -= amount
+    sup[source] -= amount
+    dem[t] -= amount
+    return amount
+
+def _capacities(cap, size, name):
+    cap = np.array(np.broadcast_to(cap, (size,)), dtype=np.int64) \
+            if np.ndim(cap) == 0 else np.array(cap, dtype=np.int64)
+    if cap.shape != (size,) or (cap < 0).any():
+        raise ValueError("[capacitatedFlow] Expect %d non-negative %s capacities" % (size, name))
+    return cap
+
+def capacitatedFlow(weights, rowCap, colCap, _flip=False):
+    """
+    Compute a 0/1 flow of maximum profit that ships as many units
+    as the capacities allow, i.e. a maximum b-matching of maximum
+    profit: row i is matched to at most *rowCap[i] columns, column
+    j to at most *colCap[j] rows, each pair at most once.
+
+    Returns (flow, value) where flow is a P x D integer matrix.
+
+    *rowCap, *colCap: capacities (an integer applies to all)
+    *_flip: if True, treat *weights as a cost matrix
+
+    [note] 1. the number of units is min(sum(rowCap), sum(colCap))
+              if every row and column may be matched to enough
+              others, less otherwise; with rowCap = colCap = 1 it
+              is the assignment problem
+           2. every column with residual demand at the distance of
+              the nearest one ends a shortest path of the tree; its
+              arcs have zero reduced cost, and so do their reverse
+              arcs once shipped along, so that the next one is still
+              shortest if it still has residual capacity
+    """
+    w = np.asarray(weights, dtype=np.float64)
+    c = w if _flip else -w   # solve for minimum cost
+    P, D = c.shape
+    sup = _capacities(rowCap, P, 'row')
+    dem = _capacities(colCap, D, 'column')
+
+    flow = np.zeros((P, D), dtype=np.int64)
+    pr = np.zeros(P)
+    pc = c.min(axis=0) if P else np.zeros(D)
+
+    while sup.any() and dem.any():   # [1]
+        dr, dc, predR, predC, t, bound = _shortestPaths(c, flow, pr, pc, 
+                                                        sup > 0, dem > 0, capacity=1)
+        if t < 0:
+            break
+        sinks = np.flatnonzero(dem > 0)
+        dt = dc[sinks] + pc[sinks] - pc[sinks].min()
+        targets = sinks[dt <= bound]   # [2]
+        pr += np.minimum(dr, bound)
+        pc += np.minimum(dc, bound)
+        for j in [t] + targets[targets != t].tolist():
+            _augment(flow, sup, dem, predR, predC, j, capacity=1)
+
+    return (flow, (flow * w).sum())
+
+def capacitatedMatching(weights, rowCap, colCap, _flip=False):
+    """
+    Compute a maximum b-matching of maximum profit (see
+    capacitatedFlow); returns a MatchResult (Mu, Mv, value) like
+    the assignment solvers, Mu and Mv being MultiMatchings (row ->
+    columns, column -> rows).
+    """
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[capacitatedMatching] Need a 2-D weight matrix: %s" % str(W.shape))
+    flow, _ = capacitatedFlow(W, rowCap, colCap, _flip=_flip)
+    rows, cols = np.nonzero(flow)
+    Mu = MultiMatching.fromPairs(rows, cols, W.shape)
+    return MatchResult((Mu, Mu.inverse(), Mu.score(W)), pairs=len(Mu))
+
+def _shortestPaths(c, flow, pr, pc, active, sinks, capacity=None):
+    """
+    Dense Dijkstra over the residual graph, using reduced costs, from 
+    all rows with residual supply (the *active rows) to the nearest 
+    column with residual demand (one of the *sinks). 
+
+    Residual arcs are row i -> column j (always, or whenever 
+    flow<i,j> < *capacity if given) and column j -> row i whenever 
+    flow<i,j> > 0. Nodes at the same distance (frequent with 
+    tie-heavy weights) are settled together. 
+    
+    Returns the distance labels, predecessors, the sink column t 
+    (-1 if unreachable) and the distance to the (virtual) sink. 
+
+    [note] 1. with *capacity, a column reached from several rows 
+              settled together takes the (column mod # of them)-th 
+              as predecessor, which spreads the paths of the tree 
+              over more rows (see capacitatedFlow) 
+    """
+    P, D = c.shape
+    dr = np.full(P, np.inf)
+    dc = np.full(D, np.inf)
+    # virtual source and sink, with potentials s.t. the arcs 
+    # source -> row and column -> sink have nonnegative reduced costs
+    dr[active] = pr[active].max() - pr[active]
+    pt = pc[sinks].min() if sinks.any() else 0.0
+    predR = -np.ones(P, dtype=np.int64)
+    predC = -np.ones(D, dtype=np.int64)
+    openR = np.ones(P, dtype=bool)
+    openC = np.ones(D, dtype=bool)
+    t, bound = (-1, np.inf)
+
+    while True:
+        d = min(dr[openR].min() if openR.any() else np.inf, 
+                dc[openC].min() if openC.any() else np.inf)
+        if d >= bound:
+            break
+        rows = np.flatnonzero(openR & (dr == d))
+        if len(rows):
+            openR[rows] = False
+            cand = (dr[rows] + pr[rows])[:, None] + c[rows] - pc
+            if capacity is not None:
+                cand[flow[rows] >= capacity] = np.inf
+                tied = cand == cand.min(axis=0)
+                nTied = np.maximum(tied.sum(axis=0), 1)
+                k = np.argmax(np.cumsum(tied, axis=0) > np.arange(D) % nTied, axis=0)   # [1]
+            else:
+                k = np.argmin(cand, axis=0)
+            cand = cand[k, np.arange(D)]
+            better = openC & (cand < dc)
+            dc[better] = cand[better]
+            predC[better] = rows[k[better]]
+        cols = np.flatnonzero(openC & (dc == d))
+        if len(cols):
+            openC[cols] = False
+            toSink = cols[sinks[cols]]
+            if len(toSink):
+                dt = dc[toSink] + pc[toSink] - pt
+                k = np.argmin(dt)
+                if dt[k] < bound:
+                    t, bound = (toSink[k], dt[k])
+            cand = np.where(flow[:, cols] > 0, 
+                            (dc[cols] + pc[cols])[None, :] - c[:, cols], 
+                            np.inf) - pr[:, None]
+            k = np.argmin(cand, axis=1)
+            cand = cand[np.arange(P), k]
+            better = openR & (cand < dr)
+            dr[better] = cand[better]
+            predR[better] = cols[k[better]]
+    return (dr, dc, predR, predC, t, bound)
@@ -0,0 +1,168 @@
+'''
+Certificates of optimality for assignments, in O(mn).
+
+An assignment of the rows of an m x n profit matrix w (m <= n) is
+optimal iff there are dual labels lu, lv with
+
+     primal feasibility  every row matched, no column twice
+     dual feasibility    lu[u] + lv[v] >= w[u][v] for all u, v,
+                         and lv >= 0 if m < n
+     slackness           lu[u] + lv[v] == w[u][v] on matched edges,
+                         and lv[v] == 0 on free columns
+
+in which case the value of the assignment equals sum(lu) + sum(lv).
+Checking this is one pass over the weights, by blocks of rows, in
+place of a second O(n^3) solve; and unlike comparing assignments,
+it does not mistake another optimum for an error.
+
+HungarianSolver (see maxWBiMatch) returns its labels on request;
+for the other solvers they are recovered from the assignment by
+recoverDuals(), i.e. by longest paths over alternating paths.
+
+e.g.
+     result = maxProfitMatching(W, duals=True)
+     cert = certify(W, result)
+     assert cert.ok, cert
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+from weights import BlockSize
+from matching import asMatching
+
+Certificate = namedtuple('Certificate', ['ok', 'primal', 'dual', 'slackness',
+                                         'value', 'bound', 'violation'])
+
+def _oriented(weights, Mu, duals, _flip):
+    """
+    The problem with m <= n as (weights, sign, rowMatch, duals,
+    transposed).
+    """
+    W = np.asarray(weights)
+    if W.ndim != 2:
+        raise ValueError("[verify] Need a 2-D weight matrix: %s" % str(W.shape))
+    M = asMatching(Mu, W.shape)
+    sign = -1 if _flip else 1
+    transposed = W.shape[0] > W.shape[1]
+    if transposed:
+        W, M = (W.T, M.inverse())
+        if duals is not None: duals = (duals[1], duals[0])
+    return (W, sign, np.asarray(M.rowMatch, dtype=np.int64), duals, transposed)
+
+def _tolerance(W, tol):
+    if tol is not None:
+        return tol
+    if W.dtype.kind in 'biu' or not W.size:
+        return 0
+    return 1e-9 * max(1.0, float(np.abs(W).max())) * max(W.shape)
+
+def _rowBlocks(W):
+    step = max(1, BlockSize // max(W.shape[1], 1))
+    for r0 in range(0, W.shape[0], step):
+        yield (r0, min(r0+step, W.shape[0]))
+
+def verifyDuals(weights, Mu, lu, lv, _flip=False, tol=None):
+    """
+    Check the assignment Mu (a Matching or dictionary) against the
+    dual labels lu (rows), lv (columns) of the maximization of
+    *weights (of -weights if _flip).
+
+    Returns a Certificate; .ok iff all the conditions hold within
+    *tol (default: 0 for integer weights, a few ulps of the sums
+    otherwise), .value is the value of Mu, .bound the sum of the
+    labels (a bound on the optimum if .dual holds, with the sign
+    of the weights) and .violation the largest violation of dual
+    feasibility.
+    """
+    W, sign, rowMatch, (lu, lv), _ = _oriented(weights, Mu, (lu, lv), _flip)
+    lu, lv = (np.asarray(lu, dtype=np.float64), np.asarray(lv, dtype=np.float64))
+    m, n = W.shape
+    tol = _tolerance(W, tol)
+    if lu.shape != (m,) or lv.shape != (n,):
+        raise ValueError("[verifyDuals] Expect %d row and %d column labels" % (m, n))
+
+    rows = np.arange(m)
+    matched = rowMatch >= 0
+    primal = bool(matched.all()) and \
+            len(np.unique(rowMatch[matched])) == int(matched.sum())
+    value = W[rows[matched], rowMatch[matched]].sum()
+
+    violation = 0.0
+    for r0, r1 in _rowBlocks(W):
+        slack = lu[r0:r1, None] + lv - sign * np.asarray(W[r0:r1], dtype=np.float64)
+        if slack.size:
+            violation = max(violation, float(-slack.min()))
+    if m < n:
+        violation = max(violation, float(-lv.min()))
+    dual = violation <= tol
+
+    free = np.ones(n, dtype=bool)
+    free[rowMatch[matched]] = False
+    gap = lu[matched] + lv[rowMatch[matched]] - sign * W[rows[matched], rowMatch[matched]]
+    slackness = bool((np.abs(gap) <= tol).all() and (np.abs(lv[free]) <= tol).all())
+    return Certificate(primal and dual and slackness, primal, dual, slackness,
+                       value, sign * (lu.sum() + lv.sum()), violation)
+
+def recoverDuals(weights, Mu, _flip=False, tol=None):
+    """
+    Dual labels (lu, lv) certifying the assignment Mu, of the
+    maximization of *weights (of -weights if _flip), or None if
+    Mu is not optimal (or does not match every row, resp. column
+    if there are fewer of them).
+
+    [note] 1. with v' the column of row u, feasibility and
+              slackness read lv[v] >= lv[v'] + w[u][v] - w[u][v'];
+              the least solution with lv >= 0 is found by
+              Bellman-Ford style passes over the weights, as many
+              as the longest alternating path, which is short on
+              affinity weights. A path of positive gain, i.e. an
+              assignment that is not optimal, keeps raising the
+              labels and is caught after n passes
+    """
+    W, sign, rowMatch, _, transposed = _oriented(weights, Mu, None, _flip)
+    m, n = W.shape
+    if (rowMatch < 0).any():
+        return None
+    tol = _tolerance(W, tol)
+    rows = np.arange(m)
+    base = sign * np.asarray(W[rows, rowMatch], dtype=np.float64)
+    lv = np.zeros(n)
+    for _ in range(n + 1):   # [1]
+        changed = False
+        for r0, r1 in _rowBlocks(W):
+            reach = sign * np.asarray(W[r0:r1], dtype=np.float64) + \
+                    (lv[rowMatch[r0:r1]] - base[r0:r1])[:, None]
+            best = reach.max(axis=0) if r1 > r0 else lv
+            raised = best > lv + tol
+            if raised.any():
+                lv[raised] = best[raised]   # used by the next blocks at once
+                changed = True
+        if not changed:
+            break
+    else:
+        return None
+    lu = base - lv[rowMatch]
+    return (lv, lu) if transposed else (lu, lv)
+
+def certify(weights, result, _flip=False, tol=None):
+    """
+    Certificate (see verifyDuals) of a solver result (Mu, Mv, value),
+    with the labels in result.meta['duals'] if there, recovered by
+    recoverDuals() otherwise; .ok also requires the value reported
+    to be that of Mu.
+    """
+    Mu, value = (result[0], result[-1])
+    duals = getattr(result, 'meta', {}).get('duals')
+    if duals is None:
+        duals = recoverDuals(weights, Mu, _flip, tol)
+    W = np.asarray(weights)
+    if duals is None:
+        M = asMatching(Mu, W.shape)
+        return Certificate(False, len(M) == min(W.shape), False, False,
+                           M.score(W), None, None)
+    cert = verifyDuals(weights, Mu, duals[0], duals[1], _flip, tol)
+    if abs(cert.value - value) > _tolerance(W, tol):
+        cert = cert._replace(ok=False)
+    return cert
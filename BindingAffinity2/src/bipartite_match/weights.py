@@ -0,0 +1,139 @@
+'''
+Vectorized evaluation of the weight (binding affinity) matrix.
+
+The default binding rules (see rules.DefaultRules) only look at a
+few per-name quantities: the length (hence the parity) of the protein
+name and the length, the number of vowels and the number of
+consonants of the drug name. These features are extracted once per
+name and the weight matrix is then assembled by broadcasting, one
+block of rows at a time so that temporaries stay small. Other rule
+sets (see module rules) may use other features.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+from rules import Vowels, countChar, DefaultRules
+
+# number of matrix entries evaluated per block of rows in weightMatrix()
+BlockSize = 1 << 20
+
+# all weights are multiples of 1 / WeightScale; integer weight matrices 
+# (exact mode, see weightMatrix) hold the weights times WeightScale
+WeightScale = DefaultRules.scale
+
+ProteinFeatures = namedtuple('ProteinFeatures', ['length'])
+DrugFeatures = namedtuple('DrugFeatures', ['length', 'nVowel', 'nConsonant'])
+
+def proteinFeatures(ProteinSet):
+    """
+    Extract per-protein features used by the binding rules.
+    """
+    length = np.fromiter((len(p) for p in ProteinSet), dtype=np.int64,
+                         count=len(ProteinSet))
+    return ProteinFeatures(length)
+
+def drugFeatures(DrugSet):
+    """
+    Extract per-drug features used by the binding rules.
+    """
+    counts = np.array([countChar(d) for d in DrugSet], dtype=np.int64)
+    counts = counts.reshape(len(DrugSet), 3)
+    length = counts.sum(axis=1)
+    return DrugFeatures(length, counts[:, 0].copy(), counts[:, 1].copy())
+
+def weightBlock(pfeat, dfeat, rows=slice(None), cols=slice(None),
+                dtype=np.float64, rules=None):
+    """
+    Evaluate the binding affinities between the proteins selected by
+    *rows and the drugs selected by *cols (slices or index arrays).
+
+    *rules: a rules.RuleSet, by default rules.DefaultRules:
+           1. even length rule:
+                BA = # of vowels * 2
+           2. odd length rule:
+                BA = # of consonants * 2.5
+           3. increase BA by 25% if any common
+              factors found
+
+    [note] 1. integer *dtype: BA * rules.scale, which must be exact
+    """
+    if rules is None: rules = DefaultRules
+    w = rules.evaluate(pfeat, dfeat, rows, cols)
+    if np.dtype(dtype).kind in 'iu':   # [1]
+        w *= rules.scale
+        wi = np.rint(w)
+        if not np.array_equal(wi, w):
+            raise ValueError("[weightBlock] Weights times %d are not integers" % rules.scale)
+        return wi.astype(dtype)
+    return w.astype(dtype, copy=False)
+
+def weightMatrix(pfeat, dfeat, N=None, dtype=np.float64, pad=True, rules=None):
+    """
+    Assemble the N x N weight matrix as a C-contiguous ndarray,
+    padding with zero rows/columns up to N = max(# proteins, # drugs)
+    by default.
+
+    *dtype: a floating point type; all weights are multiples of
+            0.125 and hence exact in both float32 and float64.
+            An integer type (e.g. int32, int64) gives the exact 
+            mode: the weights times WeightScale, i.e. integers, 
+            for which every solver runs in exact arithmetic 
+    *pad: if False, return the (# proteins) x (# drugs) matrix
+    *rules: a rules.RuleSet (default: rules.DefaultRules), see 
+            weightBlock
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'fiu':
+        raise ValueError("[weightMatrix] Need a floating point or "
+                         "integer dtype: %s" % dtype)
+    m, n = (len(pfeat.length), len(dfeat.length))
+    if N is None: N = max(m, n)
+
+    W = np.zeros((N, N) if pad else (m, n), dtype=dtype)
+    step = max(1, BlockSize // max(n, 1))
+    for r0 in range(0, m, step):
+        r1 = min(r0+step, m)
+        W[r0:r1, :n] = weightBlock(pfeat, dfeat, slice(r0, r1), dtype=dtype, rules=rules)
+    return W
+
+def resolution(weights, maxExponent=20):
+    """
+    Largest 2^-k (k <= *maxExponent) that divides every weight,
+    i.e. the smallest possible difference between two assignment
+    values; None if there is no such k (or *weights is not an
+    ndarray).
+    """
+    if not isinstance(weights, np.ndarray):
+        return None
+    if weights.dtype.kind in 'biu':
+        return 1.0
+    step = max(1, BlockSize // max(weights.shape[1], 1))
+    for k in range(maxExponent + 1):
+        scale = 2.0 ** k
+        if all(np.array_equal(np.rint(block * scale), block * scale)
+               for block in (weights[r0:r0+step] for r0 in range(0, len(weights), step))):
+            return 1.0 / scale
+    return None
+
+def integerWeights(weights, dtype=np.int64):
+    """
+    Exact integer version of a weight matrix: returns (Wi, scale)
+    with Wi = weights * scale, scale a power of two (1 for integer
+    weights), so that assignment values are exact integers.
+
+    Raises ValueError if the weights are not all multiples of
+    some 2^-k (see resolution) or do not fit in *dtype.
+    """
+    W = np.asarray(weights)
+    res = resolution(W)
+    if res is None:
+        raise ValueError("[integerWeights] Weights are not multiples of a power of two")
+    scale = int(round(1.0 / res))
+    limit = np.iinfo(dtype).max
+    if W.size and max(abs(float(W.max())), abs(float(W.min()))) * scale > limit:
+        raise ValueError("[integerWeights] Scaled weights overflow %s" % np.dtype(dtype))
+    if W.dtype.kind in 'biu':
+        return (W.astype(dtype), scale)
+    return (np.rint(W * scale).astype(dtype), scale)